@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+
+import argparse
+import gzip
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# -------------------------
+# global variables
+# -------------------------
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+INPUT_FILES = os.path.join(HERE, "InputFiles")
+FASTQ_MODES = {
+    "seqio": [],
+    "stream": ["--stream"],
+    "fast": ["--fast"],
+}
+
+# The list-and-sort summary fasta_stats.py used before it streamed, as a baseline
+SEQIO_FASTA_STATS = """
+import sys
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+with open(sys.argv[1]) as f:
+    sequences = [{"id": h.split()[0], "length": len(s)} for h, s in SimpleFastaParser(f)]
+ranked = sorted(sequences, key=lambda x: x["length"], reverse=True)
+print(len(sequences), sum(s["length"] for s in sequences), ranked[0]["id"], ranked[-1]["id"])
+"""
+
+# The load-everything filter fasta_filter.py used before it streamed, as a baseline
+SEQIO_FASTA_FILTER = """
+import sys
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+with open(sys.argv[1]) as f:
+    sequences = [{"header": h, "sequence": s, "length": len(s)} for h, s in SimpleFastaParser(f)]
+with open(sys.argv[2], "w") as out:
+    for entry in sequences:
+        if entry["length"] > 1000:
+            out.write(">" + entry["header"] + "\\n")
+            out.write(entry["sequence"] + "\\n")
+"""
+
+# -------------------------
+# Arg Parser
+# -------------------------
+parser = argparse.ArgumentParser(description='Benchmarks for the homework06 command line tools')
+subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+fastq_parser = subparsers.add_parser('fastq', help='Throughput and peak RSS of fastq_filter.py modes')
+fastq_parser.add_argument(
+    '-f', '--fastqfile',
+    type=str,
+    help='An input FASTQ file (default: a synthetic file of --reads reads)'
+)
+fastq_parser.add_argument(
+    '-n', '--reads',
+    type=int,
+    default=200000,
+    help='Number of reads in the synthetic FASTQ file (default: 200000)'
+)
+fastq_parser.add_argument(
+    '-m', '--modes',
+    nargs='+',
+    choices=list(FASTQ_MODES),
+    default=list(FASTQ_MODES),
+    help='fastq_filter.py modes to run (default: all)'
+)
+fastq_parser.add_argument(
+    '-w', '--workers',
+    nargs='+',
+    type=int,
+    default=[],
+    help='Also run the parallel mode with each of these worker counts, e.g. -w 1 2 4 8'
+)
+
+fasta_parser = subparsers.add_parser('fasta', help='Throughput and peak RSS of fasta_stats.py')
+fasta_parser.add_argument(
+    '-f', '--fastafile',
+    type=str,
+    help='An input FASTA file (default: a synthetic file of --size MB)'
+)
+fasta_parser.add_argument(
+    '-s', '--size',
+    type=int,
+    default=2048,
+    help='Size in MB of the synthetic FASTA file (default: 2048)'
+)
+fasta_parser.add_argument(
+    '--baseline',
+    action='store_true',
+    help='Also time the previous SeqIO list-and-sort summary'
+)
+
+filter_parser = subparsers.add_parser('filter', help='Throughput and peak RSS of fasta_filter.py modes')
+filter_parser.add_argument(
+    '-f', '--fastafile',
+    type=str,
+    help='An input FASTA file (default: a synthetic file of --size MB)'
+)
+filter_parser.add_argument(
+    '-s', '--size',
+    type=int,
+    default=2048,
+    help='Size in MB of the synthetic FASTA file (default: 2048)'
+)
+filter_parser.add_argument(
+    '--baseline',
+    action='store_true',
+    help='Also time the previous load-everything SeqIO filter'
+)
+
+mmap_parser = subparsers.add_parser(
+    'mmap', help='CPU time and peak RSS of each tool with and without --mmap on scaled up InputFiles samples'
+)
+mmap_parser.add_argument(
+    '-x', '--scale',
+    type=int,
+    default=1000,
+    help='How many copies of each InputFiles sample make up the benchmark inputs (default: 1000)'
+)
+mmap_parser.add_argument(
+    '-z', '--bgzip',
+    action='store_true',
+    help='Also run the --mmap mode on bgzip compressed copies of the inputs (needs Biopython)'
+)
+
+mmcif_parser = subparsers.add_parser(
+    'mmcif', help='Structures/sec of mmcif_summary.py batch mode by worker count'
+)
+mmcif_parser.add_argument(
+    '-n', '--files',
+    type=int,
+    default=100,
+    help='Number of copies of InputFiles/4HHB.cif in the batch, every other one gzipped (default: 100)'
+)
+mmcif_parser.add_argument(
+    '-w', '--workers',
+    nargs='+',
+    type=int,
+    default=[1, 2, 4, 8],
+    help='Worker counts to run the batch with (default: 1 2 4 8)'
+)
+mmcif_parser.add_argument(
+    '--baseline',
+    action='store_true',
+    help='Also time one mmcif_summary.py invocation per file on the first 20 files'
+)
+
+atom_site_parser = subparsers.add_parser(
+    'atom-site', help='Seconds and atoms/sec of the mmCIF readers on a large multi-model entry'
+)
+atom_site_parser.add_argument(
+    '-m', '--models',
+    type=int,
+    default=50,
+    help='Number of copies of the 4HHB atoms, one model each, in the synthetic entry (default: 50)'
+)
+
+
+# -------------------------
+# Functions
+# -------------------------
+def make_fastq(path: str, n_reads: int, read_length: int = 150, seed: int = 0):
+    """
+    Writes a synthetic Sanger FASTQ file with random bases and qualities around Q30
+
+    Args:
+        path: The output path
+        n_reads: The number of reads
+        read_length: The length of every read
+        seed: The random seed
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "wb") as out:
+        for start in range(0, n_reads, 10000):
+            n = min(10000, n_reads - start)
+            bases = np.frombuffer(b"ACGT", dtype=np.uint8)[rng.integers(0, 4, (n, read_length))]
+            quals = np.clip(rng.normal(32, 6, (n, read_length)), 2, 41).astype(np.uint8) + 33
+            for i in range(n):
+                out.write(
+                    b"@read%d\n" % (start + i) + bases[i].tobytes() + b"\n+\n"
+                    + quals[i].tobytes() + b"\n"
+                )
+
+
+def make_fasta(path: str, size_mb: int, seed: int = 0):
+    """
+    Writes a synthetic nucleotide FASTA file of contigs between 1 kb and 1 Mb with 60 base lines
+
+    Args:
+        path: The output path
+        size_mb: The approximate file size in MB
+        seed: The random seed
+    """
+    rng = np.random.default_rng(seed)
+    bases = np.frombuffer(b"ACGT", dtype=np.uint8)
+    written, contig = 0, 0
+    with open(path, "wb") as out:
+        while written < size_mb * 1e6:
+            length = int(rng.integers(1000, 1_000_000))
+            seq = bases[rng.integers(0, 4, length)].tobytes()
+            lines = b"\n".join(seq[i:i + 60] for i in range(0, length, 60))
+            record = b">contig%d\n" % contig + lines + b"\n"
+            out.write(record)
+            written += len(record)
+            contig += 1
+
+
+def scale_file(source: str, path: str, copies: int):
+    """Writes copies of a file back to back, adding a final line ending if it lacks one"""
+    with open(source, "rb") as f:
+        data = f.read()
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    with open(path, "wb") as out:
+        for _ in range(copies):
+            out.write(data)
+
+
+def bgzip_file(source: str, path: str):
+    """Writes a BGZF (bgzip) compressed copy of a file"""
+    from Bio import bgzf
+    with open(source, "rb") as f, bgzf.BgzfWriter(path, "wb") as out:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            out.write(chunk)
+
+
+def make_mmcif(path: str, n_models: int):
+    """
+    Writes InputFiles/4HHB.cif with its _atom_site rows repeated as n_models models
+
+    Args:
+        path: The output path
+        n_models: The number of models
+    """
+    with open(os.path.join(INPUT_FILES, "4HHB.cif"), "r") as f:
+        lines = f.read().splitlines(keepends=True)
+    first_tag = next(i for i, line in enumerate(lines) if line.startswith("_atom_site."))
+    first_row = next(i for i in range(first_tag, len(lines)) if not lines[i].startswith("_atom_site."))
+    last_row = next(i for i in range(first_row, len(lines)) if lines[i].startswith("#"))
+    tags = [line.strip() for line in lines[first_tag:first_row]]
+    model_column = tags.index("_atom_site.pdbx_PDB_model_num")
+    rows = [line.split() for line in lines[first_row:last_row]]
+    with open(path, "w") as out:
+        out.writelines(lines[:first_row])
+        for model in range(1, n_models + 1):
+            for row in rows:
+                row[model_column] = str(model)
+                out.write(" ".join(row) + "\n")
+        out.writelines(lines[last_row:])
+
+
+def run_tool(command: list[str]) -> tuple[float, float, float]:
+    """
+    Runs a command and measures it
+
+    Args:
+        command: The command line to run
+
+    Returns:
+        result: (wall seconds, peak RSS of the child in MB, user + system CPU seconds)
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"{' '.join(command)} failed")
+    return seconds, usage.ru_maxrss / 1024, usage.ru_utime + usage.ru_stime
+
+
+def file_digest(path: str) -> str:
+    """Returns a short SHA-256 digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def count_lines(path: str) -> int:
+    """Counts the lines of a file"""
+    with open(path, "rb") as f:
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+
+
+def run_fastq_benchmark(fastq_file: str, modes: dict[str, list[str]], workdir: str):
+    """Prints wall time, reads/sec, peak RSS and output digest per fastq_filter.py mode (name -> extra args)"""
+    n_reads = count_lines(fastq_file) // 4
+    print(f"{n_reads} reads, {os.path.getsize(fastq_file) / 1e6:.1f} MB")
+    print(f"{'mode':<20} {'seconds':>8} {'reads/sec':>12} {'peak RSS MB':>12} {'output':>14}")
+    for mode, mode_args in modes.items():
+        output = os.path.join(workdir, f"{mode}.fastq")
+        command = [
+            sys.executable, os.path.join(HERE, "fastq_filter.py"),
+            "-f", fastq_file, "-o", output, "--no-cache", *mode_args
+        ]
+        seconds, peak_rss, _ = run_tool(command)
+        print(
+            f"{mode:<20} {seconds:>8.2f} {n_reads / seconds:>12,.0f} {peak_rss:>12.1f} "
+            f"{file_digest(output):>14}"
+        )
+
+
+def run_fasta_benchmark(fasta_file: str, baseline: bool, workdir: str):
+    """Prints wall time, MB/sec and peak RSS of fasta_stats.py (and optionally the old SeqIO summary)"""
+    size_mb = os.path.getsize(fasta_file) / 1e6
+    print(f"{size_mb:.1f} MB")
+    print(f"{'tool':<20} {'seconds':>8} {'MB/sec':>10} {'peak RSS MB':>12}")
+    tools = {
+        "fasta_stats": [
+            sys.executable, os.path.join(HERE, "fasta_stats.py"),
+            "-f", fasta_file, "-o", os.path.join(workdir, "stats.json"), "--json", "--no-cache"
+        ],
+    }
+    if baseline:
+        tools["seqio list+sort"] = [sys.executable, "-c", SEQIO_FASTA_STATS, fasta_file]
+    for tool, command in tools.items():
+        seconds, peak_rss, _ = run_tool(command)
+        print(f"{tool:<20} {seconds:>8.2f} {size_mb / seconds:>10.1f} {peak_rss:>12.1f}")
+
+
+def run_filter_benchmark(fasta_file: str, baseline: bool, workdir: str):
+    """Prints wall time, MB/sec, peak RSS and output size of the fasta_filter.py modes"""
+    size_mb = os.path.getsize(fasta_file) / 1e6
+    print(f"{size_mb:.1f} MB")
+    print(f"{'mode':<20} {'seconds':>8} {'MB/sec':>10} {'peak RSS MB':>12} {'output MB':>10}")
+    output = os.path.join(workdir, "filtered.fasta")
+    filter_tool = [
+        sys.executable, os.path.join(HERE, "fasta_filter.py"), "-f", fasta_file, "-o", output, "--no-cache"
+    ]
+    modes = {
+        "copy": filter_tool,
+        "unwrap": filter_tool + ["--unwrap"],
+        "index (first run)": filter_tool + ["--index"],
+        "index": filter_tool + ["--index"],
+    }
+    if baseline:
+        modes["seqio list"] = [sys.executable, "-c", SEQIO_FASTA_FILTER, fasta_file, output]
+    if os.path.exists(fasta_file + ".fai"):
+        os.remove(fasta_file + ".fai")
+    for mode, command in modes.items():
+        seconds, peak_rss, _ = run_tool(command)
+        print(
+            f"{mode:<20} {seconds:>8.2f} {size_mb / seconds:>10.1f} {peak_rss:>12.1f} "
+            f"{os.path.getsize(output) / 1e6:>10.1f}"
+        )
+
+
+def run_mmap_benchmark(scale: int, bgzip: bool, workdir: str):
+    """
+    Prints wall time, CPU time, peak RSS and output digest of every homework06 tool
+    with and without --mmap on the InputFiles samples repeated `scale` times
+    """
+    fasta_file = os.path.join(workdir, "proteins.fasta")
+    fastq_file = os.path.join(workdir, "reads.fastq")
+    scale_file(os.path.join(INPUT_FILES, "immune_proteins.fasta"), fasta_file, scale)
+    scale_file(os.path.join(INPUT_FILES, "sample1_rawReads.fastq"), fastq_file, scale)
+    inputs = {"fasta": fasta_file, "fastq": fastq_file}
+    if bgzip:
+        for kind, path in list(inputs.items()):
+            inputs[f"{kind}.gz"] = path + ".gz"
+            bgzip_file(path, path + ".gz")
+    print(
+        f"{os.path.getsize(fasta_file) / 1e6:.1f} MB FASTA, "
+        f"{os.path.getsize(fastq_file) / 1e6:.1f} MB FASTQ ({scale} copies of each sample)"
+    )
+    print(f"{'tool':<14} {'input':<9} {'mode':<7} {'seconds':>8} {'CPU s':>7} {'peak RSS MB':>12} {'output':>14}")
+    tools = {
+        "fasta_stats": ("fasta", ["-j"]),
+        "fasta_filter": ("fasta", []),
+        "fastq_filter": ("fastq", ["--fast"]),
+    }
+    for tool, (kind, tool_args) in tools.items():
+        output = os.path.join(workdir, f"{tool}.out")
+        for input_name, input_file in inputs.items():
+            if not input_name.startswith(kind):
+                continue
+            modes = {"mmap": ["--mmap"]} if input_name.endswith(".gz") else {"read": [], "mmap": ["--mmap"]}
+            for mode, mode_args in modes.items():
+                command = [
+                    sys.executable, os.path.join(HERE, f"{tool}.py"),
+                    "-f", input_file, "-o", output, "--no-cache", *tool_args, *mode_args
+                ]
+                seconds, peak_rss, cpu = run_tool(command)
+                print(
+                    f"{tool:<14} {input_name:<9} {mode:<7} {seconds:>8.2f} {cpu:>7.2f} {peak_rss:>12.1f} "
+                    f"{file_digest(output):>14}"
+                )
+
+
+def run_mmcif_benchmark(n_files: int, workers: list[int], baseline: bool, workdir: str):
+    """Prints wall time, structures/sec and peak RSS of mmcif_summary.py batch mode per worker count"""
+    source = os.path.join(INPUT_FILES, "4HHB.cif")
+    structures = os.path.join(workdir, "structures")
+    os.makedirs(structures)
+    for i in range(n_files):
+        path = os.path.join(structures, f"entry{i:05d}.cif")
+        if i % 2:
+            with open(source, "rb") as f, gzip.open(path + ".gz", "wb", compresslevel=6) as out:
+                shutil.copyfileobj(f, out)
+        else:
+            shutil.copyfile(source, path)
+    output = os.path.join(workdir, "summaries.jsonl")
+    print(f"{n_files} structures, {os.cpu_count()} CPUs")
+    print(f"{'mode':<20} {'seconds':>8} {'structures/sec':>15} {'peak RSS MB':>12}")
+    tool = [sys.executable, os.path.join(HERE, "mmcif_summary.py"), "--no-cache"]
+    if baseline:
+        files = sorted(os.listdir(structures))[:20]
+        seconds = 0.0
+        for name in files:
+            seconds += run_tool(tool + ["-f", os.path.join(structures, name), "-o", output])[0]
+        print(f"{'one per process':<20} {seconds:>8.2f} {len(files) / seconds:>15.1f} {'':>12}")
+    for n_workers in workers:
+        seconds, peak_rss, _ = run_tool(tool + ["-d", structures, "-o", output, "-w", str(n_workers)])
+        print(f"{f'workers={n_workers}':<20} {seconds:>8.2f} {n_files / seconds:>15.1f} {peak_rss:>12.1f}")
+
+
+def run_atom_site_benchmark(n_models: int, workdir: str):
+    """
+    Times Bio.PDB.MMCIFParser, MMCIF2Dict and ResidueTable.from_mmcif_text on one large
+    entry in this process and checks that all three give the same chain counts
+    """
+    from Bio.PDB import MMCIFParser
+    from Bio.PDB.MMCIF2Dict import MMCIF2Dict
+    sys.path.insert(0, HERE)
+    from residue_table import ResidueTable
+
+    path = os.path.join(workdir, "large.cif")
+    make_mmcif(path, n_models)
+    with open(path, "r") as f:
+        text = f.read()
+    n_atoms = text.count("\nATOM ") + text.count("\nHETATM ")
+    print(f"{n_models} models, {n_atoms} atoms, {len(text) / 1e6:.1f} MB")
+
+    def parser_counts():
+        structure = MMCIFParser(QUIET=True).get_structure("large", path)
+        return [
+            (model.serial_num, chain.id, len(chain), sum(residue.id[0] != " " for residue in chain))
+            for model in structure for chain in model
+        ]
+
+    def dict_counts():
+        mmcif_dict = MMCIF2Dict(path)
+        return ResidueTable.from_atom_columns(
+            model=np.array(mmcif_dict["_atom_site.pdbx_PDB_model_num"], dtype=int),
+            chain=mmcif_dict["_atom_site.auth_asym_id"],
+            resseq=mmcif_dict["_atom_site.auth_seq_id"],
+            icode=mmcif_dict["_atom_site.pdbx_PDB_ins_code"],
+            resname=mmcif_dict["_atom_site.label_comp_id"],
+            hetero=np.array(mmcif_dict["_atom_site.group_PDB"]) == "HETATM",
+        )
+
+    def table_counts(table):
+        return [
+            (entry["model"], entry["chain_id"], entry["total_residues"], entry["hetero_residues"])
+            for entry in table.chain_summary()
+        ]
+
+    readers = {
+        "MMCIFParser": parser_counts,
+        "MMCIF2Dict": lambda: table_counts(dict_counts()),
+        "from_mmcif_text": lambda: table_counts(ResidueTable.from_mmcif_text(text)),
+    }
+    print(f"{'reader':<16} {'seconds':>8} {'atoms/sec':>12} {'same counts':>12}")
+    reference = None
+    for reader, read in readers.items():
+        start = time.perf_counter()
+        counts = read()
+        seconds = time.perf_counter() - start
+        reference = counts if reference is None else reference
+        print(f"{reader:<16} {seconds:>8.2f} {n_atoms / seconds:>12,.0f} {str(counts == reference):>12}")
+
+
+def main():
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.benchmark == 'fastq':
+            fastq_file = args.fastqfile
+            if fastq_file is None:
+                fastq_file = os.path.join(workdir, "synthetic.fastq")
+                make_fastq(fastq_file, args.reads)
+            modes = {mode: FASTQ_MODES[mode] for mode in args.modes}
+            for workers in args.workers:
+                modes[f"workers={workers}"] = ["--fast", "--workers", str(workers), "--chunk-size", "4"]
+            run_fastq_benchmark(fastq_file, modes, workdir)
+        elif args.benchmark == 'fasta':
+            fasta_file = args.fastafile
+            if fasta_file is None:
+                fasta_file = os.path.join(workdir, "synthetic.fasta")
+                make_fasta(fasta_file, args.size)
+            run_fasta_benchmark(fasta_file, args.baseline, workdir)
+        elif args.benchmark == 'filter':
+            fasta_file = args.fastafile
+            if fasta_file is None:
+                fasta_file = os.path.join(workdir, "synthetic.fasta")
+                make_fasta(fasta_file, args.size)
+            run_filter_benchmark(fasta_file, args.baseline, workdir)
+        elif args.benchmark == 'atom-site':
+            run_atom_site_benchmark(args.models, workdir)
+        elif args.benchmark == 'mmcif':
+            run_mmcif_benchmark(args.files, args.workers, args.baseline, workdir)
+        elif args.benchmark == 'mmap':
+            run_mmap_benchmark(args.scale, args.bgzip, workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,26 @@
 #!/usr/bin/env python3
 
-from Bio.SeqIO.FastaIO import SimpleFastaParser
 import logging
 import socket
 import sys
 import argparse
 import os
+import re
+import resource
+import time
+import numpy as np
+from fasta_index import load_index
+from result_cache import add_cache_arguments, open_cache
+from seq_reader import FastaTable, read_chunks
 
 # -------------------------
 # global variables
 # -------------------------
 
 OUTPUT_FILE = "output.fasta"
+MIN_LENGTH = 1001  # the filter has always kept sequences longer than 1,000 residues
+BLOCK_SIZE = 8  # MB read per block
+COPY_SIZE = 1024 * 1024  # bytes per read/write when sendfile is not available
 
 # -------------------------
 # Logging setup
@@ -36,7 +45,62 @@ parser.add_argument(
     default=OUTPUT_FILE,
     help=f'The path to the output FASTA file (default: {OUTPUT_FILE})'
 )
+parser.add_argument(
+    '-m', '--min-length',
+    type=int,
+    default=MIN_LENGTH,
+    help=f'Keep sequences with at least this many residues (default: {MIN_LENGTH})'
+)
+parser.add_argument(
+    '-M', '--max-length',
+    type=int,
+    help='Keep sequences with at most this many residues (default: no limit)'
+)
+parser.add_argument(
+    '-p', '--header-regex',
+    type=str,
+    help='Keep records whose header line (without the >) matches this regular expression'
+)
+parser.add_argument(
+    '--ids',
+    type=str,
+    help='Keep records whose ID is listed in this file, one per line (# starts a comment); '
+         'the ID is the first word of the header or the accession of a db|accession|name header'
+)
+parser.add_argument(
+    '-u', '--unwrap',
+    action='store_true',
+    help='Write each sequence on a single line instead of copying the input lines'
+)
+parser.add_argument(
+    '-i', '--index',
+    action='store_true',
+    help='Use the .fai index (built or refreshed when missing or out of date) to seek '
+         'straight to the records within the length limits'
+)
+parser.add_argument(
+    '--mmap',
+    action='store_true',
+    help='Read the input through a memory map (plain) or block by block (bgzip/gzip), '
+         'measure all records of a block at once and write kept records from the mapped bytes'
+)
+parser.add_argument(
+    '-b', '--block-size',
+    type=int,
+    default=BLOCK_SIZE,
+    help=f'The size in MB of each block read from the input (default: {BLOCK_SIZE})'
+)
+parser.add_argument(
+    '-r', '--report',
+    action='store_true',
+    help='Print MB/sec and peak RSS to stderr when finished'
+)
+add_cache_arguments(parser)
 args = parser.parse_args()
+if args.block_size < 1:
+    parser.error("--block-size must be at least 1")
+if args.index and args.mmap:
+    parser.error("--index and --mmap are different ways of finding records, use one of them")
 
 format_string = (
     f'[%(asctime)s {socket.gethostname()}] '
@@ -48,87 +112,311 @@ logging.basicConfig(level=args.loglevel, format=format_string)
 # -------------------------
 # Functions
 # -------------------------
-def open_input_fasta(input_file: str) -> list[dict]:
+class RecordFilter:
+    """
+    The conditions a record has to meet to be written. Header conditions are checked
+    before anything else is read, the length conditions once the record is complete
+    """
+
+    def __init__(self, min_length: int = MIN_LENGTH, max_length: int = None,
+                 header_regex: str = None, ids: set = None):
+        self.min_length = min_length
+        self.max_length = max_length
+        self.header_regex = re.compile(header_regex.encode()) if header_regex else None
+        self.ids = ids
+
+    def header_ok(self, header: bytes) -> bool:
+        """True if a header line (with its >) passes the regex and ID conditions"""
+        header = header[1:].rstrip()
+        if self.header_regex is not None and not self.header_regex.search(header):
+            return False
+        if self.ids is not None:
+            first_word = header.split(maxsplit=1)[0].decode() if header.strip() else ""
+            parts = first_word.split("|")
+            accession = parts[1] if len(parts) > 1 else first_word
+            return first_word in self.ids or accession in self.ids
+        return True
+
+    def length_ok(self, length):
+        """True if length is within the limits, also works element-wise on arrays"""
+        ok = length >= self.min_length
+        if self.max_length is not None:
+            ok = ok & (length <= self.max_length)
+        return ok
+
+
+def read_id_file(id_file: str) -> set:
     """
-    Converts a given FASTA file into a list of dictionaries
+    Reads the IDs to keep into a set
 
     Args:
-        input_file: The path to a FASTA file that is to be opened and 
-                    converted to a list of dicts 
+        id_file: The path to the ID file, blank lines and text after `#` are ignored
 
     Returns:
-        sequences: A list of dictionaries of:
-                    + headers
-                    + sequences
-                    + lengths 
-                    from the given FASTA file
+        ids: The set of IDs
     """
-    sequences = []
-    logging.debug(f"About to open {input_file}")
+    ids = set()
     try:
-        with open(input_file, "r") as f:
-            logging.info(f"opening {input_file}")
-            for header, sequence in SimpleFastaParser(f):
-                entry = {
-                    "header" : header,
-                    "sequence" : sequence,
-                    "length": len(sequence)
-                    }
-                sequences.append(entry)
-        logging.info(f"Finished parsing through {input_file}, with {len(sequence)} sequences")
-        return sequences
+        with open(id_file, "r") as f:
+            for line in f:
+                record_id = line.split("#", 1)[0].strip()
+                if record_id:
+                    ids.add(record_id)
     except FileNotFoundError:
-        logging.error(f"Could not open {input_file}, program terminating.")
+        logging.error(f"Could not read {id_file}, terminating program.")
         sys.exit(1)
+    logging.info(f"Read {len(ids)} IDs from {id_file}")
+    return ids
 
 
-def write_output_fasta(output_file: str, sequences: list):
+def scan_records(f, block_size: int):
     """
-    Writes a FASTA file from a list of formatted dictionaries
+    Streams through a FASTA file in fixed size blocks (each extended to the end of its
+    last line) and yields the byte range and length of every record. Only headers are
+    copied out of the blocks, so memory stays the same whatever the record sizes
 
     Args:
-        output_file: The path to the output_file
-        sequences: The list of dictionary entries that will 
-                    be made into the FASTA file
+        f: The FASTA file opened in binary mode
+        block_size: The number of bytes read per block
+
+    Yields:
+        record: (header line, start offset, end offset, sequence length)
+    """
+    header, start, length = None, 0, 0
+    block_offset = 0
+    for block in iter(lambda: f.read(block_size) + f.readline(), b""):
+        has_cr = b"\r" in block
+        pos = 0
+        while pos < len(block):
+            if block[pos] == ord(">"):
+                if header is not None:
+                    yield header, start, block_offset + pos, length
+                end = block.find(b"\n", pos)
+                end = len(block) if end < 0 else end + 1
+                header, start, length = block[pos:end], block_offset + pos, 0
+                pos = end
+                continue
+            # `>` only appears at the start of header lines
+            stop = block.find(b">", pos)
+            stop = len(block) if stop < 0 else stop
+            length += stop - pos - block.count(b"\n", pos, stop)
+            if has_cr:
+                length -= block.count(b"\r", pos, stop)
+            pos = stop
+        block_offset += len(block)
+    if header is not None:
+        yield header, start, block_offset, length
+
+
+def index_records(f, input_file: str, record_filter: RecordFilter):
+    """
+    Yields the records within the length limits using the .fai index, reading only
+    their header lines
+
+    Args:
+        f: The FASTA file opened in binary mode
+        input_file: The path to the FASTA file
+        record_filter: The conditions to select records by length with
+
+    Yields:
+        record: (header line, start offset, end offset, sequence length)
+    """
+    try:
+        index = load_index(input_file)
+    except ValueError as e:
+        logging.error(f"Could not index {input_file}, program terminating: {e}")
+        sys.exit(1)
+    selected = np.flatnonzero(record_filter.length_ok(index.lengths))
+    starts, ends = index.record_starts(), index.sequence_ends()
+    logging.info(f"{len(selected)} of {len(index)} records are within the length limits")
+    for i in selected:
+        f.seek(starts[i])
+        header = f.read(index.offsets[i] - starts[i])
+        yield header, int(starts[i]), int(ends[i]), int(index.lengths[i])
+
+
+def copy_range(src, out, start: int, end: int):
+    """
+    Copies bytes [start, end) of src to out, inside the kernel with sendfile when
+    possible so the record never passes through Python
+
+    Args:
+        src: The input file opened in binary mode
+        out: The output file opened in binary mode
 
     Returns:
     """
+    out.flush()
     try:
-        logging.debug(f"About to write to {output_file}")
-        with open(output_file, "w") as out:
-            logging.info(f"Writing to {output_file}")
-            written_count = 0
-            for entry in sequences:
-                if entry["length"] > 1000:
-                    out.write(f">{entry["header"]}\n")
-                    out.write(f"{entry["sequence"]}\n")
-                    written_count += 1
-            logging.info(
-                        f"Successfully written {written_count} sequences, " + 
-                        "which have length > 1,000"
-            )
+        while start < end:
+            sent = os.sendfile(out.fileno(), src.fileno(), start, end - start)
+            if sent == 0:
+                break
+            start += sent
+    except (AttributeError, OSError):
+        src.seek(start)
+        while start < end:
+            chunk = src.read(min(COPY_SIZE, end - start))
+            if not chunk:
+                break
+            out.write(chunk)
+            start += len(chunk)
+
+
+def write_unwrapped(src, out, header: bytes, start: int, end: int):
+    """Writes a record with its sequence on a single line (the original output format)"""
+    src.seek(start + len(header))
+    out.write(header.rstrip() + b"\n")
+    out.write(src.read(end - start - len(header)).translate(None, b"\r\n") + b"\n")
+
 
+def filter_fasta(input_file: str, output_file: str, record_filter: RecordFilter,
+                 use_index: bool, unwrap: bool, block_size: int) -> tuple[int, int]:
+    """
+    Writes the records that pass record_filter. Kept records are copied byte for byte
+    from the input, line wrapping included, unless unwrap is set
+
+    Args:
+        input_file: The path to the FASTA file
+        output_file: The path to the output file
+        record_filter: The conditions a record has to meet
+        use_index: Select records by length from the .fai index instead of scanning the file
+        unwrap: Write each sequence on a single line
+        block_size: The number of bytes read per block when scanning
+
+    Returns:
+        counts: (records seen, records written)
+    """
+    try:
+        f = open(input_file, "rb")
+        src = open(input_file, "rb")
     except FileNotFoundError:
-        log.info(f"could not find path to {output_file}, writing to {OUTPUT_FILE}")
-        with open(OUTPUT_FILE, "w") as out:
-            written_count = 0
-            for entry in sequences:
-                if entry["length"] > 1000:
-                    out.write(f">{entry["header"]}\n")
-                    out.write(f"{entry["sequence"]}\n")
-                    written_count += 1
-            logging.info(
-                f"Successfully written {written_count} sequences, " + 
-                "which have length > 1,000"
-                )
+        logging.error(f"Could not open {input_file}, program terminating.")
+        sys.exit(1)
+    try:
+        out = open(output_file, "wb")
+    except FileNotFoundError:
+        logging.info(f"could not find path to {output_file}, writing to {OUTPUT_FILE}")
+        out = open(OUTPUT_FILE, "wb")
+
+    seen, written = 0, 0
+    with f, src, out:
+        logging.info(f"Filtering {input_file} into {output_file}")
+        records = index_records(f, input_file, record_filter) if use_index else scan_records(f, block_size)
+        # Runs of back to back kept records are copied with a single call
+        copy_start, copy_end = 0, 0
+        for header, start, end, length in records:
+            seen += 1
+            if not record_filter.length_ok(length) or not record_filter.header_ok(header):
+                continue
+            if unwrap:
+                write_unwrapped(src, out, header, start, end)
+            elif start == copy_end:
+                copy_end = end
+            else:
+                copy_range(src, out, copy_start, copy_end)
+                copy_start, copy_end = start, end
+            written += 1
+        copy_range(src, out, copy_start, copy_end)
+    logging.info(f"Successfully written {written} of {seen} sequences")
+    return seen, written
+
+
+def filter_mapped(input_file: str, output_file: str, record_filter: RecordFilter,
+                  unwrap: bool, block_size: int) -> tuple[int, int]:
+    """
+    Writes the records that pass record_filter, reading the input as record-aligned
+    chunks from seq_reader. The length limits are checked for a whole chunk at once and
+    kept records are written straight from the chunk, which also works for bgzip and
+    gzip input where byte ranges of the file cannot be copied
+
+    Args:
+        input_file: The path to the (optionally bgzip or gzip compressed) FASTA file
+        output_file: The path to the output file
+        record_filter: The conditions a record has to meet
+        unwrap: Write each sequence on a single line
+        block_size: The number of bytes per chunk
+
+    Returns:
+        counts: (records seen, records written)
+    """
+    try:
+        out = open(output_file, "wb")
+    except FileNotFoundError:
+        logging.info(f"could not find path to {output_file}, writing to {OUTPUT_FILE}")
+        out = open(OUTPUT_FILE, "wb")
+
+    seen, written = 0, 0
+    with out:
+        logging.info(f"Filtering {input_file} into {output_file} through seq_reader")
+        try:
+            for chunk in read_chunks(input_file, "fasta", block_size):
+                table = FastaTable(chunk)
+                seen += len(table)
+                # Runs of back to back kept records are written with a single call
+                copy_start, copy_end = 0, 0
+                for i in np.flatnonzero(record_filter.length_ok(table.lengths)):
+                    header = bytes(chunk[table.header_starts[i]:table.sequence_starts[i]])
+                    if not record_filter.header_ok(header):
+                        continue
+                    if unwrap:
+                        out.write(header.rstrip() + b"\n")
+                        out.write(bytes(table.sequence(i)).translate(None, b"\r\n") + b"\n")
+                    elif table.header_starts[i] == copy_end:
+                        copy_end = table.record_ends[i]
+                    else:
+                        out.write(chunk[copy_start:copy_end])
+                        copy_start, copy_end = table.header_starts[i], table.record_ends[i]
+                    written += 1
+                out.write(chunk[copy_start:copy_end])
+        except FileNotFoundError:
+            logging.error(f"Could not open {input_file}, program terminating.")
+            sys.exit(1)
+    logging.info(f"Successfully written {written} of {seen} sequences")
+    return seen, written
+
+
+def report_stats(input_file: str, seconds: float):
+    """Prints the input throughput and the peak resident memory to stderr"""
+    size_mb = os.path.getsize(input_file) / 1e6
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is KiB on Linux
+    print(
+        f"Read {size_mb:.1f} MB in {seconds:.2f}s: {size_mb / seconds if seconds else 0.0:,.1f} MB/sec, "
+        f"peak RSS {peak_rss_mb:.1f} MB",
+        file=sys.stderr
+    )
 
 
 def main():
     logging.debug("Beginning fasta_filter program")
-    sequences = open_input_fasta(args.fastafile)
-    write_output_fasta(args.output, sequences)
+    start = time.perf_counter()
+    input_files = [args.fastafile, args.ids] if args.ids else [args.fastafile]
+    cache, key = open_cache(args, "fasta_filter", input_files)
+    if cache and cache.restore("fasta_filter", key, args.output) is not None:
+        logging.info(f"Reused the cached records of {args.fastafile}")
+    else:
+        record_filter = RecordFilter(
+            min_length=args.min_length,
+            max_length=args.max_length,
+            header_regex=args.header_regex,
+            ids=read_id_file(args.ids) if args.ids else None,
+        )
+        if args.mmap:
+            filter_mapped(args.fastafile, args.output, record_filter, args.unwrap, args.block_size * 1024 * 1024)
+        else:
+            filter_fasta(
+                args.fastafile, args.output, record_filter,
+                args.index, args.unwrap, args.block_size * 1024 * 1024
+            )
+        if cache:
+            cache.store(
+                "fasta_filter", key, args.output,
+                sum(os.path.getsize(path) for path in input_files), time.perf_counter() - start
+            )
+    if args.report:
+        report_stats(args.fastafile, time.perf_counter() - start)
     logging.info("Successfully Completed Workflow!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
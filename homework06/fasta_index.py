@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import mmap
+import os
+import socket
+import sys
+from typing import NamedTuple
+import numpy as np
+
+INDEX_READ_SIZE = 4 * 1024 * 1024  # bytes of .fai text parsed per block
+RELEASE_SIZE = 64 * 1024 * 1024  # bytes of scanned FASTA dropped from memory at a time
+
+# -------------------------
+# Arg Parser
+# -------------------------
+parser = argparse.ArgumentParser(description='Builds a samtools compatible .fai index for a FASTA file')
+parser.add_argument(
+    '-l', '--loglevel',
+    required=False,
+    choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+    default='WARNING',
+    help='Set the logging level (default: WARNING)'
+)
+parser.add_argument(
+    '-f', '--fastafile',
+    type=str,
+    required=True,
+    help='The path to the input FASTA file'
+)
+parser.add_argument(
+    '--force',
+    action='store_true',
+    help='Rebuild the index even if it is up to date'
+)
+
+format_string = (
+    f'[%(asctime)s {socket.gethostname()}] '
+    '%(module)s.%(funcName)s:%(lineno)s - %(levelname)s - %(message)s'
+)
+
+
+# -------------------------
+# Functions
+# -------------------------
+class FaiEntry(NamedTuple):
+    """One line of a .fai index, in samtools column order"""
+    name: str
+    length: int  # residues in the sequence
+    offset: int  # byte offset of the first residue
+    line_bases: int  # residues per full line
+    line_width: int  # bytes per full line, including the line ending
+
+    def sequence_end(self) -> int:
+        """Byte offset just past the sequence, including the line ending of its last line"""
+        if not self.length:
+            return self.offset
+        full_lines, remainder = divmod(self.length, self.line_bases)
+        end = self.offset + full_lines * self.line_width
+        if remainder:
+            end += remainder + self.line_width - self.line_bases
+        return end
+
+
+def index_path(fasta_file: str) -> str:
+    """The path samtools uses for the index of fasta_file"""
+    return fasta_file + ".fai"
+
+
+def scan_fasta(fasta_file: str) -> list[FaiEntry]:
+    """
+    Computes the index entries of a FASTA file. The file is memory mapped and each record
+    is checked with whole-record byte operations instead of reading it line by line;
+    pages already scanned are handed back to the kernel so RSS does not grow with the file
+
+    Args:
+        fasta_file: The path to the FASTA file
+
+    Returns:
+        entries: One FaiEntry per record in file order
+
+    Raises:
+        ValueError: If the file is not FASTA or a record has lines of different lengths,
+                    which samtools cannot index either
+    """
+    entries = []
+    if os.path.getsize(fasta_file) == 0:
+        return entries
+    with open(fasta_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        if mm[:1] != b">":
+            raise ValueError(f"{fasta_file} does not start with a FASTA header")
+        pos, released = 0, 0
+        while pos < size:
+            header_end = mm.find(b"\n", pos)
+            header_end = size if header_end < 0 else header_end + 1
+            name = mm[pos + 1:header_end].split(maxsplit=1)
+            name = name[0].decode() if name else ""
+            # `>` only appears at the start of header lines
+            stop = mm.find(b">", header_end)
+            stop = size if stop < 0 else stop
+            entries.append(index_record(name, header_end, mm[header_end:stop]))
+            pos = stop
+            if pos - released > RELEASE_SIZE and hasattr(mmap, "MADV_DONTNEED"):
+                release_end = pos - pos % mmap.PAGESIZE
+                mm.madvise(mmap.MADV_DONTNEED, released, release_end - released)
+                released = release_end
+    return entries
+
+
+def index_record(name: str, offset: int, sequence: bytes) -> FaiEntry:
+    """
+    Computes the index entry of one record from the bytes of its sequence lines
+
+    Args:
+        name: The record name, the first word of the header
+        offset: The byte offset of the first residue
+        sequence: The bytes from the first residue up to the next header
+
+    Returns:
+        entry: The FaiEntry of the record
+    """
+    if not sequence:
+        return FaiEntry(name, 0, offset, 0, 0)
+    first_line_end = sequence.find(b"\n")
+    if first_line_end < 0:
+        first_line_end = len(sequence)
+    line_width = first_line_end + 1
+    line_ending = 2 if sequence[first_line_end - 1:first_line_end] == b"\r" else 1
+    line_bases = line_width - line_ending
+    length = len(sequence) - sequence.count(b"\n")
+    if line_ending == 2:
+        length -= sequence.count(b"\r")
+
+    # Every full line must end exactly line_width bytes after the previous one
+    full_lines = len(sequence) // line_width
+    line_ends = sequence[line_width - 1::line_width]
+    remainder = sequence[full_lines * line_width:]
+    last_line = remainder.rstrip(b"\r\n")
+    if line_ends.count(b"\n") != full_lines or b"\n" in last_line \
+            or (remainder and not last_line):
+        raise ValueError(f"Record {name} has lines of different lengths and cannot be indexed")
+    return FaiEntry(name, length, offset, line_bases, line_width)
+
+
+class FastaIndex:
+    """
+    Columnar (NumPy) form of a .fai index, one row per record in file order. Reading
+    a large index column by column is several times faster than building a FaiEntry
+    per line; rows are still available as FaiEntry through indexing and iteration
+    """
+
+    def __init__(self, names, lengths, offsets, line_bases, line_widths):
+        self.names = names
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.line_bases = np.asarray(line_bases, dtype=np.int64)
+        self.line_widths = np.asarray(line_widths, dtype=np.int64)
+
+    @classmethod
+    def from_entries(cls, entries: list[FaiEntry]):
+        """Build the index from the rows computed by scan_fasta()"""
+        return cls(*(list(column) for column in zip(*entries))) if entries else cls([], [], [], [], [])
+
+    @classmethod
+    def read(cls, path: str):
+        """
+        Read a tab separated .fai file. Names never contain whitespace, so each block of
+        lines is split into fields in one call and the number columns are converted in bulk
+        """
+        names, columns = [], [[], [], [], []]
+        with open(path, "r") as f:
+            while lines := f.readlines(INDEX_READ_SIZE):
+                fields = "".join(lines).split()
+                names.extend(fields[0::5])
+                for i, column in enumerate(columns, start=1):
+                    column.append(np.fromiter(map(int, fields[i::5]), dtype=np.int64))
+        return cls(names, *(np.concatenate(column) if column else [] for column in columns))
+
+    def write(self, path: str):
+        """Write the index as a tab separated .fai file"""
+        columns = zip(
+            self.names, self.lengths.tolist(), self.offsets.tolist(),
+            self.line_bases.tolist(), self.line_widths.tolist()
+        )
+        with open(path, "w") as out:
+            out.writelines(f"{name}\t{length}\t{offset}\t{bases}\t{width}\n"
+                           for name, length, offset, bases, width in columns)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i) -> FaiEntry:
+        return FaiEntry(
+            self.names[i], int(self.lengths[i]), int(self.offsets[i]),
+            int(self.line_bases[i]), int(self.line_widths[i])
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def sequence_ends(self) -> np.ndarray:
+        """Byte offset just past every sequence, vectorized FaiEntry.sequence_end()"""
+        full_lines, remainder = np.divmod(self.lengths, np.maximum(self.line_bases, 1))
+        ends = self.offsets + full_lines * self.line_widths
+        return ends + np.where(remainder > 0, remainder + self.line_widths - self.line_bases, 0)
+
+    def record_starts(self) -> np.ndarray:
+        """Byte offset of every header line, each record starts where the previous sequence ends"""
+        ends = self.sequence_ends()
+        return np.concatenate(([0], ends[:-1]))[:len(ends)].astype(np.int64)
+
+
+def is_stale(fasta_file: str, index: FastaIndex) -> bool:
+    """
+    An index is stale when the FASTA file was modified after it, or when its last record
+    no longer ends at the end of the file (the .fai format has no size field of its own)
+    """
+    if os.path.getmtime(fasta_file) > os.path.getmtime(index_path(fasta_file)):
+        return True
+    size = os.path.getsize(fasta_file)
+    if not len(index):
+        return size != 0
+    last = index[len(index) - 1]
+    end = last.sequence_end()
+    # The final line ending may be missing
+    return not (end - (last.line_width - last.line_bases) <= size <= end)
+
+
+def load_index(fasta_file: str, force: bool = False) -> FastaIndex:
+    """
+    Returns the index of a FASTA file, reusing the .fai file when it is up to date and
+    (re)building it otherwise
+
+    Args:
+        fasta_file: The path to the FASTA file
+        force: Rebuild the index even if it is up to date
+
+    Returns:
+        index: The FastaIndex of the file
+    """
+    path = index_path(fasta_file)
+    if not force and os.path.exists(path):
+        index = FastaIndex.read(path)
+        if not is_stale(fasta_file, index):
+            logging.info(f"Using index {path}")
+            return index
+        logging.info(f"Index {path} is out of date")
+    logging.info(f"Indexing {fasta_file}")
+    index = FastaIndex.from_entries(scan_fasta(fasta_file))
+    try:
+        index.write(path)
+    except OSError as e:
+        logging.warning(f"Could not write {path}, the index will be rebuilt next time: {e}")
+    return index
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=args.loglevel, format=format_string)
+    try:
+        index = load_index(args.fastafile, force=args.force)
+    except FileNotFoundError:
+        logging.error(f"Could not read {args.fastafile}, terminating program.")
+        sys.exit(1)
+    except ValueError as e:
+        logging.error(e)
+        sys.exit(1)
+    print(f"{len(index)} records indexed in {index_path(args.fastafile)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,30 @@
 #!/usr/bin/env python3
 
-from Bio.SeqIO.FastaIO import SimpleFastaParser
+import json
+import math
 import logging
 import socket
 import sys
 import argparse
 import os
+import resource
+import time
+from collections import Counter
+import numpy as np
+from fasta_index import load_index
+from result_cache import add_cache_arguments, open_cache
+from seq_reader import FastaTable, read_chunks
 
 # -------------------------
 # global variables
 # -------------------------
 
 OUTPUT_FILE = "output_fasta_summary.json"
+BLOCK_SIZE = 8  # MB read per block
+HISTOGRAM_BINS = 10
+NUCLEOTIDES = b"ACGTUacgtu"
+LINE_BYTES = b">\r\n"  # bytes that are never sequence residues
+COUNT_SLICE = 64 * 1024  # byte pairs per bincount call
 
 # -------------------------
 # Logging setup
@@ -36,7 +49,46 @@ parser.add_argument(
     default=OUTPUT_FILE,
     help=f'The path to the output JSON file (default: {OUTPUT_FILE})'
 )
+parser.add_argument(
+    '-j', '--json',
+    action='store_true',
+    help='Write the full summary as JSON instead of the plain text report'
+)
+parser.add_argument(
+    '--bins',
+    type=int,
+    default=HISTOGRAM_BINS,
+    help=f'The number of equal width bins in the length histogram (default: {HISTOGRAM_BINS})'
+)
+parser.add_argument(
+    '-b', '--block-size',
+    type=int,
+    default=BLOCK_SIZE,
+    help=f'The size in MB of each block read from the input (default: {BLOCK_SIZE})'
+)
+parser.add_argument(
+    '-i', '--index',
+    action='store_true',
+    help='Answer count and length statistics from the .fai index (built or refreshed when '
+         'missing or out of date) without reading sequence bytes; composition is not reported'
+)
+parser.add_argument(
+    '--mmap',
+    action='store_true',
+    help='Read the input through a memory map (plain) or block by block (bgzip/gzip) and '
+         'measure all records of a block at once'
+)
+parser.add_argument(
+    '-r', '--report',
+    action='store_true',
+    help='Print MB/sec and peak RSS to stderr when finished'
+)
+add_cache_arguments(parser)
 args = parser.parse_args()
+if args.bins < 1 or args.block_size < 1:
+    parser.error("--bins and --block-size must be at least 1")
+if args.index and args.mmap:
+    parser.error("--index does not read the sequences, it cannot be combined with --mmap")
 
 format_string = (
     f'[%(asctime)s {socket.gethostname()}] '
@@ -47,72 +99,331 @@ logging.basicConfig(level=args.loglevel, format=format_string)
 # -------------------------
 # Functions
 # -------------------------
-def read_file(input_file: str) -> list[dict]:
+class FastaStats:
+    """
+    Running summary of a FASTA file that is updated one record at a time. Memory stays
+    fixed no matter how many records are seen: lengths are kept as a count per distinct
+    length (enough for an exact N50/L50 and histogram) and residues as 256 byte counts
+    """
+
+    def __init__(self):
+        self.num_sequences = 0
+        self.total_residues = 0
+        self.longest = None  # (id, length)
+        self.shortest = None
+        self.length_counts = Counter()
+        self.byte_counts = np.zeros(256, dtype=np.int64)
+
+    def add_record(self, record_id: str, length: int):
+        """Counts one complete record, ties keep the first longest and the last shortest record"""
+        self.num_sequences += 1
+        self.total_residues += length
+        self.length_counts[length] += 1
+        if self.longest is None or length > self.longest[1]:
+            self.longest = (record_id, length)
+        if self.shortest is None or length <= self.shortest[1]:
+            self.shortest = (record_id, length)
+
+    def add_lengths(self, names: list[str], lengths: np.ndarray):
+        """
+        Counts many complete records at once, with the same tie order as add_record
+
+        Args:
+            names: The .fai names (str) or header lines (bytes, with or without the `>`) of
+                   the records, IDs are only taken for the longest and shortest
+            lengths: The length of each record
+        """
+        if not len(lengths):
+            return
+        self.num_sequences += len(lengths)
+        self.total_residues += int(lengths.sum())
+        distinct, counts = np.unique(lengths, return_counts=True)
+        self.length_counts.update(dict(zip(distinct.tolist(), counts.tolist())))
+        longest = int(np.argmax(lengths))
+        shortest = len(lengths) - 1 - int(np.argmin(lengths[::-1]))
+        if self.longest is None or lengths[longest] > self.longest[1]:
+            self.longest = (name_id(names[longest]), int(lengths[longest]))
+        if self.shortest is None or lengths[shortest] <= self.shortest[1]:
+            self.shortest = (name_id(names[shortest]), int(lengths[shortest]))
+
+    def add_bytes(self, counts: np.ndarray):
+        """Adds a bincount of residue bytes to the composition"""
+        self.byte_counts += counts
+
+    def n50(self) -> tuple[int, int]:
+        """
+        Computes N50 and L50 from the length counts
+
+        Returns:
+            result: (N50, the length at which the longest sequences reach half of all residues,
+                     L50, the number of sequences needed to get there)
+        """
+        half = self.total_residues / 2
+        covered, n_sequences = 0, 0
+        for length in sorted(self.length_counts, reverse=True):
+            count = self.length_counts[length]
+            if length and covered + count * length >= half:
+                return length, n_sequences + math.ceil((half - covered) / length)
+            covered += count * length
+            n_sequences += count
+        return 0, 0
+
+    def histogram(self, n_bins: int) -> list[dict]:
+        """Equal width length histogram between the shortest and longest sequence"""
+        if not self.length_counts:
+            return []
+        low, high = min(self.length_counts), max(self.length_counts)
+        width = max(1, math.ceil((high - low + 1) / n_bins))
+        counts = Counter()
+        for length, count in self.length_counts.items():
+            counts[(length - low) // width] += count
+        return [
+            {"start": low + i * width, "end": low + (i + 1) * width - 1, "count": counts[i]}
+            for i in range((high - low) // width + 1)
+        ]
+
+    def composition(self) -> dict:
+        """Residue counts by upper case letter"""
+        composition = Counter()
+        for byte in np.flatnonzero(self.byte_counts):
+            if byte not in LINE_BYTES:
+                composition[chr(byte).upper()] += int(self.byte_counts[byte])
+        return dict(sorted(composition.items()))
+
+    def gc_content(self):
+        """GC fraction of A/C/G/T/U residues, None when most residues are not nucleotides or N"""
+        nucleotides = int(self.byte_counts[list(NUCLEOTIDES)].sum())
+        if not nucleotides or nucleotides + self.byte_counts[list(b"Nn")].sum() < 0.9 * self.total_residues:
+            return None
+        return int(self.byte_counts[list(b"GCgc")].sum()) / nucleotides
+
+    def summary(self, n_bins: int) -> dict:
+        """All statistics as a JSON serializable dict"""
+        n50, l50 = self.n50()
+        return {
+            "num_sequences": self.num_sequences,
+            "total_residues": self.total_residues,
+            "longest": {"id": self.longest[0], "length": self.longest[1]} if self.longest else None,
+            "shortest": {"id": self.shortest[0], "length": self.shortest[1]} if self.shortest else None,
+            "mean_length": self.total_residues / self.num_sequences if self.num_sequences else 0.0,
+            "n50": n50,
+            "l50": l50,
+            "gc_content": self.gc_content(),
+            "composition": self.composition() if self.byte_counts.any() else None,
+            "length_histogram": self.histogram(n_bins),
+        }
+
+
+def record_id(header: bytes) -> str:
+    """The accession of a `db|accession|name` UniProt header, otherwise the first word"""
+    header = header.decode("utf-8", errors="replace").rstrip("\r")
+    parts = header.split("|")
+    if len(parts) > 1:
+        return parts[1]
+    return header.split(maxsplit=1)[0] if header.strip() else ""
+
+
+def name_id(name) -> str:
+    """The record_id of a .fai name (str) or a header line (bytes)"""
+    return record_id(name.encode() if isinstance(name, str) else name.lstrip(b">"))
+
+
+def count_bytes(data: bytes) -> np.ndarray:
+    """
+    Counts every byte value in data. Bytes are counted in pairs, read as 16-bit values,
+    which halves the number of elements bincount has to convert and visit
+
+    Args:
+        data: The bytes to count
+
+    Returns:
+        counts: An int64 array of 256 counts indexed by byte value
+    """
+    even = len(data) - len(data) % 2
+    pairs = np.frombuffer(data, dtype=np.uint16, count=even // 2)
+    pair_counts = np.zeros(1 << 16, dtype=np.int64)
+    for start in range(0, len(pairs), COUNT_SLICE):
+        pair_counts += np.bincount(pairs[start:start + COUNT_SLICE], minlength=1 << 16)
+    pair_counts = pair_counts.reshape(256, 256)
+    counts = pair_counts.sum(axis=0) + pair_counts.sum(axis=1)
+    if even < len(data):
+        counts[data[-1]] += 1
+    return counts
+
+
+def read_file(input_file: str, block_size: int) -> FastaStats:
     """
-    Opens and parses through a given FASTA file, and creates a list of dictionaries, 
-    containing each sequence's id and length
+    Streams through a FASTA file in fixed size blocks and summarizes it without building
+    per-record strings. Each block is extended to the end of its last line, so record
+    lengths come from counting newlines between headers and the residue composition is
+    one bincount per block minus the bytes of its header lines
 
     Args:
         input_file: The path to the FASTA file to be read
+        block_size: The number of bytes read per block
 
     Returns:
-        sequences: A list of dictionaries for each sequence, containing:
-                    + id
-                    + length
+        stats: The FastaStats of the file
     """
-    sequences = []
+    stats = FastaStats()
+    current_id, current_length = None, 0
     try:
         logging.debug(f"About to read {input_file}")
-        with open(input_file, "r") as f:
+        with open(input_file, "rb") as f:
             logging.info(f"Parsing {input_file}")
-            for header, sequence in SimpleFastaParser(f):
-                #("Header", "Sequence")
-                parts = header.split("|")
-                entry = {
-                    "id": parts[1],
-                    "length": len(sequence)
-                    }
-                sequences.append(entry)
-            logging.info(f"Successfully parsed {len(sequence)} reads")
-        return sequences
+            for block in iter(lambda: f.read(block_size) + f.readline(), b""):
+                headers = []
+                has_cr = b"\r" in block
+                pos = 0
+                while pos < len(block):
+                    if block[pos] == ord(">"):
+                        end = block.find(b"\n", pos)
+                        end = len(block) if end < 0 else end + 1
+                        if current_id is not None:
+                            stats.add_record(current_id, current_length)
+                        current_id, current_length = record_id(block[pos + 1:end].rstrip(b"\n")), 0
+                        headers.append(block[pos:end])
+                        pos = end
+                        continue
+                    # `>` only appears at the start of header lines
+                    stop = block.find(b">", pos)
+                    stop = len(block) if stop < 0 else stop
+                    current_length += stop - pos - block.count(b"\n", pos, stop)
+                    if has_cr:
+                        current_length -= block.count(b"\r", pos, stop)
+                    pos = stop
+                stats.add_bytes(count_bytes(block) - count_bytes(b"".join(headers)))
+            if current_id is not None:
+                stats.add_record(current_id, current_length)
+            logging.info(f"Successfully parsed {stats.num_sequences} sequences")
+        return stats
+    except FileNotFoundError:
+        logging.error(f"Could not read {input_file}, terminating program.")
+        sys.exit(1)
+
+
+def read_mapped(input_file: str, block_size: int) -> FastaStats:
+    """
+    Summarizes a FASTA file from the record-aligned chunks of seq_reader, which are
+    views of a memory map (or of decompressed bgzip/gzip blocks) rather than copies.
+    Record lengths of a whole chunk come from one FastaTable and the composition from
+    one count of the chunk minus its header lines
+
+    Args:
+        input_file: The path to the (optionally bgzip or gzip compressed) FASTA file
+        block_size: The number of bytes per chunk
+
+    Returns:
+        stats: The FastaStats of the file
+    """
+    stats = FastaStats()
+    try:
+        logging.info(f"Mapping {input_file}")
+        for chunk in read_chunks(input_file, "fasta", block_size):
+            table = FastaTable(chunk)
+            headers = table.header_lines()
+            stats.add_lengths(headers.split(b"\n"), table.lengths)
+            stats.add_bytes(count_bytes(chunk) - count_bytes(headers))
     except FileNotFoundError:
         logging.error(f"Could not read {input_file}, terminating program.")
         sys.exit(1)
+    logging.info(f"Successfully parsed {stats.num_sequences} sequences")
+    return stats
 
 
-def make_summary(output_file: str, sequences: list):
+def read_index_stats(input_file: str) -> FastaStats:
     """
-    Creates a summary text file based on id and lengths contained in the list of dictionaries
-    by sequence
+    Summarizes a FASTA file from its .fai index, only the lengths are known so the
+    composition and GC content are left out
 
     Args:
-        output_file: The path to the output file 
-        sequences: A list of dictionaries with each sequence having an id and sequence length
+        input_file: The path to the FASTA file
 
     Returns:
+        stats: The FastaStats of the file
     """
+    try:
+        index = load_index(input_file)
+    except FileNotFoundError:
+        logging.error(f"Could not read {input_file}, terminating program.")
+        sys.exit(1)
+    except ValueError as e:
+        logging.error(f"Could not index {input_file}, terminating program: {e}")
+        sys.exit(1)
+    stats = FastaStats()
+    stats.add_lengths(index.names, index.lengths)
+    logging.info(f"Read {stats.num_sequences} sequences from the index")
+    return stats
+
+
+def make_summary(output_file: str, stats: FastaStats, as_json: bool, n_bins: int):
+    """
+    Creates a summary file from the statistics of a FASTA file, either the plain text
+    report (count, total residues, longest and shortest accession) or the full summary,
+    with N50/L50, GC content, composition and the length histogram, as JSON
+
+    Args:
+        output_file: The path to the output file
+        stats: The FastaStats of the file
+        as_json: Write JSON instead of the text report
+        n_bins: The number of bins in the length histogram
+
+    Returns:
+    """
+    summary = stats.summary(n_bins)
     logging.debug(f"About to write to {output_file}")
     with open(output_file, "w") as out:
         logging.info(f"Writing stats in {output_file}")
-        out.write(f"Num Sequences: {len(sequences)}\n")
+        if as_json:
+            json.dump(summary, out, indent=2)
+            logging.info("Completed writing stats")
+            return
+        if not summary["num_sequences"]:
+            logging.warning("No sequences found")
+            out.write("Num Sequences: 0\nTotal Residues: 0")
+            return
 
-        total_res = 0
-        for entry in sequences:
-            total_res += entry["length"]
-        out.write(f"Total Residues: {total_res}\n")
-
-        sorted_seq = sorted(sequences, key=lambda x : x["length"], reverse=True)
-        out.write(f"Longest Accession: {sorted_seq[0]["id"]} ({sorted_seq[0]["length"]} residues)\n")
-        out.write(f"Shortest Accession: {sorted_seq[-1]["id"]} ({sorted_seq[-1]["length"]} residues)")
+        longest, shortest = summary["longest"], summary["shortest"]
+        out.write(f"Num Sequences: {summary['num_sequences']}\n")
+        out.write(f"Total Residues: {summary['total_residues']}\n")
+        out.write(f"Longest Accession: {longest['id']} ({longest['length']} residues)\n")
+        out.write(f"Shortest Accession: {shortest['id']} ({shortest['length']} residues)")
         logging.info("Completed writing stats")
 
 
+def report_stats(input_file: str, seconds: float):
+    """Prints the input throughput and the peak resident memory to stderr"""
+    size_mb = os.path.getsize(input_file) / 1e6
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is KiB on Linux
+    print(
+        f"Read {size_mb:.1f} MB in {seconds:.2f}s: {size_mb / seconds if seconds else 0.0:,.1f} MB/sec, "
+        f"peak RSS {peak_rss_mb:.1f} MB",
+        file=sys.stderr
+    )
+
+
 def main():
     logging.info("Beginning fasta_stats program")
-    sequences = read_file(args.fastafile)
-    make_summary(args.output, sequences)
+    start = time.perf_counter()
+    cache, key = open_cache(args, "fasta_stats", [args.fastafile])
+    if cache and cache.restore("fasta_stats", key, args.output) is not None:
+        logging.info(f"Reused the cached summary of {args.fastafile}")
+    else:
+        if args.index:
+            stats = read_index_stats(args.fastafile)
+        elif args.mmap:
+            stats = read_mapped(args.fastafile, args.block_size * 1024 * 1024)
+        else:
+            stats = read_file(args.fastafile, args.block_size * 1024 * 1024)
+        make_summary(args.output, stats, args.json, args.bins)
+        if cache:
+            cache.store(
+                "fasta_stats", key, args.output, os.path.getsize(args.fastafile), time.perf_counter() - start
+            )
+    if args.report:
+        report_stats(args.fastafile, time.perf_counter() - start)
     logging.info("Successfully Completed Workflow!")
-    
+
 
 if __name__ == "__main__":
     main()
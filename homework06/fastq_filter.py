@@ -7,13 +7,41 @@ import socket
 import sys
 import argparse
 import os
+import gzip
+import resource
+import time
+import io
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+from itertools import islice
+from typing import NamedTuple
+import numpy as np
+from result_cache import add_cache_arguments, open_cache
+from seq_reader import FastqTable, join_ranges, read_chunks
 from Bio import SeqIO
+from Bio.SeqIO.QualityIO import as_fastq, as_fastq_illumina, as_fastq_solexa
 
 # -------------------------
 # global variables
 # -------------------------
 
 OUTPUT_FILE = "filtered_fastq_output.fastq"
+WRITE_BUFFER = 1000  # records held before each write in streaming mode
+
+# Bio.SeqIO's per-record FASTQ formatters, byte-identical to SeqIO.write
+FASTQ_FORMATTERS = {
+    'fastq-sanger': as_fastq,
+    'fastq-solexa': as_fastq_solexa,
+    'fastq-illumina': as_fastq_illumina,
+}
+
+# Fast path: PHRED score of every possible quality byte per encoding
+QUALITY_OFFSETS = {'fastq-sanger': 33, 'fastq-solexa': 64, 'fastq-illumina': 64}
+FAST_BATCH = 5000  # records scored per NumPy batch
+CHUNK_SIZE = 16  # MB of input per parallel work unit
+MAP_CHUNK_SIZE = 2 * 1024 * 1024  # bytes of records per --mmap batch, about FAST_BATCH reads
+ADAPTER_OVERLAP = 3  # shortest adapter prefix clipped from the end of a read
 
 # -------------------------
 # arg parser for file names and logging setting
@@ -50,7 +78,90 @@ parser.add_argument(
     default=OUTPUT_FILE,
     help=f'The path to the output FASTQ file (default: {OUTPUT_FILE})'
 )
+parser.add_argument(
+    '-s', '--stream',
+    action='store_true',
+    help='Stream records from input to output with constant memory '
+         '(.gz input/output paths are read/written gzip compressed)'
+)
+parser.add_argument(
+    '--fast',
+    action='store_true',
+    help='Score raw 4-line FASTQ records with NumPy and copy passing records without '
+         'building SeqRecords (implies --stream)'
+)
+parser.add_argument(
+    '-w', '--workers',
+    type=int,
+    default=1,
+    help='Score the input in N worker processes using record-aligned byte chunks (implies --fast)'
+)
+parser.add_argument(
+    '--chunk-size',
+    type=int,
+    default=CHUNK_SIZE,
+    help=f'The size in MB of each chunk handed to a worker (default: {CHUNK_SIZE})'
+)
+parser.add_argument(
+    '--unordered',
+    action='store_true',
+    help='With --workers, write chunks as soon as they finish instead of in input order'
+)
+parser.add_argument(
+    '--mmap',
+    action='store_true',
+    help='Read the input through a memory map (plain) or block by block (bgzip/gzip) and lay '
+         'out each chunk of records with NumPy instead of splitting lines (implies --fast)'
+)
+parser.add_argument(
+    '-a', '--adapter',
+    type=str,
+    help='Clip this adapter sequence, and everything after it, from each read (implies --fast)'
+)
+parser.add_argument(
+    '--adapter-overlap',
+    type=int,
+    default=ADAPTER_OVERLAP,
+    help=f'The shortest adapter prefix clipped when it is cut off by the end of a read (default: {ADAPTER_OVERLAP})'
+)
+parser.add_argument(
+    '--window',
+    type=int,
+    nargs=2,
+    metavar=('SIZE', 'QUALITY'),
+    help='Sliding window trimming: cut each read at the first window of SIZE bases whose '
+         'average phred score is below QUALITY (implies --fast)'
+)
+parser.add_argument(
+    '-m', '--min-length',
+    type=int,
+    default=0,
+    help='Drop reads shorter than this after trimming (implies --fast, default: 0)'
+)
+parser.add_argument(
+    '-n', '--max-n',
+    type=float,
+    help='Drop reads whose fraction of N bases after trimming is above this (implies --fast)'
+)
+parser.add_argument(
+    '-b', '--buffer',
+    type=int,
+    default=WRITE_BUFFER,
+    help=f'The number of records buffered between writes in streaming mode (default: {WRITE_BUFFER})'
+)
+parser.add_argument(
+    '-r', '--report',
+    action='store_true',
+    help='Print reads processed, reads/sec and peak RSS to stderr when finished'
+)
+add_cache_arguments(parser)
 args = parser.parse_args()
+if args.workers < 1 or args.chunk_size < 1:
+    parser.error("--workers and --chunk-size must be at least 1")
+if args.mmap and args.workers > 1:
+    parser.error("--mmap reads the input in a single process, it cannot be combined with --workers")
+if args.window and (args.window[0] < 1):
+    parser.error("--window SIZE must be at least 1")
 
 format_string = (
     f'[%(asctime)s {socket.gethostname()}] '
@@ -62,7 +173,7 @@ logging.basicConfig(level=args.loglevel, format=format_string)
 # -------------------------
 # Functions
 # -------------------------
-def load_fastq(input_file: str, encoding: str, threshold: int) -> list:
+def load_fastq(input_file: str, encoding: str, threshold: int, stats: dict = None) -> list:
     """
     Opens the FASTQ file and generates the average phred score for each entry,
     if the average phred is above the threshold the read will be appened to a saved list
@@ -72,6 +183,7 @@ def load_fastq(input_file: str, encoding: str, threshold: int) -> list:
         encoding: The FASTQ encoding method of the phred scores
                   (options: fastq-sanger, fastq-solexa, fastq-illumina)
         threshold: The minimum average phred score to be saved
+        stats: An optional dict whose "reads" counter is incremented for every read
 
     Returns:
         reads_filter: The reads with average phred scores above the given threshold
@@ -82,6 +194,8 @@ def load_fastq(input_file: str, encoding: str, threshold: int) -> list:
         with open(input_file, "r") as f:
             logging.info(f"Parsing {input_file} with {encoding} encoding")
             for record in SeqIO.parse(f, encoding):
+                if stats is not None:
+                    stats["reads"] += 1
                 avg_phred = sum(record.letter_annotations["phred_quality"]) / len(record.letter_annotations["phred_quality"])
                 if avg_phred >= threshold:
                     reads_filter.append(record)
@@ -121,10 +235,677 @@ def create_filtered_file(output_file: str, reads_filter: list, encoding: str):
             SeqIO.write(reads_filter, out, encoding)
 
 
+def open_fastq(path: str, mode: str):
+    """
+    Opens a FASTQ file in text mode, transparently handling gzip compression
+
+    Args:
+        path: The path to the FASTQ file, paths ending in `.gz` are gzip compressed
+        mode: "r" or "w", with "b" for binary handles
+
+    Returns:
+        handle: An open text file handle
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode if "b" in mode else mode + "t")
+    return open(path, mode)
+
+
+def stream_fastq(input_file: str, encoding: str, threshold: int, stats: dict):
+    """
+    Lazily parses the FASTQ file and yields only the reads whose average phred score
+    is at or above the threshold, so no more than one record is held at a time
+
+    Args:
+        input_file: The path to the (optionally gzip compressed) FASTQ file
+        encoding: The FASTQ encoding method of the phred scores
+                  (options: fastq-sanger, fastq-solexa, fastq-illumina)
+        threshold: The minimum average phred score to be saved
+        stats: A dict whose "reads" and "passed" counters are updated as records stream by
+
+    Yields:
+        record: Each passing SeqRecord in input order
+    """
+    try:
+        logging.debug(f"About to stream {input_file}")
+        with open_fastq(input_file, "r") as f:
+            logging.info(f"Streaming {input_file} with {encoding} encoding")
+            for record in SeqIO.parse(f, encoding):
+                stats["reads"] += 1
+                phred = record.letter_annotations["phred_quality"]
+                if phred and sum(phred) / len(phred) >= threshold:
+                    stats["passed"] += 1
+                    yield record
+    except FileNotFoundError:
+        logging.error(f"Could not read {input_file}, terminating program.")
+        sys.exit(1)
+
+
+def write_fastq_stream(output_file: str, records, encoding: str, buffer_size: int):
+    """
+    Writes records to a FASTQ file as they arrive, flushing every buffer_size records
+
+    Args:
+        output_file: The path of the output file, paths ending in `.gz` are gzip compressed
+        records: An iterable of SeqRecords, e.g. from stream_fastq()
+        encoding: The FASTQ encoding method of the phred scores
+                  (options: fastq-sanger, fastq-solexa, fastq-illumina)
+        buffer_size: The number of formatted records held before each write
+
+    Returns:
+    """
+    to_fastq = FASTQ_FORMATTERS[encoding]
+    try:
+        out = open_fastq(output_file, "w")
+    except FileNotFoundError:
+        logging.info(f"Could not write to {output_file}, writing to {OUTPUT_FILE} with {encoding} encoding")
+        out = open_fastq(OUTPUT_FILE, "w")
+
+    with out:
+        logging.info(f"Streaming to {output_file} with {encoding} encoding")
+        buffer = []
+        for record in records:
+            buffer.append(to_fastq(record))
+            if len(buffer) >= buffer_size:
+                out.write("".join(buffer))
+                buffer.clear()
+        out.write("".join(buffer))
+
+
+def phred_lookup(encoding: str) -> np.ndarray:
+    """
+    Builds a table mapping every quality byte to its PHRED score for the given encoding,
+    Solexa scores are converted to PHRED with 10*log10(10**(Q/10) + 1)
+
+    Args:
+        encoding: The FASTQ encoding method of the phred scores
+                  (options: fastq-sanger, fastq-solexa, fastq-illumina)
+
+    Returns:
+        table: A float64 array of 256 PHRED scores indexed by byte value
+    """
+    scores = np.arange(256, dtype=np.float64) - QUALITY_OFFSETS[encoding]
+    if encoding == "fastq-solexa":
+        scores = 10 * np.log10(10 ** (scores / 10) + 1)
+    return scores
+
+
+class ReadBatch(NamedTuple):
+    """
+    One batch of raw reads laid out for vectorized stages: every sequence and every
+    quality string concatenated into one array, with the start offset of each read
+    """
+    seqs: list  # sequence lines as bytes, without line endings (left empty by filter_table unless adapter clipping runs)
+    bases: np.ndarray  # uint8 array of all sequences back to back
+    cumulative: np.ndarray  # running sum of PHRED scores, with a leading 0
+    starts: np.ndarray  # offset of each read in bases/cumulative
+    lengths: np.ndarray  # untrimmed length of each read
+
+
+def make_read_batch(seqs: list, quals: list, table: np.ndarray) -> ReadBatch:
+    """
+    Lays out a batch of reads for the filter stages
+
+    Args:
+        seqs: A list of sequence lines as bytes, without line endings
+        quals: A list of quality lines as bytes, without line endings
+        table: The byte to PHRED lookup table from phred_lookup()
+
+    Returns:
+        batch: The ReadBatch of the reads
+    """
+    lengths = np.fromiter((len(q) for q in quals), dtype=np.int64, count=len(quals))
+    scores = table[np.frombuffer(b"".join(quals), dtype=np.uint8)]
+    return ReadBatch(
+        seqs=seqs,
+        bases=np.frombuffer(b"".join(seqs), dtype=np.uint8),
+        cumulative=np.concatenate(([0.0], np.cumsum(scores))),
+        starts=np.cumsum(lengths) - lengths,
+        lengths=lengths,
+    )
+
+
+def check_read_lengths(seq_lengths: np.ndarray, qual_lengths: np.ndarray, header):
+    """
+    Raises the ValueError SeqIO raises for the first read whose sequence and quality
+    lengths differ
+
+    Args:
+        seq_lengths: The length of each sequence line
+        qual_lengths: The length of each quality line
+        header: A function of a read's index returning its header line as bytes, `@` included
+
+    Returns:
+    """
+    mismatched = np.flatnonzero(seq_lengths != qual_lengths)
+    if len(mismatched):
+        i = mismatched[0]
+        title = bytes(header(i)).rstrip(b"\r\n")[1:].decode(errors="replace")
+        raise ValueError(
+            f"Lengths of sequence and quality values differs for {title} ({seq_lengths[i]} and {qual_lengths[i]})."
+        )
+
+
+def clip_adapter(batch: ReadBatch, lengths: np.ndarray, adapter: bytes, min_overlap: int) -> np.ndarray:
+    """
+    Trimming stage: cuts each read at the first full copy of the adapter, or at a
+    prefix of the adapter of at least min_overlap bases running off the end of the read.
+    Matching ignores case, soft-masked lowercase bases match too
+
+    Args:
+        batch: The ReadBatch being filtered
+        lengths: The current length of each read
+        adapter: The adapter sequence in upper case
+        min_overlap: The shortest partial adapter that is clipped
+
+    Returns:
+        lengths: The length of each read after clipping
+    """
+    clipped = lengths.copy()
+    for i, seq in enumerate(batch.seqs):
+        seq = seq[:lengths[i]].upper()
+        cut = seq.find(adapter)
+        if cut < 0:
+            for k in range(min(len(adapter) - 1, len(seq)), min_overlap - 1, -1):
+                if seq.endswith(adapter[:k]):
+                    cut = len(seq) - k
+                    break
+        if cut >= 0:
+            clipped[i] = cut
+    return clipped
+
+
+def trim_window(batch: ReadBatch, lengths: np.ndarray, size: int, quality: float) -> np.ndarray:
+    """
+    Trimming stage: cuts each read at the start of the first window of `size` bases
+    whose average PHRED score is below `quality`; every window of the batch is scored
+    at once from the running score sum
+
+    Args:
+        batch: The ReadBatch being filtered
+        lengths: The current length of each read
+        size: The window size in bases
+        quality: The minimum average PHRED score of a window
+
+    Returns:
+        lengths: The length of each read after trimming
+    """
+    n_bases = len(batch.cumulative) - 1
+    if n_bases < size:
+        return lengths
+    window_sums = np.full(n_bases, np.inf)
+    window_sums[:n_bases - size + 1] = batch.cumulative[size:] - batch.cumulative[:-size]
+    read_end = np.repeat(batch.starts + lengths, batch.lengths)
+    low = np.flatnonzero(
+        (window_sums < quality * size) & (np.arange(size, n_bases + size) <= read_end)
+    )
+    # Windows are in read order, so the first low window of each read comes first
+    read = np.searchsorted(batch.starts, low, side="right") - 1
+    first = np.ones(len(read), dtype=bool)
+    first[1:] = read[1:] != read[:-1]
+    trimmed = lengths.copy()
+    trimmed[read[first]] = low[first] - batch.starts[read[first]]
+    return trimmed
+
+
+def check_min_length(batch: ReadBatch, lengths: np.ndarray, min_length: int) -> np.ndarray:
+    """Filter stage: reads at least min_length bases long after trimming"""
+    return lengths >= min_length
+
+
+def check_max_n(batch: ReadBatch, lengths: np.ndarray, max_fraction: float) -> np.ndarray:
+    """Filter stage: reads whose fraction of N bases after trimming is at most max_fraction"""
+    n_cumulative = np.concatenate(([0], np.cumsum((batch.bases | 0x20) == ord("n"))))
+    n_count = n_cumulative[batch.starts + lengths] - n_cumulative[batch.starts]
+    return n_count <= max_fraction * lengths
+
+
+def check_mean_quality(batch: ReadBatch, lengths: np.ndarray, threshold: float) -> np.ndarray:
+    """Filter stage: reads whose average PHRED score after trimming is at least threshold, empty reads fail"""
+    sums = batch.cumulative[batch.starts + lengths] - batch.cumulative[batch.starts]
+    means = np.divide(sums, lengths, out=np.zeros(len(lengths)), where=lengths > 0)
+    return means >= threshold
+
+
+def build_stages(args) -> list[tuple[str, str, partial]]:
+    """
+    Builds the single-pass filter pipeline from the command line options. Trimming
+    stages run first so the filters judge the trimmed reads
+
+    Args:
+        args: The parsed command line arguments
+
+    Returns:
+        stages: A list of (name, kind, function) where kind is "trim" for stages that
+                return new read lengths and "filter" for stages that return a pass mask
+    """
+    stages = []
+    if args.adapter:
+        stages.append(("adapter", "trim", partial(
+            clip_adapter, adapter=args.adapter.upper().encode(), min_overlap=args.adapter_overlap
+        )))
+    if args.window:
+        size, quality = args.window
+        stages.append(("window", "trim", partial(trim_window, size=size, quality=quality)))
+    if args.min_length > 0:
+        stages.append(("min_length", "filter", partial(check_min_length, min_length=args.min_length)))
+    if args.max_n is not None:
+        stages.append(("max_n", "filter", partial(check_max_n, max_fraction=args.max_n)))
+    stages.append(("quality", "filter", partial(check_mean_quality, threshold=args.threshold)))
+    return stages
+
+
+def new_stats(stages: list) -> dict:
+    """Empty run counters with trimmed/dropped counts for every stage"""
+    return {
+        "reads": 0,
+        "passed": 0,
+        "stages": {name: {"trimmed": 0, "dropped": 0} for name, _, _ in stages},
+    }
+
+
+def merge_stats(stats: dict, other: dict):
+    """Adds the counters of other into stats"""
+    stats["reads"] += other["reads"]
+    stats["passed"] += other["passed"]
+    for name, counts in other["stages"].items():
+        for field, count in counts.items():
+            stats["stages"][name][field] += count
+
+
+def read_fastq_batches(handle, batch_size: int):
+    """
+    Reads a binary FASTQ handle in batches of raw 4-line records
+
+    Args:
+        handle: A FASTQ file opened in binary mode
+        batch_size: The number of records per batch
+
+    Yields:
+        batch: A list of raw lines, 4 per record, with line endings kept
+    """
+    while True:
+        lines = list(islice(handle, 4 * batch_size))
+        if not lines:
+            return
+        if len(lines) % 4 or not all(h.startswith(b"@") for h in lines[0::4]) \
+                or not all(p.startswith(b"+") for p in lines[2::4]):
+            raise ValueError("--fast requires unwrapped 4-line FASTQ records")
+        yield lines
+
+
+def fast_filter_fastq(input_file: str, output_file: str, encoding: str, stages: list, stats: dict):
+    """
+    Filters a FASTQ file without building SeqRecords: reads go through the stage pipeline
+    in NumPy batches and passing records are written back from their original bytes, with
+    the same bare `+` separator line that SeqIO.write produces
+
+    Args:
+        input_file: The path to the (optionally gzip compressed) FASTQ file
+        output_file: The path of the output file, paths ending in `.gz` are gzip compressed
+        encoding: The FASTQ encoding method of the phred scores
+                  (options: fastq-sanger, fastq-solexa, fastq-illumina)
+        stages: The filter pipeline from build_stages()
+        stats: A dict from new_stats() whose counters are updated
+
+    Returns:
+    """
+    table = phred_lookup(encoding)
+    try:
+        f = open_fastq(input_file, "rb")
+    except FileNotFoundError:
+        logging.error(f"Could not read {input_file}, terminating program.")
+        sys.exit(1)
+    try:
+        out = open_fastq(output_file, "wb")
+    except FileNotFoundError:
+        logging.info(f"Could not write to {output_file}, writing to {OUTPUT_FILE}")
+        out = open_fastq(OUTPUT_FILE, "wb")
+
+    with f, out:
+        logging.info(f"Fast filtering {input_file} with {encoding} encoding")
+        for lines in read_fastq_batches(f, FAST_BATCH):
+            out.write(filter_batch(lines, table, stages, stats))
+
+
+def filter_batch(lines: list, table: np.ndarray, stages: list, stats: dict) -> bytes:
+    """
+    Runs one batch of raw FASTQ lines through every stage and re-assembles the passing,
+    possibly trimmed, records
+
+    Args:
+        lines: Raw lines from read_fastq_batches(), 4 per record
+        table: The byte to PHRED lookup table from phred_lookup()
+        stages: The filter pipeline from build_stages()
+        stats: A dict from new_stats() whose counters are updated
+
+    Returns:
+        passed_bytes: The passing records as FASTQ bytes
+    """
+    seqs = [s.rstrip(b"\r\n") for s in lines[1::4]]
+    quals = [q.rstrip(b"\r\n") for q in lines[3::4]]
+    batch = make_read_batch(seqs, quals, table)
+    seq_lengths = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+    check_read_lengths(seq_lengths, batch.lengths, lambda i: lines[4 * i])
+    lengths, keep = run_stages(batch, stages, stats)
+    return b"".join(
+        lines[4 * i] + seqs[i][:lengths[i]] + b"\n+\n" + quals[i][:lengths[i]] + b"\n"
+        for i in np.flatnonzero(keep)
+    )
+
+
+def run_stages(batch: ReadBatch, stages: list, stats: dict) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Runs a ReadBatch through every stage. A stage only counts reads still passing when it runs
+
+    Args:
+        batch: The ReadBatch being filtered
+        stages: The filter pipeline from build_stages()
+        stats: A dict from new_stats() whose counters are updated
+
+    Returns:
+        result: (the length of each read after trimming, mask of the reads that passed)
+    """
+    lengths = batch.lengths
+    keep = np.ones(len(lengths), dtype=bool)
+    for name, kind, stage in stages:
+        if kind == "trim":
+            trimmed = stage(batch, lengths)
+            stats["stages"][name]["trimmed"] += int(np.count_nonzero(keep & (trimmed < lengths)))
+            lengths = trimmed
+        else:
+            passing = stage(batch, lengths)
+            stats["stages"][name]["dropped"] += int(np.count_nonzero(keep & ~passing))
+            keep &= passing
+    stats["reads"] += len(lengths)
+    stats["passed"] += int(np.count_nonzero(keep))
+    return lengths, keep
+
+
+def filter_table(records: FastqTable, table: np.ndarray, stages: list, stats: dict) -> bytes:
+    """
+    Runs every record of a seq_reader chunk through the stages. The ReadBatch is built
+    from slices of the chunk located by the FastqTable, so no line is split or decoded,
+    and passing records are joined from slices of the chunk as well
+
+    Args:
+        records: The FastqTable of the chunk
+        table: The byte to PHRED lookup table from phred_lookup()
+        stages: The filter pipeline from build_stages()
+        stats: A dict from new_stats() whose counters are updated
+
+    Returns:
+        passed_bytes: The passing records as FASTQ bytes
+    """
+    data = records.data
+    lengths = records.quality_ends - records.quality_starts
+    check_read_lengths(
+        records.sequence_ends - records.sequence_starts, lengths,
+        lambda i: data[records.header_starts[i]:records.header_ends[i]]
+    )
+    bases = join_ranges(data, records.sequence_starts, records.sequence_ends)
+    scores = table[np.frombuffer(join_ranges(data, records.quality_starts, records.quality_ends), dtype=np.uint8)]
+    starts = np.cumsum(lengths) - lengths
+    seqs = []
+    if any(stage.func is clip_adapter for _, _, stage in stages):
+        seqs = [bases[start:start + length] for start, length in zip(starts.tolist(), lengths.tolist())]
+    batch = ReadBatch(
+        seqs=seqs,
+        bases=np.frombuffer(bases, dtype=np.uint8),
+        cumulative=np.concatenate(([0.0], np.cumsum(scores))),
+        starts=starts,
+        lengths=lengths,
+    )
+    lengths, keep = run_stages(batch, stages, stats)
+    passed = np.flatnonzero(keep)
+    lengths = lengths[passed]
+    header_starts, sequence_starts = records.header_starts[passed], records.sequence_starts[passed]
+    sequence_ends, quality_starts = records.sequence_ends[passed], records.quality_starts[passed]
+    quality_ends = records.quality_ends[passed]
+    array = np.frombuffer(data, dtype=np.uint8)
+    # With `\n` line endings every byte of the output record is already in the chunk: the
+    # `\n+` after the sequence, the `\n` before the quality line and the one after it (or
+    # the one before it again at the end of the file). Touching ranges are merged, so an
+    # untrimmed run of records with bare `+` lines is copied with one slice
+    if (array[sequence_ends] == ord("\n")).all():
+        final_newlines = np.where(quality_ends < len(array), quality_ends, quality_starts - 1)
+        ranges = np.stack((
+            header_starts, sequence_starts + lengths, sequence_ends, sequence_ends + 2,
+            quality_starts - 1, quality_starts + lengths, final_newlines, final_newlines + 1,
+        ), axis=1).reshape(-1, 2)
+        return join_ranges(data, ranges[:, 0], ranges[:, 1])
+    parts = []
+    for header_start, header_end, sequence_start, quality_start, length in zip(
+            header_starts.tolist(), records.header_ends[passed].tolist(),
+            sequence_starts.tolist(), quality_starts.tolist(), lengths.tolist()):
+        parts += (
+            data[header_start:header_end], data[sequence_start:sequence_start + length], b"\n+\n",
+            data[quality_start:quality_start + length], b"\n",
+        )
+    return b"".join(parts)
+
+
+def mapped_filter_fastq(input_file: str, output_file: str, encoding: str, stages: list,
+                        stats: dict, chunk_size: int):
+    """
+    Filters a FASTQ file read through seq_reader: a memory map for plain files, block by
+    block inflation for bgzip and a stream for other gzip files. Output is identical to
+    fast_filter_fastq()
+
+    Args:
+        input_file: The path to the (optionally bgzip or gzip compressed) FASTQ file
+        output_file: The path of the output file, paths ending in `.gz` are gzip compressed
+        encoding: The FASTQ encoding method of the phred scores
+        stages: The filter pipeline from build_stages()
+        stats: A dict from new_stats() whose counters are updated
+        chunk_size: The approximate size of each chunk in bytes
+
+    Returns:
+    """
+    table = phred_lookup(encoding)
+    try:
+        out = open_fastq(output_file, "wb")
+    except FileNotFoundError:
+        logging.info(f"Could not write to {output_file}, writing to {OUTPUT_FILE}")
+        out = open_fastq(OUTPUT_FILE, "wb")
+
+    with out:
+        logging.info(f"Filtering {input_file} through seq_reader with {encoding} encoding")
+        try:
+            for chunk in read_chunks(input_file, "fastq", chunk_size):
+                out.write(filter_table(FastqTable(chunk), table, stages, stats))
+        except FileNotFoundError:
+            logging.error(f"Could not read {input_file}, terminating program.")
+            sys.exit(1)
+
+
+def find_record_start(f, offset: int) -> int:
+    """
+    Finds the first FASTQ record starting at or after a byte offset. A record start is
+    a line beginning with `@` whose next-but-one line begins with `+`, which rules out
+    quality lines that happen to start with `@`
+
+    Args:
+        f: The FASTQ file opened in binary mode
+        offset: The byte offset to search from
+
+    Returns:
+        start: The byte offset of the record, or the file size if there is none
+    """
+    f.seek(offset)
+    if offset:
+        f.readline()  # skip the rest of a partial line
+    position = f.tell()
+    lines = [f.readline() for _ in range(7)]
+    for i in range(4):
+        if lines[i].startswith(b"@") and lines[i + 2].startswith(b"+"):
+            return position
+        position += len(lines[i])
+    return f.seek(0, os.SEEK_END)
+
+
+def chunk_boundaries(input_file: str, chunk_size: int) -> list[tuple[int, int]]:
+    """
+    Splits an uncompressed FASTQ file into record-aligned byte ranges
+
+    Args:
+        input_file: The path to the FASTQ file
+        chunk_size: The approximate size of each range in bytes
+
+    Returns:
+        chunks: A list of (start, end) byte ranges covering the file in order
+    """
+    size = os.path.getsize(input_file)
+    with open(input_file, "rb") as f:
+        starts = sorted({find_record_start(f, offset) for offset in range(0, size, chunk_size)})
+    starts = [start for start in starts if start < size]
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def filter_chunk(input_file: str, start: int, end: int, encoding: str, stages: list) -> tuple[dict, bytes]:
+    """
+    Worker process task: filters the records in one byte range of the input file
+
+    Args:
+        input_file: The path to the uncompressed FASTQ file
+        start: The byte offset of the first record in the range
+        end: The byte offset just past the last record in the range
+        encoding: The FASTQ encoding method of the phred scores
+        stages: The filter pipeline from build_stages()
+
+    Returns:
+        result: (counters from new_stats(), passing records as FASTQ bytes)
+    """
+    table = phred_lookup(encoding)
+    with open(input_file, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    stats = new_stats(stages)
+    chunks = [
+        filter_batch(lines, table, stages, stats)
+        for lines in read_fastq_batches(io.BytesIO(data), FAST_BATCH)
+    ]
+    return stats, b"".join(chunks)
+
+
+def parallel_filter_fastq(input_file: str, output_file: str, encoding: str, stages: list,
+                          stats: dict, workers: int, chunk_size: int, ordered: bool):
+    """
+    Filters an uncompressed FASTQ file in a process pool. At most 2 chunks per worker are
+    in flight so memory stays bounded; results are written in input order unless
+    ordered is False, in which case each chunk is written as soon as it finishes
+
+    Args:
+        input_file: The path to the uncompressed FASTQ file
+        output_file: The path of the output file, paths ending in `.gz` are gzip compressed
+        encoding: The FASTQ encoding method of the phred scores
+        stages: The filter pipeline from build_stages()
+        stats: A dict from new_stats() whose counters are updated
+        workers: The number of worker processes
+        chunk_size: The approximate size of each chunk in bytes
+        ordered: Keep the output in input order
+
+    Returns:
+    """
+    if input_file.endswith(".gz"):
+        logging.warning("Compressed input cannot be split into byte ranges, using a single process")
+        fast_filter_fastq(input_file, output_file, encoding, stages, stats)
+        return
+    try:
+        chunks = chunk_boundaries(input_file, chunk_size)
+    except FileNotFoundError:
+        logging.error(f"Could not read {input_file}, terminating program.")
+        sys.exit(1)
+    try:
+        out = open_fastq(output_file, "wb")
+    except FileNotFoundError:
+        logging.info(f"Could not write to {output_file}, writing to {OUTPUT_FILE}")
+        out = open_fastq(OUTPUT_FILE, "wb")
+
+    def write_result(future):
+        chunk_stats, passed_bytes = future.result()
+        merge_stats(stats, chunk_stats)
+        out.write(passed_bytes)
+
+    logging.info(f"Filtering {len(chunks)} chunks of {input_file} with {workers} workers")
+    with out, ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start, end in chunks:
+            pending.append(pool.submit(filter_chunk, input_file, start, end, encoding, stages))
+            while len(pending) >= 2 * workers:
+                if ordered:
+                    write_result(pending.popleft())
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                        write_result(future)
+        while pending:
+            write_result(pending.popleft())
+
+
+def report_stats(stats: dict, seconds: float):
+    """
+    Prints the number of reads processed, the throughput and the peak resident memory
+    of this process, and of the largest worker process when --workers started any
+
+    Args:
+        stats: A dict with "reads" and "passed" counts, and per-stage counts in fast mode
+        seconds: The wall time of the run
+
+    Returns:
+    """
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is KiB on Linux
+    # RUSAGE_CHILDREN covers the worker processes that have been waited for, its
+    # ru_maxrss is the peak of the largest one rather than their sum
+    worker_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    reads_per_sec = stats["reads"] / seconds if seconds else 0.0
+    workers = f", largest worker {worker_rss_mb:.1f} MB" if worker_rss_mb else ""
+    print(
+        f"Processed {stats['reads']} reads ({stats['passed']} passed) in {seconds:.2f}s: "
+        f"{reads_per_sec:,.0f} reads/sec, peak RSS {peak_rss_mb:.1f} MB{workers}",
+        file=sys.stderr
+    )
+    for name, counts in stats.get("stages", {}).items():
+        print(f"  {name:<12} trimmed {counts['trimmed']:>10}  dropped {counts['dropped']:>10}", file=sys.stderr)
+
+
 def main():
     logging.info("Starting fastq_filter program")
-    reads_filter = load_fastq(args.fastqfile, args.encoding, args.threshold)
-    create_filtered_file(args.output, reads_filter, args.encoding)
+    start = time.perf_counter()
+    stages = build_stages(args)
+    stats = new_stats(stages)
+    cache, key = open_cache(args, "fastq_filter", [args.fastqfile])
+    cached = cache.restore("fastq_filter", key, args.output) if cache else None
+    if cached is not None:
+        logging.info(f"Reused the cached reads of {args.fastqfile}")
+        stats = cached
+    elif args.workers > 1:
+        parallel_filter_fastq(
+            args.fastqfile, args.output, args.encoding, stages, stats,
+            args.workers, args.chunk_size * 1024 * 1024, not args.unordered
+        )
+    elif args.mmap:
+        mapped_filter_fastq(args.fastqfile, args.output, args.encoding, stages, stats, MAP_CHUNK_SIZE)
+    elif args.fast or len(stages) > 1:
+        fast_filter_fastq(args.fastqfile, args.output, args.encoding, stages, stats)
+    elif args.stream:
+        records = stream_fastq(args.fastqfile, args.encoding, args.threshold, stats)
+        write_fastq_stream(args.output, records, args.encoding, args.buffer)
+    else:
+        reads_filter = load_fastq(args.fastqfile, args.encoding, args.threshold, stats)
+        stats["passed"] = len(reads_filter)
+        create_filtered_file(args.output, reads_filter, args.encoding)
+    if len(stages) == 1:
+        # Only the quality filter ran, which the SeqIO modes do not count per stage
+        stats["stages"]["quality"]["dropped"] = stats["reads"] - stats["passed"]
+    if cache and cached is None:
+        cache.store(
+            "fastq_filter", key, args.output, os.path.getsize(args.fastqfile),
+            time.perf_counter() - start, metadata=stats
+        )
+    if args.report:
+        report_stats(stats, time.perf_counter() - start)
     logging.info("Successfully Completed Workflow!")
 
 if __name__ == "__main__":
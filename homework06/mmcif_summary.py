@@ -1,18 +1,29 @@
 #!/usr/bin/env python3
 
-from Bio.PDB.MMCIFParser import MMCIFParser
+from Bio.PDB.MMCIF2Dict import MMCIF2Dict
+from residue_table import ResidueTable
+from result_cache import add_cache_arguments, open_cache
+import numpy as np
 import argparse
 import logging
 import socket
 import sys
 import json
 import os
+import gzip
+import io
+import resource
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 # -------------------------
 # global variables
 # -------------------------
 
 OUTPUT_FILE = "output_mmcif_summary.json"
+BATCH_OUTPUT_FILE = "output_mmcif_summary.jsonl"
+CIF_SUFFIXES = (".cif", ".cif.gz")
 
 # -------------------------
 # arg parser for file names and logging setting
@@ -25,20 +36,56 @@ parser.add_argument(
     default='WARNING',
     help='Set the logging level (default: WARNING)'
 )
-parser.add_argument(
+inputs = parser.add_mutually_exclusive_group(required=True)
+inputs.add_argument(
     '-f', '--mmcif',
     type=str,
-    required=True,
     help='The path to the input mmcif file'
 )
+inputs.add_argument(
+    '-d', '--directory',
+    type=str,
+    help='Batch mode: summarize every .cif/.cif.gz file under this directory'
+)
+inputs.add_argument(
+    '-m', '--manifest',
+    type=str,
+    help='Batch mode: summarize the .cif/.cif.gz files listed in this file, one path per line '
+         '(relative paths are relative to the manifest, # starts a comment)'
+)
 
 parser.add_argument(
     '-o', '--output',
     type=str,
-    default=OUTPUT_FILE,
-    help=f'The path to the output JSON file (default: {OUTPUT_FILE})'
+    help=f'The path to the output JSON file (default: {OUTPUT_FILE}), '
+         f'or JSON Lines file in batch mode (default: {BATCH_OUTPUT_FILE})'
+)
+parser.add_argument(
+    '--fast',
+    action='store_true',
+    help='Tokenize only the _atom_site loop into NumPy columns instead of building the '
+         'dictionary of every mmCIF category (falls back for loops it cannot read)'
 )
+parser.add_argument(
+    '-w', '--workers',
+    type=int,
+    default=os.cpu_count() or 1,
+    help='Batch mode: the number of worker processes (default: the number of CPUs)'
+)
+parser.add_argument(
+    '--unordered',
+    action='store_true',
+    help='Batch mode: write each summary as soon as it is done instead of in input order'
+)
+parser.add_argument(
+    '-r', '--report',
+    action='store_true',
+    help='Print structures processed, structures/sec and peak RSS to stderr when finished'
+)
+add_cache_arguments(parser)
 args = parser.parse_args()
+if args.workers < 1:
+    parser.error("--workers must be at least 1")
 
 format_string = (
     f'[%(asctime)s {socket.gethostname()}] '
@@ -49,35 +96,69 @@ logging.basicConfig(level=args.loglevel, format=format_string)
 # -------------------------
 # Functions
 # -------------------------
-def open_input_file(input_file: str) -> 'Bio.PDB.Structure.Structure':
+def open_input_file(input_file: str, fast: bool = False) -> ResidueTable:
     """
-    Opens the given input mmCIF file and converts it to a Structure class from Bio.PDB.MMCIFParser 
-    via parser.
+    Opens the given input mmCIF file and builds a columnar ResidueTable from its
+    _atom_site loop, ending the process if the file does not exist
 
     Args:
         input_file: str, the input mmCIF file to be summarized
+        fast: bool, read only the _atom_site loop
 
     Returns:
-        structure: Structure, the file formatted by the Bio.PDB.MMCIFParser
+        residue_table: ResidueTable, one row per residue of every model
     """
     logging.debug("About to open main file")
-    parser = MMCIFParser()
     try:
-        with open(input_file, "r") as f:
-            structure = parser.get_structure("", f)
-            logging.info(f"Successfully opened {input_file}")
-        return structure
+        return read_residue_table(input_file, fast)
     except FileNotFoundError:
         logging.error(f"{input_file} not found, ending process")
         sys.exit(1)
 
 
-def parse_file(structure:'Bio.PDB.Structure.Structure')-> list[dict]:
+def read_residue_table(input_file: str, fast: bool = False) -> ResidueTable:
+    """
+    Builds a columnar ResidueTable from the _atom_site loop of an mmCIF file, using the
+    same chain (auth_asym_id), residue number (auth_seq_id) and residue name
+    (label_comp_id) columns as Bio.PDB.MMCIFParser.
+
+    Args:
+        input_file: str, the mmCIF file, gzip compressed if it ends in `.gz`
+        fast: bool, tokenize only the _atom_site loop with ResidueTable.from_mmcif_text
+              instead of parsing every category with MMCIF2Dict
+
+    Returns:
+        residue_table: ResidueTable, one row per residue of every model
+    """
+    opener = gzip.open if input_file.endswith(".gz") else open
+    with opener(input_file, "rt") as f:
+        text = f.read()
+        logging.info(f"Successfully opened {input_file}")
+    if fast:
+        try:
+            return ResidueTable.from_mmcif_text(text)
+        except ValueError as e:
+            logging.info(f"Reading {input_file} with MMCIF2Dict, the _atom_site reader cannot: {e}")
+    mmcif_dict = MMCIF2Dict(io.StringIO(text))
+
+    group_pdb = np.array(mmcif_dict["_atom_site.group_PDB"])
+    n_atoms = len(group_pdb)
+    return ResidueTable.from_atom_columns(
+        model=np.array(mmcif_dict.get("_atom_site.pdbx_PDB_model_num", ["1"] * n_atoms), dtype=int),
+        chain=mmcif_dict["_atom_site.auth_asym_id"],
+        resseq=mmcif_dict["_atom_site.auth_seq_id"],
+        icode=mmcif_dict.get("_atom_site.pdbx_PDB_ins_code", ["?"] * n_atoms),
+        resname=mmcif_dict["_atom_site.label_comp_id"],
+        hetero=group_pdb == "HETATM",
+    )
+
+
+def parse_file(residue_table: ResidueTable)-> list[dict]:
     """
-    Iterates through the MMCIF.Parser and returns a summary about the chains within.
+    Summarizes the chains of every model in the residue table with vectorized counts.
 
     Args:
-        structure: Structure, the file formatted by the Bio.PDB.MMCIFParser
+        residue_table: ResidueTable, the residues of the mmCIF file
 
     Returns:
         summary: list[dict], a list of entries of chain summaries of dicts containing:
@@ -86,38 +167,18 @@ def parse_file(structure:'Bio.PDB.Structure.Structure')-> list[dict]:
             "standard_residues": int
             "hetero_residues": int
     """
-    summary = []
-
     logging.info("Beginning to parse file")
-    for model in structure:
-        for chain in model:
-            new_entry = {"chain_id": None,
-            "total_residues": None,
-            "standard_residues": None,
-            "hetero_residues": None
-            }
-            chain_id = chain.id
-            total_residues = len(chain)
-            res_count = 0
-            hetero_count = 0
-            
-            logging.debug(f"Parsing chain {chain_id}")
-            for residue in chain:
-                id = residue.get_id()
-                hetfield = id[0]
-                if hetfield == " ":
-                    res_count += 1
-                else:
-                    hetero_count += 1
-            logging.debug(f"Finished parsing chain {chain_id}")
-            new_entry["chain_id"] = chain_id
-            new_entry["total_residues"] = total_residues
-            new_entry["standard_residues"] = res_count
-            new_entry["hetero_residues"] = hetero_count
-            summary.append(new_entry)
-    
+    summary = [
+        {
+            "chain_id": entry["chain_id"],
+            "total_residues": entry["total_residues"],
+            "standard_residues": entry["standard_residues"],
+            "hetero_residues": entry["hetero_residues"],
+        }
+        for entry in residue_table.chain_summary()
+    ]
     logging.info(f"Finished parsing with {len(summary)} chains")
-    return summary 
+    return summary
 
 
 def generate_output_file(output_file: str, summary: list[dict]):
@@ -145,11 +206,150 @@ def generate_output_file(output_file: str, summary: list[dict]):
             logging.error(f"Writing to {output_file} failed:\n{e}")
 
 
+def list_input_files(directory: str = None, manifest: str = None) -> list[str]:
+    """
+    Lists the mmCIF files of a batch
+
+    Args:
+        directory: A directory searched recursively for .cif and .cif.gz files
+        manifest: A file listing one mmCIF path per line, blank lines and text after `#`
+                  are ignored and relative paths are taken from the manifest's directory
+
+    Returns:
+        input_files: The paths in sorted (directory) or listed (manifest) order
+    """
+    if directory is not None:
+        if not os.path.isdir(directory):
+            logging.error(f"{directory} is not a directory, ending process")
+            sys.exit(1)
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(directory)
+            for name in names if name.endswith(CIF_SUFFIXES)
+        )
+    try:
+        with open(manifest, "r") as f:
+            lines = [line.split("#", 1)[0].strip() for line in f]
+    except FileNotFoundError:
+        logging.error(f"{manifest} not found, ending process")
+        sys.exit(1)
+    base = os.path.dirname(os.path.abspath(manifest))
+    return [os.path.join(base, line) for line in lines if line]
+
+
+def summarize_file(input_file: str, fast: bool = False) -> dict:
+    """
+    Worker process task: summarizes one mmCIF file. Any error is returned as part of
+    the result instead of being raised, so one bad file does not stop the batch
+
+    Args:
+        input_file: The path to the mmCIF file
+        fast: Read only the _atom_site loop
+
+    Returns:
+        result: {"file": input_file, "chains": [...]} or {"file": input_file, "error": str}
+    """
+    try:
+        return {"file": input_file, "chains": parse_file(read_residue_table(input_file, fast))}
+    except Exception as e:
+        return {"file": input_file, "error": f"{type(e).__name__}: {e}"}
+
+
+def batch_summarize(input_files: list[str], output_file: str, workers: int, ordered: bool,
+                    fast: bool = False) -> tuple[int, int]:
+    """
+    Summarizes many mmCIF files in a process pool and streams one JSON line per file
+    to the output as results arrive. At most 2 files per worker are in flight; results
+    are written in input order unless ordered is False
+
+    Args:
+        input_files: The mmCIF files to summarize
+        output_file: The path of the JSON Lines output file
+        workers: The number of worker processes, 1 summarizes in this process
+        ordered: Keep the output in input order
+        fast: Read only the _atom_site loop of each file
+
+    Returns:
+        counts: (files summarized, files that failed)
+    """
+    failed = 0
+    with open(output_file, "w") as out:
+        def write_result(result: dict):
+            nonlocal failed
+            if "error" in result:
+                failed += 1
+                logging.warning(f"Could not summarize {result['file']}: {result['error']}")
+            out.write(json.dumps(result) + "\n")
+
+        logging.info(f"Summarizing {len(input_files)} files with {workers} workers into {output_file}")
+        if workers == 1:
+            for input_file in input_files:
+                write_result(summarize_file(input_file, fast))
+            return len(input_files), failed
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for input_file in input_files:
+                pending.append(pool.submit(summarize_file, input_file, fast))
+                while len(pending) >= 2 * workers:
+                    if ordered:
+                        write_result(pending.popleft().result())
+                    else:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            pending.remove(future)
+                            write_result(future.result())
+            while pending:
+                write_result(pending.popleft().result())
+    return len(input_files), failed
+
+
+def report_stats(n_files: int, n_failed: int, seconds: float):
+    """Prints the number of structures processed, structures/sec and peak resident memory to stderr"""
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # ru_maxrss is KiB on Linux
+    print(
+        f"Processed {n_files} structures ({n_failed} failed) in {seconds:.2f}s: "
+        f"{n_files / seconds if seconds else 0.0:,.1f} structures/sec, peak RSS {peak_rss_mb:.1f} MB",
+        file=sys.stderr
+    )
+
+
 def main():
     logging.info("Beginning mmCIF Summary workflow")
-    structure = open_input_file(args.mmcif)
-    summary = parse_file(structure)
-    generate_output_file(args.output, summary)
+    start = time.perf_counter()
+    if args.mmcif:
+        output_file = args.output or OUTPUT_FILE
+        cache, key = open_cache(args, "mmcif_summary", [args.mmcif])
+        cached = cache.restore("mmcif_summary", key, output_file) if cache else None
+        if cached is None:
+            residue_table = open_input_file(args.mmcif, args.fast)
+            summary = parse_file(residue_table)
+            generate_output_file(output_file, summary)
+            n_files, n_failed = 1, 0
+    else:
+        output_file = args.output or BATCH_OUTPUT_FILE
+        input_files = list_input_files(args.directory, args.manifest)
+        if not input_files:
+            logging.warning("No mmCIF files to summarize")
+        # Batch output names every file, so the paths are part of the key
+        cache, key = open_cache(args, "mmcif_summary", input_files, {"files": input_files})
+        cached = cache.restore("mmcif_summary", key, output_file) if cache else None
+        if cached is None:
+            n_files, n_failed = batch_summarize(
+                input_files, output_file, args.workers, not args.unordered, args.fast
+            )
+            logging.info(f"Summarized {n_files - n_failed} of {n_files} files")
+    if cached is not None:
+        logging.info(f"Reused the cached summary in {output_file}")
+        n_files, n_failed = cached["files"], cached["failed"]
+    elif cache:
+        input_bytes = sum(os.path.getsize(path) for path in ([args.mmcif] if args.mmcif else input_files))
+        cache.store(
+            "mmcif_summary", key, output_file, input_bytes, time.perf_counter() - start,
+            metadata={"files": n_files, "failed": n_failed}
+        )
+    if args.report:
+        report_stats(n_files, n_failed, time.perf_counter() - start)
     logging.info("mmCIF Summary workflow is complete!")
 
 
@@ -0,0 +1,273 @@
+import re
+from collections import Counter
+
+import numpy as np
+
+# Standard amino acids (3-letter codes)
+STANDARD_AA = {
+    'ALA', 'CYS', 'ASP', 'GLU', 'PHE', 'GLY', 'HIS', 'ILE', 'LYS', 'LEU',
+    'MET', 'ASN', 'PRO', 'GLN', 'ARG', 'SER', 'THR', 'VAL', 'TRP', 'TYR'
+}
+
+# Fixed column ranges of PDB ATOM/HETATM records (0-based, end exclusive)
+PDB_RECORD = (0, 6)
+PDB_RESNAME = (17, 20)
+PDB_CHAIN = (21, 22)
+PDB_RESSEQ = (22, 26)
+PDB_ICODE = (26, 27)
+PDB_LINE_WIDTH = 80
+
+# mmCIF: a quoted value only ends at a quote followed by whitespace
+MMCIF_TOKEN = re.compile(r"""'(?:[^']|'(?=\S))*'(?=\s)|"(?:[^"]|"(?=\S))*"(?=\s)|\S+""")
+MMCIF_LOOP_END = re.compile(r"^(?:#|loop_|_|data_|;)", re.MULTILINE)
+
+
+class ResidueTable:
+    """
+    Columnar (NumPy) table with one row per residue of a structure.
+
+    Columns are `model`, `chain`, `resname`, `hetero` (HETATM residue) and
+    `n_atoms`, all 1-D arrays of equal length in file order. The table is built
+    once from per-atom columns, after which composition, hetero and atom counts
+    for any model/chain grouping are computed with array operations instead of
+    walking Model/Chain/Residue objects.
+    """
+
+    def __init__(self, model, chain, resname, hetero, n_atoms):
+        self.model = model
+        self.chain = chain
+        self.resname = resname
+        self.hetero = hetero
+        self.n_atoms = n_atoms
+
+    def __len__(self):
+        return len(self.resname)
+
+    @classmethod
+    def from_atom_columns(cls, model, chain, resseq, icode, resname, hetero):
+        """
+        Collapse per-atom columns into a residue table.
+
+        Args:
+            model, chain, resseq, icode, resname, hetero: per-atom 1-D arrays
+                (hetero is True for HETATM records)
+
+        Returns:
+            table: ResidueTable, a residue starts wherever model, chain, residue
+                   number, insertion code or record type changes between atoms
+        """
+        model = np.asarray(model)
+        chain = np.asarray(chain)
+        resseq = np.asarray(resseq)
+        icode = np.asarray(icode)
+        resname = np.asarray(resname)
+        hetero = np.asarray(hetero, dtype=bool)
+
+        n = len(resname)
+        if n == 0:
+            empty = np.array([], dtype=str)
+            return cls(np.array([], dtype=int), empty, empty, np.array([], dtype=bool),
+                       np.array([], dtype=int))
+
+        starts = np.ones(n, dtype=bool)
+        starts[1:] = (
+            (model[1:] != model[:-1]) | (chain[1:] != chain[:-1])
+            | (resseq[1:] != resseq[:-1]) | (icode[1:] != icode[:-1])
+            | (hetero[1:] != hetero[:-1])
+        )
+        first_atom = np.flatnonzero(starts)
+        n_atoms = np.diff(np.append(first_atom, n))
+        return cls(model[first_atom], chain[first_atom], resname[first_atom],
+                   hetero[first_atom], n_atoms)
+
+    @classmethod
+    def from_pdb_text(cls, text):
+        """
+        Build a residue table straight from PDB file text.
+
+        Record type, residue name, chain, residue number and insertion code are
+        sliced out of the fixed-width ATOM/HETATM lines as byte columns of one
+        NumPy buffer; model numbers come from a running count of MODEL records.
+
+        Args:
+            text: str, the full contents of a PDB file
+
+        Returns:
+            table: ResidueTable covering every model in the file
+        """
+        raw = text.encode('latin-1')
+        # Pad so fixed-width slices of a short last line stay inside the buffer
+        buf = np.frombuffer(raw + b' ' * PDB_LINE_WIDTH, dtype=np.uint8)
+        line_starts = np.concatenate(([0], np.flatnonzero(buf[:len(raw)] == ord('\n')) + 1))
+        line_starts = line_starts[line_starts < len(raw)]
+
+        record = _pdb_column(buf, line_starts, PDB_RECORD)
+        is_model = record == b'MODEL '
+        is_atom = (record == b'ATOM  ') | (record == b'HETATM')
+        model = np.maximum(np.cumsum(is_model), 1)[is_atom]
+
+        atom_starts = line_starts[is_atom]
+        return cls.from_atom_columns(
+            model,
+            _pdb_column(buf, atom_starts, PDB_CHAIN).astype('U'),
+            _pdb_column(buf, atom_starts, PDB_RESSEQ),
+            _pdb_column(buf, atom_starts, PDB_ICODE),
+            np.char.strip(_pdb_column(buf, atom_starts, PDB_RESNAME).astype('U')),
+            record[is_atom] == b'HETATM',
+        )
+
+    @classmethod
+    def from_mmcif_text(cls, text):
+        """
+        Build a residue table from mmCIF file text by tokenizing only the
+        `_atom_site` loop, without building the dictionary of every category.
+
+        Uses the same columns as Bio.PDB.MMCIFParser: chain (auth_asym_id),
+        residue number (auth_seq_id), insertion code, residue name
+        (label_comp_id), record type (group_PDB) and model number.
+
+        Args:
+            text: str, the full contents of an mmCIF file
+
+        Returns:
+            table: ResidueTable covering every model in the file
+
+        Raises:
+            ValueError: if `_atom_site` is not a plain loop (e.g. it has
+                multi-line text fields), which this reader does not handle
+            KeyError: if a required `_atom_site` column is missing
+        """
+        columns = _mmcif_atom_site(text)
+        n_atoms = len(columns['group_PDB'])
+        return cls.from_atom_columns(
+            model=np.array(columns.get('pdbx_PDB_model_num', ['1'] * n_atoms), dtype=int),
+            chain=columns['auth_asym_id'],
+            resseq=columns['auth_seq_id'],
+            icode=columns.get('pdbx_PDB_ins_code', ['?'] * n_atoms),
+            resname=columns['label_comp_id'],
+            hetero=np.asarray(columns['group_PDB']) == 'HETATM',
+        )
+
+    def _groups(self):
+        """Indices of the (model, chain) group of every residue, groups in order of first appearance"""
+        keys = np.empty(len(self), dtype=[('model', self.model.dtype), ('chain', self.chain.dtype)])
+        keys['model'] = self.model
+        keys['chain'] = self.chain
+        unique_keys, first_index, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        order = np.argsort(first_index, kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        return unique_keys[order], rank[inverse.ravel()]
+
+    def chain_summary(self):
+        """
+        Residue and atom counts for every chain of every model.
+
+        Returns:
+            summary: list[dict], one entry per (model, chain) in file order containing:
+                "model": int
+                "chain_id": str
+                "total_residues": int
+                "standard_residues": int
+                "hetero_residues": int
+                "atoms": int
+        """
+        groups, group_index = self._groups()
+        n_groups = len(groups)
+        total = np.bincount(group_index, minlength=n_groups)
+        hetero = np.bincount(group_index, weights=self.hetero, minlength=n_groups)
+        atoms = np.bincount(group_index, weights=self.n_atoms, minlength=n_groups)
+
+        return [
+            {
+                "model": int(groups['model'][i]),
+                "chain_id": str(groups['chain'][i]),
+                "total_residues": int(total[i]),
+                "standard_residues": int(total[i] - hetero[i]),
+                "hetero_residues": int(hetero[i]),
+                "atoms": int(atoms[i]),
+            }
+            for i in range(n_groups)
+        ]
+
+    def composition(self, standard_only=True):
+        """
+        Residue name counts for every chain of every model.
+
+        Args:
+            standard_only: only count the 20 standard amino acids
+
+        Returns:
+            composition: dict mapping (model, chain_id) to a Counter of residue names
+        """
+        groups, group_index = self._groups()
+        mask = np.isin(self.resname, list(STANDARD_AA)) if standard_only else np.ones(len(self), bool)
+        names, name_index = np.unique(self.resname[mask], return_inverse=True)
+
+        # Count matrix of (model, chain) groups x residue names in one bincount
+        flat = group_index[mask] * len(names) + name_index.ravel()
+        counts = np.bincount(flat, minlength=len(groups) * len(names)).reshape(len(groups), len(names))
+
+        composition = {}
+        for i, group in enumerate(groups):
+            nonzero = np.flatnonzero(counts[i])
+            composition[(int(group['model']), str(group['chain']))] = Counter(
+                {str(names[j]): int(counts[i, j]) for j in nonzero}
+            )
+        return composition
+
+    def residue_counts(self, standard_only=True):
+        """
+        Residue name counts over the whole structure (every model and chain).
+
+        Args:
+            standard_only: only count the 20 standard amino acids
+
+        Returns:
+            counts: Counter of residue names
+        """
+        resname = self.resname
+        if standard_only:
+            resname = resname[np.isin(resname, list(STANDARD_AA))]
+        names, counts = np.unique(resname, return_counts=True)
+        return Counter(dict(zip(names.tolist(), counts.tolist())))
+
+
+def _mmcif_atom_site(text):
+    """
+    Column name -> list of values of the `_atom_site` loop of mmCIF text.
+
+    Values are split on whitespace in one call, or with MMCIF_TOKEN when the
+    loop has quoted values, and each column is a strided slice of the tokens.
+    """
+    tag = text.find('\n_atom_site.')
+    if tag < 0 or text[text.rfind('\n', 0, tag) + 1:tag].strip() != 'loop_':
+        raise ValueError('no _atom_site loop')
+    names = []
+    pos = tag + 1
+    while text.startswith('_atom_site.', pos):
+        end = text.find('\n', pos)
+        names.append(text[pos + len('_atom_site.'):end].strip())
+        pos = end + 1
+    end = MMCIF_LOOP_END.search(text, pos)
+    if end is not None and text[end.start()] == ';':
+        raise ValueError('multi-line text field in the _atom_site loop')
+    body = text[pos:end.start() if end else len(text)]
+    if "'" in body or '"' in body:
+        tokens = [
+            token[1:-1] if token[0] in '\'"' and len(token) > 1 else token
+            for token in MMCIF_TOKEN.findall(body + '\n')
+        ]
+    else:
+        tokens = body.split()
+    if len(tokens) % len(names):
+        raise ValueError('_atom_site loop has an incomplete row')
+    return {name: tokens[i::len(names)] for i, name in enumerate(names)}
+
+
+def _pdb_column(buf, line_starts, columns):
+    """Fixed-width byte column [start, end) of the lines beginning at line_starts"""
+    start, end = columns
+    width = end - start
+    index = line_starts[:, None] + np.arange(start, end)
+    return np.ascontiguousarray(buf[index]).view(f'S{width}').ravel()
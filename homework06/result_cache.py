@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import sys
+import time
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "hw06")
+MAX_SIZE = 1024  # MB of cached output kept before the least recently used is evicted
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Arguments that only change how a tool runs or reports, never the bytes it writes
+NOT_OUTPUT_ARGS = {
+    "loglevel", "output", "report", "no_cache", "cache_dir",
+    "workers", "chunk_size", "block_size", "buffer",
+}
+# Arguments naming input files, which are keyed by their contents instead
+INPUT_ARGS = {"fastafile", "fastqfile", "ids", "mmcif", "directory", "manifest"}
+MB = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY, tool TEXT, size INTEGER, input_bytes INTEGER,
+    seconds REAL, metadata TEXT, last_used REAL
+);
+CREATE TABLE IF NOT EXISTS digests (
+    path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, digest TEXT
+);
+CREATE TABLE IF NOT EXISTS counters (
+    tool TEXT PRIMARY KEY, hits INTEGER, misses INTEGER, bytes_saved INTEGER, seconds_saved REAL
+);
+CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT);
+"""
+
+# -------------------------
+# Arg Parser
+# -------------------------
+parser = argparse.ArgumentParser(description='Shows and manages the result cache of the homework06 tools')
+parser.add_argument(
+    '-l', '--loglevel',
+    required=False,
+    choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+    default='WARNING',
+    help='Set the logging level (default: WARNING)'
+)
+parser.add_argument(
+    '--cache-dir',
+    type=str,
+    default=CACHE_DIR,
+    help=f'The cache directory (default: {CACHE_DIR})'
+)
+subparsers = parser.add_subparsers(dest='command', required=True)
+subparsers.add_parser('stats', help='Entries, size, hit rate and input bytes saved per tool')
+subparsers.add_parser('clear', help='Delete every cached output and reset the counters')
+limit_parser = subparsers.add_parser('limit', help='Set the size limit of the cache')
+limit_parser.add_argument(
+    'size',
+    type=int,
+    help='The most MB of output to keep, least recently used entries are evicted first'
+)
+
+format_string = (
+    f'[%(asctime)s {socket.gethostname()}] '
+    '%(module)s.%(funcName)s:%(lineno)s - %(levelname)s - %(message)s'
+)
+
+
+# -------------------------
+# Functions
+# -------------------------
+def add_cache_arguments(tool_parser: argparse.ArgumentParser):
+    """Adds --no-cache and --cache-dir to the parser of a tool"""
+    tool_parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Neither reuse nor store a cached output'
+    )
+    tool_parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=CACHE_DIR,
+        help=f'The result cache directory (default: {CACHE_DIR})'
+    )
+
+
+def file_digest(path: str) -> str:
+    """The SHA-256 of the contents of a file"""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def copy_file(src: str, dst: str):
+    """Copies src next to dst and renames it into place, so no reader sees a partial file"""
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class ResultCache:
+    """
+    Output files of the homework06 tools keyed by the SHA-256 of their inputs, the
+    tool's own source and its output-affecting arguments. Outputs are copies under
+    objects/, an SQLite index keeps their size and last use for LRU eviction, the
+    digests of inputs whose size, mtime and inode have not changed, and per-tool
+    hit and miss counters
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=30)
+        with self.db:
+            self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def object_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "objects", key[:2], key)
+
+    def digest(self, path: str) -> str:
+        """
+        The content digest of a file, rehashed only when its size, mtime or inode
+        differ from the last time it was hashed
+        """
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        row = self.db.execute(
+            "SELECT digest FROM digests WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+            (path, st.st_size, st.st_mtime_ns, st.st_ino)
+        ).fetchone()
+        if row:
+            return row[0]
+        digest = file_digest(path)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, st.st_ino, digest)
+            )
+        return digest
+
+    def make_key(self, tool: str, input_files: list[str], params: dict) -> str:
+        """
+        The cache key of a run
+
+        Args:
+            tool: The name of the tool
+            input_files: Every file the output is computed from
+            params: The output-affecting arguments, JSON serializable
+
+        Returns:
+            key: A hex SHA-256
+
+        Raises:
+            OSError: If an input file cannot be read
+        """
+        sources = sorted(name for name in os.listdir(HERE) if name.endswith(".py"))
+        description = {
+            "tool": tool,
+            "inputs": [self.digest(path) for path in input_files],
+            "sources": [self.digest(os.path.join(HERE, name)) for name in sources],
+            "params": params,
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def count(self, tool: str, hit: bool, bytes_saved: int = 0, seconds_saved: float = 0.0):
+        self.db.execute("INSERT OR IGNORE INTO counters VALUES (?, 0, 0, 0, 0.0)", (tool,))
+        self.db.execute(
+            "UPDATE counters SET hits = hits + ?, misses = misses + ?, bytes_saved = bytes_saved + ?, "
+            "seconds_saved = seconds_saved + ? WHERE tool = ?",
+            (int(hit), int(not hit), bytes_saved, seconds_saved, tool)
+        )
+
+    def restore(self, tool: str, key: str, output_file: str) -> dict:
+        """
+        Copies the cached output of a run to output_file. An output_file that cannot be
+        written, e.g. in a directory that does not exist, counts as a miss, so the tool runs
+        and reports the problem the way it does without the cache
+
+        Args:
+            tool: The name of the tool, for the counters
+            key: The key from make_key()
+            output_file: Where the output is written
+
+        Returns:
+            metadata: The dict stored with the output, or None on a miss
+        """
+        row = self.db.execute(
+            "SELECT input_bytes, seconds, metadata FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row and not os.path.exists(self.object_path(key)):
+            with self.db:
+                self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            row = None
+        if row is not None:
+            try:
+                copy_file(self.object_path(key), output_file)
+            except OSError as e:
+                logging.warning(f"Could not restore the cached output to {output_file}: {e}")
+                row = None
+        with self.db:
+            self.count(tool, row is not None, *(row[:2] if row else ()))
+            if row is None:
+                return None
+            self.db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[2])
+
+    def store(self, tool: str, key: str, output_file: str, input_bytes: int, seconds: float,
+              metadata: dict = None):
+        """
+        Adds the output of a run to the cache, then evicts least recently used entries
+        until the cache fits its size limit. Nothing is stored when output_file is larger
+        than the limit, which would only evict it again, or cannot be read, e.g. when the
+        tool fell back to its default output because the directory of output_file does
+        not exist
+
+        Args:
+            tool: The name of the tool
+            key: The key from make_key()
+            output_file: The output the run wrote
+            input_bytes: The size of the inputs, counted as saved on every hit
+            seconds: The wall time of the run, counted as saved on every hit
+            metadata: A JSON serializable dict returned by restore(), e.g. run counters
+        """
+        try:
+            size = os.path.getsize(output_file)
+        except OSError as e:
+            logging.warning(f"Could not cache the output {output_file}: {e}")
+            return
+        if size > self.limit():
+            logging.info(f"Not caching {output_file}, its {size / MB:.1f} MB are over the cache size limit")
+            return
+        path = self.object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            copy_file(output_file, path)
+        except OSError as e:
+            logging.warning(f"Could not cache the output {output_file}: {e}")
+            return
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, tool, os.path.getsize(path), input_bytes, seconds,
+                 json.dumps(metadata or {}), time.time())
+            )
+        self.evict()
+
+    def limit(self) -> int:
+        """The size limit in bytes"""
+        row = self.db.execute("SELECT value FROM settings WHERE name = 'max_size'").fetchone()
+        return int(row[0]) if row else MAX_SIZE * MB
+
+    def set_limit(self, max_bytes: int):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO settings VALUES ('max_size', ?)", (str(max_bytes),))
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cached outputs fit the size limit"""
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        limit = self.limit()
+        if total <= limit:
+            return
+        rows = self.db.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= limit:
+                break
+            evicted.append(key)
+            total -= size
+        with self.db:
+            self.db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in evicted])
+        for key in evicted:
+            try:
+                os.remove(self.object_path(key))
+            except FileNotFoundError:
+                pass
+        logging.info(f"Evicted {len(evicted)} cached outputs")
+
+    def clear(self):
+        """Deletes every entry and resets the counters, the size limit is kept"""
+        with self.db:
+            self.db.execute("DELETE FROM entries")
+            self.db.execute("DELETE FROM digests")
+            self.db.execute("DELETE FROM counters")
+        shutil.rmtree(os.path.join(self.cache_dir, "objects"))
+        os.makedirs(os.path.join(self.cache_dir, "objects"))
+
+    def stats(self) -> dict:
+        """Entries, size and limit of the cache, and the counters of every tool"""
+        entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        tools = {
+            tool: {"hits": hits, "misses": misses, "bytes_saved": bytes_saved, "seconds_saved": seconds_saved}
+            for tool, hits, misses, bytes_saved, seconds_saved
+            in self.db.execute("SELECT * FROM counters ORDER BY tool")
+        }
+        return {"entries": entries, "size": size, "limit": self.limit(), "tools": tools}
+
+
+def open_cache(args, tool: str, input_files: list[str], params: dict = None):
+    """
+    Opens the cache for one run of a tool, unless --no-cache was given
+
+    Args:
+        args: The parsed arguments of the tool, see add_cache_arguments()
+        tool: The name of the tool
+        input_files: Every file the output is computed from
+        params: Extra key fields, added to the arguments not in NOT_OUTPUT_ARGS or INPUT_ARGS
+
+    Returns:
+        cache: The ResultCache, or None if the run is not cached
+        key: The key of the run
+    """
+    if args.no_cache:
+        return None, None
+    params = {
+        **{name: value for name, value in vars(args).items() if name not in NOT_OUTPUT_ARGS | INPUT_ARGS},
+        **(params or {}),
+    }
+    try:
+        cache = ResultCache(args.cache_dir)
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"Result cache {args.cache_dir} is unavailable, running without it: {e}")
+        return None, None
+    try:
+        return cache, cache.make_key(tool, input_files, params)
+    except OSError:
+        # Let the tool report the unreadable input
+        cache.close()
+        return None, None
+
+
+def print_stats(stats: dict, cache_dir: str):
+    """Prints the size of the cache, then the counters of every tool and their totals"""
+    print(f"Cache {cache_dir}: {stats['entries']} entries, "
+          f"{stats['size'] / MB:.1f} MB of {stats['limit'] / MB:.1f} MB")
+    rows = list(stats["tools"].items())
+    if len(rows) > 1:
+        rows.append(("total", {field: sum(counts[field] for _, counts in rows) for field in rows[0][1]}))
+    print(f"{'tool':<16}{'hits':>8}{'misses':>8}{'hit rate':>10}{'MB saved':>12}{'s saved':>10}")
+    for tool, counts in rows:
+        runs = counts["hits"] + counts["misses"]
+        print(f"{tool:<16}{counts['hits']:>8}{counts['misses']:>8}"
+              f"{counts['hits'] / runs if runs else 0.0:>10.1%}"
+              f"{counts['bytes_saved'] / MB:>12.1f}{counts['seconds_saved']:>10.2f}")
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=args.loglevel, format=format_string)
+    try:
+        cache = ResultCache(args.cache_dir)
+    except (OSError, sqlite3.Error) as e:
+        logging.error(f"Could not open the cache in {args.cache_dir}: {e}")
+        sys.exit(1)
+    if args.command == "stats":
+        print_stats(cache.stats(), args.cache_dir)
+    elif args.command == "clear":
+        cache.clear()
+        print(f"Cleared {args.cache_dir}")
+    elif args.command == "limit":
+        if args.size < 0:
+            parser.error("size must not be negative")
+        cache.set_limit(args.size * MB)
+        print_stats(cache.stats(), args.cache_dir)
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
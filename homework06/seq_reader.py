@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+import gzip
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+
+CHUNK_SIZE = 8 * 1024 * 1024  # bytes per chunk handed to a tool
+GZIP_READ_SIZE = 1024 * 1024  # bytes decompressed per read from a plain gzip file
+GZIP_MAGIC = b"\x1f\x8b"
+BGZF_HEADER = struct.Struct("<4s6xH")  # magic, method and flags; XLEN
+BGZF_TRAILER = struct.Struct("<II")  # CRC32, uncompressed size
+
+
+# -------------------------
+# Chunk readers
+# -------------------------
+def is_bgzf(path: str) -> bool:
+    """True if the file starts with a BGZF block (a gzip member with the `BC` extra field)"""
+    with open(path, "rb") as f:
+        header = f.read(18)
+    return len(header) == 18 and header[:4] == b"\x1f\x8b\x08\x04" and header[12:14] == b"BC"
+
+
+def bgzf_blocks(f):
+    """
+    Decompresses a BGZF (bgzip) file block by block. Every block is a complete deflate
+    stream of at most 64 KB, so each is inflated with a single zlib call
+
+    Args:
+        f: The BGZF file opened in binary mode
+
+    Yields:
+        data: The uncompressed bytes of each non-empty block
+
+    Raises:
+        ValueError: If a block is not BGZF or fails its CRC check
+    """
+    while header := f.read(BGZF_HEADER.size):
+        if len(header) < BGZF_HEADER.size or header[:4] != b"\x1f\x8b\x08\x04":
+            raise ValueError("Not a BGZF block, the file is truncated or not bgzip compressed")
+        _, xlen = BGZF_HEADER.unpack(header)
+        extra = f.read(xlen)
+        block_size = None
+        pos = 0
+        while pos + 4 <= len(extra):
+            length = struct.unpack_from("<H", extra, pos + 2)[0]
+            if extra[pos:pos + 2] == b"BC" and length == 2:
+                block_size = struct.unpack_from("<H", extra, pos + 4)[0] + 1
+            pos += 4 + length
+        if block_size is None:
+            raise ValueError("BGZF block without a BC block size field")
+        body = f.read(block_size - BGZF_HEADER.size - xlen)
+        crc, size = BGZF_TRAILER.unpack(body[-BGZF_TRAILER.size:])
+        data = zlib.decompress(body[:-BGZF_TRAILER.size], -15)
+        if len(data) != size or zlib.crc32(data) != crc:
+            raise ValueError("BGZF block failed its CRC check")
+        if data:
+            yield data
+
+
+def gzip_blocks(f):
+    """Decompresses a plain gzip file, which cannot be split into blocks, in GZIP_READ_SIZE pieces"""
+    with gzip.GzipFile(fileobj=f) as gz:
+        yield from iter(lambda: gz.read(GZIP_READ_SIZE), b"")
+
+
+def record_start(data, pos: int, fmt: str) -> int:
+    """
+    Finds the first record starting at or after pos. FASTA records start at a line
+    beginning with `>`; FASTQ records at a line beginning with `@` whose next-but-one
+    line begins with `+`, which rules out quality lines that happen to start with `@`
+
+    Args:
+        data: The bytes (or mmap) to search, pos must be at least 1
+        pos: The offset to search from
+        fmt: "fasta" or "fastq"
+
+    Returns:
+        start: The offset of the record, or -1 if there is no complete one
+    """
+    if fmt == "fasta":
+        found = data.find(b"\n>", pos - 1)
+        return found + 1 if found >= 0 else -1
+    line = data.find(b"\n", pos - 1)
+    starts = []
+    while line >= 0 and len(starts) < 7:
+        starts.append(line + 1)
+        line = data.find(b"\n", line + 1)
+    for i in range(len(starts) - 2):
+        if data[starts[i]:starts[i] + 1] == b"@" and data[starts[i + 2]:starts[i + 2] + 1] == b"+":
+            return starts[i]
+    return -1
+
+
+def mapped_chunks(path: str, fmt: str, chunk_size: int):
+    """
+    Yields record-aligned views of an uncompressed file through one read-only mmap. The
+    views are slices of the mapping, so nothing is copied into Python, and pages already
+    handed out are given back to the kernel so RSS does not grow with the file
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # The mapping is closed when the last view of it is garbage collected
+    view = memoryview(mm)
+    pos, released = 0, 0
+    while pos < size:
+        end = record_start(mm, pos + chunk_size, fmt) if pos + chunk_size < size else -1
+        end = size if end < 0 else end
+        yield view[pos:end]
+        pos = end
+        if hasattr(mmap, "MADV_DONTNEED") and pos - pos % mmap.PAGESIZE > released:
+            release_end = pos - pos % mmap.PAGESIZE
+            mm.madvise(mmap.MADV_DONTNEED, released, release_end - released)
+            released = release_end
+
+
+def stream_chunks(blocks, fmt: str, chunk_size: int):
+    """
+    Joins decompressed blocks into record-aligned chunks, only the partial record at the
+    end of each chunk is copied into the next one
+    """
+    pending, pending_size, target = [], 0, chunk_size
+    for block in blocks:
+        pending.append(block)
+        pending_size += len(block)
+        if pending_size < target:
+            continue
+        data = b"".join(pending)
+        end = record_start(data, chunk_size, fmt)
+        if end < 0:
+            # A record longer than the chunk, wait for twice as much data before joining again
+            pending, target = [data], 2 * len(data)
+            continue
+        yield memoryview(data)[:end]
+        pending, pending_size, target = [data[end:]], len(data) - end, chunk_size
+    data = b"".join(pending)
+    if data:
+        yield memoryview(data)
+
+
+def read_chunks(path: str, fmt: str, chunk_size: int = CHUNK_SIZE):
+    """
+    Reads a FASTA or FASTQ file as memoryview chunks of roughly chunk_size bytes, each
+    holding only complete records. Plain files are memory mapped; BGZF (bgzip) files are
+    inflated block by block and other gzip files as a stream. A chunk is only valid until
+    the next one is requested
+
+    Args:
+        path: The path to the file
+        fmt: "fasta" or "fastq"
+        chunk_size: The approximate number of (uncompressed) bytes per chunk
+
+    Yields:
+        chunk: A memoryview of whole records
+    """
+    with open(path, "rb") as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    if not compressed:
+        yield from mapped_chunks(path, fmt, chunk_size)
+        return
+    with open(path, "rb") as f:
+        blocks = bgzf_blocks(f) if is_bgzf(path) else gzip_blocks(f)
+        yield from stream_chunks(blocks, fmt, chunk_size)
+
+
+# -------------------------
+# Record tables
+# -------------------------
+def line_offsets(data: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The start of every line and the end of its text (before `\\n` or `\\r\\n`)
+
+    Args:
+        data: A uint8 array of the chunk
+
+    Returns:
+        offsets: (line starts, line text ends)
+    """
+    newlines = np.flatnonzero(data == ord("\n"))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.append(newlines, len(data))
+    if starts[-1] == len(data):
+        starts, ends = starts[:-1], ends[:-1]
+    crlf = ends > starts
+    crlf[crlf] = data[ends[crlf] - 1] == ord("\r")
+    return starts, ends - crlf
+
+
+def join_ranges(data, starts: np.ndarray, ends: np.ndarray) -> bytes:
+    """
+    The bytes of the given ranges of data back to back. Ranges that touch are merged
+    first, so a run of them is copied with one slice of the memoryview
+
+    Args:
+        data: The chunk
+        starts: The start offset of each range
+        ends: The end offset of each range
+
+    Returns:
+        joined: The bytes of the ranges in order
+    """
+    if not len(starts):
+        return b""
+    breaks = starts[1:] != ends[:-1]
+    starts = starts[np.concatenate(([True], breaks))]
+    ends = ends[np.concatenate((breaks, [True]))]
+    return b"".join([data[start:end] for start, end in zip(starts.tolist(), ends.tolist())])
+
+
+class FastaTable:
+    """
+    The records of one chunk as columns of offsets into it, so tools can find, measure
+    and slice every record without a Python loop over lines. Record i runs from
+    header_starts[i] to record_ends[i]; its sequence lines from sequence_starts[i]
+    """
+
+    def __init__(self, chunk: memoryview):
+        self.data = chunk
+        array = np.frombuffer(chunk, dtype=np.uint8)
+        newlines = np.flatnonzero(array == ord("\n"))
+        headers = np.flatnonzero(array == ord(">"))
+        # Only a `>` at the start of a line begins a record, bytes before the first are skipped
+        headers = headers[(headers == 0) | (array[headers - 1] == ord("\n"))]
+        header_lines = np.searchsorted(newlines, headers)
+        self.header_starts = headers
+        self.sequence_starts = np.append(newlines, len(array) - 1)[header_lines] + 1
+        self.record_ends = np.append(headers[1:], len(array))
+        self.lengths = self.record_ends - self.sequence_starts - (
+            np.searchsorted(newlines, self.record_ends) - np.searchsorted(newlines, self.sequence_starts)
+        )
+        returns = newlines[newlines > 0] - 1
+        returns = returns[array[returns] == ord("\r")]
+        if len(returns):
+            self.lengths -= (
+                np.searchsorted(returns, self.record_ends) - np.searchsorted(returns, self.sequence_starts)
+            )
+
+    def __len__(self):
+        return len(self.header_starts)
+
+    def header(self, i: int) -> bytes:
+        """The header of record i without the `>` and line ending"""
+        return bytes(self.data[self.header_starts[i] + 1:self.sequence_starts[i]]).rstrip(b"\r\n")
+
+    def sequence(self, i: int) -> memoryview:
+        """The sequence lines of record i, line endings included"""
+        return self.data[self.sequence_starts[i]:self.record_ends[i]]
+
+    def record(self, i: int) -> memoryview:
+        """The bytes of record i exactly as in the file"""
+        return self.data[self.header_starts[i]:self.record_ends[i]]
+
+    def header_lines(self) -> bytes:
+        """Every header line, `>` and line ending included, back to back"""
+        return join_ranges(self.data, self.header_starts, self.sequence_starts)
+
+
+class FastqTable:
+    """
+    The records of one chunk of 4-line FASTQ as columns of offsets into it. Line ends
+    exclude the line ending, so sequence and quality lengths are end - start
+
+    Raises:
+        ValueError: If the chunk is not unwrapped 4-line FASTQ
+    """
+
+    def __init__(self, chunk: memoryview):
+        self.data = chunk
+        array = np.frombuffer(chunk, dtype=np.uint8)
+        starts, ends = line_offsets(array)
+        if len(starts) % 4 or (len(starts) and (
+                (array[starts[0::4]] != ord("@")).any() or (array[starts[2::4]] != ord("+")).any())):
+            raise ValueError("FASTQ data is not unwrapped 4-line records")
+        self.header_starts = starts[0::4]
+        self.header_ends = starts[1::4]
+        self.sequence_starts, self.sequence_ends = starts[1::4], ends[1::4]
+        self.quality_starts, self.quality_ends = starts[3::4], ends[3::4]
+
+    def __len__(self):
+        return len(self.header_starts)
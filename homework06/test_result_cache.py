@@ -0,0 +1,85 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+# fasta_stats.py needs NumPy
+pytest.importorskip("numpy")
+
+import result_cache
+from result_cache import ResultCache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RECORDS = ">P1 first\nMKVLAAGIVG\n>P2 second\nMKV\n>P3 third\nMKVLAAG\n"
+
+
+@pytest.fixture
+def fasta(tmp_path):
+    path = tmp_path / "proteins.fasta"
+    path.write_text(RECORDS)
+    return str(path)
+
+
+def run_stats(fasta: str, cache_dir, *args):
+    """Runs fasta_stats.py -j on fasta and returns the fasta_stats hits and misses of the cache"""
+    output = os.path.join(os.path.dirname(fasta), "stats.json")
+    subprocess.run(
+        [sys.executable, os.path.join(HERE, "fasta_stats.py"), "-f", fasta, "-o", output, "-j",
+         "--cache-dir", str(cache_dir), *args],
+        check=True, capture_output=True
+    )
+    cache = ResultCache(str(cache_dir))
+    counts = cache.stats()["tools"].get("fasta_stats", {"hits": 0, "misses": 0})
+    cache.close()
+    return counts["hits"], counts["misses"]
+
+
+def test_a_repeated_run_is_a_hit(fasta, tmp_path):
+    assert run_stats(fasta, tmp_path / "cache") == (0, 1)
+    assert run_stats(fasta, tmp_path / "cache") == (1, 1)
+
+
+def test_a_changed_argument_misses(fasta, tmp_path):
+    run_stats(fasta, tmp_path / "cache", "--bins", "10")
+    assert run_stats(fasta, tmp_path / "cache", "--bins", "5") == (0, 2)
+
+
+def test_a_changed_input_misses(fasta, tmp_path):
+    run_stats(fasta, tmp_path / "cache")
+    with open(fasta, "a") as f:
+        f.write(">P4 fourth\nMK\n")
+    assert run_stats(fasta, tmp_path / "cache") == (0, 2)
+
+
+def test_a_changed_tool_source_misses(tmp_path, monkeypatch, fasta):
+    sources = tmp_path / "sources"
+    sources.mkdir()
+    shutil.copy(os.path.join(HERE, "fasta_stats.py"), sources)
+    monkeypatch.setattr(result_cache, "HERE", str(sources))
+    cache = ResultCache(str(tmp_path / "cache"))
+    key = cache.make_key("fasta_stats", [fasta], {"bins": 10})
+    assert cache.make_key("fasta_stats", [fasta], {"bins": 10}) == key
+    with open(sources / "fasta_stats.py", "a") as f:
+        f.write("\n# changed\n")
+    assert cache.make_key("fasta_stats", [fasta], {"bins": 10}) != key
+    cache.close()
+
+
+def test_no_cache_neither_reuses_nor_stores(fasta, tmp_path):
+    run_stats(fasta, tmp_path / "cache")
+    assert run_stats(fasta, tmp_path / "cache", "--no-cache") == (0, 1)
+    assert run_stats(fasta, tmp_path / "fresh", "--no-cache") == (0, 0)
+    cache = ResultCache(str(tmp_path / "fresh"))
+    assert cache.stats()["entries"] == 0
+    cache.close()
+
+
+def test_outputs_over_the_size_limit_are_not_stored(fasta, tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    cache.set_limit(os.path.getsize(fasta) - 1)
+    cache.store("fasta_filter", "ab" * 32, fasta, 0, 0.0)
+    assert cache.stats()["entries"] == 0
+    assert not os.path.exists(cache.object_path("ab" * 32))
+    cache.close()
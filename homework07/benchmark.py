@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import random
+import time
+
+import redis
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+import record_query
+import record_store
+
+AMINO_ACIDS = "ACDEFGHIKLMNPQRSTVWY"
+DESCRIPTION_WORDS = [
+    "kinase", "receptor", "transporter", "histone", "protease", "synthase", "reductase", "binding",
+    "domain", "transcription", "factor", "ribosomal", "membrane", "zinc", "finger", "oxidase",
+]
+ORGANISMS = ["Arabidopsis thaliana", "Homo sapiens", "Mus musculus", "Saccharomyces cerevisiae", "Escherichia coli"]
+
+
+# -------------------------
+# Arg Parser
+# -------------------------
+parser = argparse.ArgumentParser(description='Benchmarks for the homework07 Redis record store')
+subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+redis_parser = subparsers.add_parser(
+    'redis',
+    help='Records/sec of one SET/GET per record vs. batched MSET/MGET against a local redis-server'
+)
+redis_parser.add_argument(
+    '-n', '--records',
+    type=int,
+    default=20000,
+    help='The number of synthetic protein records (default: 20000)'
+)
+redis_parser.add_argument(
+    '-b', '--batch-sizes',
+    type=int,
+    nargs='+',
+    default=[100, 1000, 5000],
+    help='The MSET/MGET batch sizes to time (default: 100 1000 5000)'
+)
+redis_parser.add_argument(
+    '-L', '--length',
+    type=int,
+    default=400,
+    help='The length of every synthetic sequence (default: 400)'
+)
+redis_parser.add_argument(
+    '--db',
+    type=int,
+    default=15,
+    help='The Redis database the benchmark writes to, its keys are deleted afterwards (default: 15)'
+)
+
+memory_parser = subparsers.add_parser(
+    'memory',
+    help='Redis used_memory and read times of the json and compact record formats'
+)
+memory_parser.add_argument(
+    '-n', '--records',
+    type=int,
+    default=5000,
+    help='The number of synthetic protein records (default: 5000)'
+)
+memory_parser.add_argument(
+    '-L', '--length',
+    type=int,
+    default=400,
+    help='The length of every synthetic sequence (default: 400)'
+)
+memory_parser.add_argument(
+    '--db',
+    type=int,
+    default=15,
+    help='The Redis database the benchmark writes to, its keys are deleted afterwards (default: 15)'
+)
+
+index_parser = subparsers.add_parser(
+    'index',
+    help='Query time of the secondary indexes vs. SCAN and filtering every record'
+)
+index_parser.add_argument(
+    '-n', '--records',
+    type=int,
+    default=100000,
+    help='The number of synthetic protein records (default: 100000)'
+)
+index_parser.add_argument(
+    '-t', '--terms',
+    type=int,
+    default=20,
+    help='The number of search terms the records are spread over (default: 20)'
+)
+index_parser.add_argument(
+    '-w', '--word',
+    type=str,
+    default='kinase',
+    help='The description word queried (default: kinase)'
+)
+index_parser.add_argument(
+    '--min-length',
+    type=int,
+    default=800,
+    help='The least length queried (default: 800)'
+)
+index_parser.add_argument(
+    '--record-format',
+    choices=record_store.FORMATS,
+    default='compact',
+    help='How the records are stored (default: compact)'
+)
+index_parser.add_argument(
+    '--db',
+    type=int,
+    default=15,
+    help='The Redis database the benchmark writes to, its keys are deleted afterwards (default: 15)'
+)
+
+
+# -------------------------
+# Functions
+# -------------------------
+def synthetic_records(n_records: int, length: int) -> list[SeqRecord]:
+    """Random protein records with IDs that do not clash with GenBank accessions"""
+    rng = random.Random(0)
+    return [
+        SeqRecord(
+            Seq("".join(rng.choices(AMINO_ACIDS, k=length))),
+            id=f"BENCH_{i:07d}.1", name=f"BENCH_{i:07d}", description=f"synthetic protein {i}"
+        )
+        for i in range(n_records)
+    ]
+
+
+def per_record_write(records: list[SeqRecord], db: int):
+    """The store path before batching: a new client and one SET round trip per record"""
+    rd = redis.Redis(host=record_store.REDIS_HOST, port=record_store.REDIS_PORT, db=db)
+    for record in records:
+        rd.set(record.id, json.dumps(record_store.record_entry(record)))
+
+
+def per_record_read(records: list[SeqRecord], db: int):
+    """The output path before batching: a new client and one GET round trip per record"""
+    rd = redis.Redis(host=record_store.REDIS_HOST, port=record_store.REDIS_PORT, db=db)
+    for record in records:
+        json.loads(rd.get(record.id).decode("utf-8"))
+
+
+def delete_records(rd: redis.Redis, records: list[SeqRecord]):
+    """Deletes the records and takes them out of the index sets write_records() added them to"""
+    record_store.delete_records(rd, [record.id for record in records], 10000)
+
+
+def indexed_records(n_records: int)-> list[SeqRecord]:
+    """Random protein records with descriptions, organisms and lengths from 50 to 1000 residues to query"""
+    rng = random.Random(0)
+    return [
+        SeqRecord(
+            Seq("".join(rng.choices(AMINO_ACIDS, k=rng.randint(50, 1000)))),
+            id=f"BENCH_{i:07d}.1", name=f"BENCH_{i:07d}",
+            description=" ".join(rng.sample(DESCRIPTION_WORDS, 3)),
+            annotations={"organism": rng.choice(ORGANISMS)}
+        )
+        for i in range(n_records)
+    ]
+
+
+def scan_query(rd: redis.Redis, word: str, min_length: int)-> list[str]:
+    """The query path without indexes: SCAN every benchmark key and filter its metadata"""
+    ids = []
+    keys = (key.decode() for key in rd.scan_iter(match="BENCH_*", count=1000))
+    for batch in record_store.batches(keys, record_store.BATCH_SIZE):
+        for metadata in record_store.read_metadata(rd, batch):
+            if metadata["Length"] >= min_length and word in metadata["Description"].lower().split():
+                ids.append(metadata["ID"])
+    return ids
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def run_redis_benchmark(args):
+    records = synthetic_records(args.records, args.length)
+    rd = record_store.connect(args.db)
+    rd.ping()
+    rows = [("SET/GET per record", timed(per_record_write, records, args.db),
+             timed(per_record_read, records, args.db))]
+    delete_records(rd, records)
+    for batch_size in args.batch_sizes:
+        write_seconds = timed(record_store.write_records, rd, records, batch_size)
+        read_seconds = timed(lambda: list(record_store.read_records(rd, [r.id for r in records], batch_size)))
+        rows.append((f"MSET/MGET batch {batch_size}", write_seconds, read_seconds))
+        delete_records(rd, records)
+
+    print(f"{args.records} records of {args.length} residues, "
+          f"redis {record_store.REDIS_HOST}:{record_store.REDIS_PORT} db {args.db}")
+    print("| path | write s | write records/sec | read s | read records/sec |")
+    print("| ---: | ---: | ---: | ---: | ---: |")
+    for name, write_seconds, read_seconds in rows:
+        print(f"| {name} | {write_seconds:.2f} | {args.records / write_seconds:,.0f} "
+              f"| {read_seconds:.2f} | {args.records / read_seconds:,.0f} |")
+
+
+def run_memory_benchmark(args):
+    records = synthetic_records(args.records, args.length)
+    ids = [record.id for record in records]
+    rd = record_store.connect(args.db)
+    listpack_value = rd.config_get("hash-max-listpack-value").get("hash-max-listpack-value")
+    print(f"{args.records} records of {args.length} residues, "
+          f"redis {record_store.REDIS_HOST}:{record_store.REDIS_PORT} db {args.db}, "
+          f"hash-max-listpack-value {listpack_value}")
+    print("| format | used_memory before MB | used_memory after MB | bytes/record | encoding "
+          "| read records/sec | metadata records/sec |")
+    print("| ---: | ---: | ---: | ---: | ---: | ---: | ---: |")
+    for record_format in record_store.FORMATS:
+        delete_records(rd, records)
+        before = rd.info("memory")["used_memory"]
+        record_store.write_records(rd, records, record_store.BATCH_SIZE, record_format)
+        after = rd.info("memory")["used_memory"]
+        encoding = rd.object("encoding", ids[0])
+        read_seconds = timed(lambda: list(record_store.read_records(rd, ids)))
+        metadata_seconds = timed(lambda: list(record_store.read_metadata(rd, ids)))
+        print(f"| {record_format} | {before / 1e6:.2f} | {after / 1e6:.2f} | {(after - before) / args.records:,.0f} "
+              f"| {encoding.decode() if isinstance(encoding, bytes) else encoding} "
+              f"| {args.records / read_seconds:,.0f} | {args.records / metadata_seconds:,.0f} |")
+    delete_records(rd, records)
+
+
+def run_index_benchmark(args):
+    records = indexed_records(args.records)
+    terms = [f"benchmark term {i}" for i in range(args.terms)]
+    rd = record_store.connect(args.db)
+    delete_records(rd, records)
+    write_seconds = 0.0
+    for i, term in enumerate(terms):
+        write_seconds += timed(record_store.write_records, rd, records[i::len(terms)], record_store.BATCH_SIZE,
+                              args.record_format, term)
+    index_keys = {key for record in records for key in record_store.index_keys(record)}
+    index_keys.update([record_store.LENGTH_KEY, *(record_store.term_key(term) for term in terms)])
+    index_keys.update(record_store.index_of_key(record.id) for record in records)
+    try:
+        rd.memory_usage(record_store.LENGTH_KEY)
+    except redis.ResponseError:
+        # MEMORY USAGE is missing from some Redis stand-ins such as fakeredis
+        index_bytes = None
+    else:
+        pipe = rd.pipeline(transaction=False)
+        for key in index_keys:
+            pipe.memory_usage(key)
+        index_bytes = sum(usage or 0 for usage in pipe.execute())
+
+    indexed, scanned = [], []
+    index_seconds = timed(lambda: indexed.extend(record_query.query_ids(rd, words=[args.word],
+                                                                        min_length=args.min_length)))
+    scan_seconds = timed(lambda: scanned.extend(scan_query(rd, args.word, args.min_length)))
+    assert sorted(indexed) == sorted(scanned)
+    term_ids = []
+    term_seconds = timed(lambda: term_ids.extend(record_query.query_ids(rd, term=terms[0],
+                                                                        min_length=args.min_length)))
+
+    print(f"{args.records} {args.record_format} records over {len(terms)} terms written and indexed in "
+          f"{write_seconds:.2f}s, "
+          f"redis {record_store.REDIS_HOST}:{record_store.REDIS_PORT} db {args.db}, "
+          f"{len(index_keys)} index keys using "
+          + (f"{index_bytes / 1e6:.2f} MB ({index_bytes / args.records:,.0f} bytes/record)" if index_bytes is not None
+             else "an unknown amount of memory (no MEMORY USAGE)"))
+    print("| query | path | matches | seconds |")
+    print("| ---: | ---: | ---: | ---: |")
+    print(f"| {args.word} and length >= {args.min_length} | SCAN + filter | {len(scanned)} | {scan_seconds:.3f} |")
+    print(f"| {args.word} and length >= {args.min_length} | indexes | {len(indexed)} | {index_seconds:.3f} |")
+    print(f"| {terms[0]} and length >= {args.min_length} | indexes | {len(term_ids)} | {term_seconds:.3f} |")
+    delete_records(rd, records)
+
+
+def main():
+    args = parser.parse_args()
+    if args.benchmark == 'redis':
+        run_redis_benchmark(args)
+    elif args.benchmark == 'memory':
+        run_memory_benchmark(args)
+    elif args.benchmark == 'index':
+        run_index_benchmark(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import http.server
+import threading
+import urllib.parse
+
+import pytest
+
+ACCESSIONS = [f"XP_{i:06d}.1" for i in range(1, 6)]
+
+ESEARCH_HISTORY = (
+    b'<?xml version="1.0" encoding="UTF-8" ?>\n<eSearchResult><Count>5</Count><RetMax>0</RetMax>'
+    b'<RetStart>0</RetStart><QueryKey>1</QueryKey><WebEnv>MCID_test</WebEnv><IdList></IdList>'
+    b'</eSearchResult>'
+)
+ESEARCH_ERROR = b'<?xml version="1.0" ?>\n<eSearchResult><ERROR>Invalid query</ERROR></eSearchResult>'
+
+
+def genbank_record(accession):
+    name = accession.split(".")[0]
+    return (
+        f"LOCUS       {name}                 10 aa            linear   PLN 01-JAN-2020\n"
+        f"DEFINITION  test protein {name}.\n"
+        f"ACCESSION   {name}\n"
+        f"VERSION     {accession}\n"
+        "FEATURES             Location/Qualifiers\n"
+        "ORIGIN      \n"
+        "        1 mkvlaagivg\n"
+        "//\n"
+    )
+
+
+class FakeEntrezHandler(http.server.BaseHTTPRequestHandler):
+    """Replays canned esearch/efetch responses and records the parameters of every request"""
+    requests_seen = []
+    failures = []  # status codes returned, in order, before the canned responses
+
+    def do_POST(self):
+        params = dict(urllib.parse.parse_qsl(self.rfile.read(int(self.headers['Content-Length'])).decode()))
+        FakeEntrezHandler.requests_seen.append((self.path, params))
+        if FakeEntrezHandler.failures:
+            self.send_response(FakeEntrezHandler.failures.pop(0))
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/esearch.fcgi':
+            if params['term'] == 'bad':
+                body = ESEARCH_ERROR
+            elif params.get('usehistory') == 'y':
+                body = ESEARCH_HISTORY
+            else:
+                start, size = int(params['retstart']), int(params['retmax'])
+                ids = ''.join(f'<Id>{ACCESSIONS[i - 1] if params.get("idtype") == "acc" else i}</Id>'
+                              for i in range(start + 1, min(start + size, 5) + 1))
+                body = f'<eSearchResult><Count>5</Count><IdList>{ids}</IdList></eSearchResult>'.encode()
+        elif 'id' in params:
+            ids = params['id'].split(',')
+            body = ''.join(genbank_record(i if '.' in i else f'XP_{int(i):06d}.1') for i in ids).encode()
+        else:
+            start, size = int(params['retstart']), int(params['retmax'])
+            body = ''.join(genbank_record(acc) for acc in ACCESSIONS[start:start + size]).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def entrez_server():
+    FakeEntrezHandler.requests_seen = []
+    FakeEntrezHandler.failures = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeEntrezHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def make_fetcher(base_url, **kwargs):
+    """An EntrezFetcher for the stub server without the NCBI rate limit or retry delays"""
+    from entrez_fetch import EntrezFetcher, TokenBucket
+    return EntrezFetcher('test@example.com', api_key=None, base_url=base_url,
+                         bucket=TokenBucket(1000), backoff=0.01, **kwargs)
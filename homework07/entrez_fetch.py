@@ -0,0 +1,256 @@
+import io
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+from http.client import HTTPException
+from typing import NamedTuple
+
+from Bio import SeqIO
+
+EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+
+# -------------------------
+# Engine configuration (overridable through the environment)
+# -------------------------
+EUTILS_BASE_URL = os.environ.get("EUTILS_BASE_URL", EUTILS_URL)
+NCBI_API_KEY = os.environ.get("NCBI_API_KEY")
+
+BATCH_SIZE = 200  # records per efetch request
+SEARCH_PAGE_SIZE = 10000  # the most IDs esearch returns per request
+MAX_TRIES = 4
+BACKOFF = 1.0  # seconds before the first retry, doubled for each one after
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE = 3  # requests per second NCBI allows without an API key
+API_KEY_RATE = 10  # requests per second with one
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting requests to `rate` per second. A request
+    that finds the bucket empty reserves the next token and sleeps until it is
+    due, so concurrent callers are spaced out in arrival order. With the default
+    capacity of one token no burst can exceed the rate.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available. Returns the seconds waited"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class SearchResult(NamedTuple):
+    """An esearch result kept on the NCBI history server"""
+    count: int  # records matching the term
+    webenv: str
+    query_key: str
+
+
+class EntrezFetcher:
+    """
+    Rate limited E-utilities client that fetches GenBank records in batches.
+
+    Searches are kept on the NCBI history server (usehistory=y), so records are
+    paged out of the WebEnv/query_key pair with retstart/retmax and no ID list
+    ever has to fit in a URL. Explicit ID lists are sent in the body of POST
+    requests. Every request takes a token from a TokenBucket (3 requests per
+    second, 10 with an API key) and failed requests are retried with
+    exponential backoff, honouring Retry-After. Records are parsed and yielded
+    one batch at a time, so callers can store them as they arrive.
+    """
+
+    def __init__(self, email, api_key=NCBI_API_KEY, db="protein", batch_size=BATCH_SIZE,
+                 base_url=EUTILS_BASE_URL, max_tries=MAX_TRIES, backoff=BACKOFF, timeout=60,
+                 bucket=None, tool="get_ncbi_genbank_records"):
+        self.email = email
+        self.api_key = api_key
+        self.db = db
+        self.batch_size = batch_size
+        self.base_url = base_url.rstrip("/")
+        self.max_tries = max_tries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.tool = tool
+        self.bucket = bucket or TokenBucket(API_KEY_RATE if api_key else RATE)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "retries": 0, "bytes": 0, "records": 0, "throttled_seconds": 0.0}
+
+    def request(self, utility, params):
+        """
+        POST one E-utility request and return the response body
+
+        Args:
+            utility: The E-utility name, e.g. "esearch"
+            params: The request parameters, db, tool, email and api_key are added
+
+        Returns:
+            body: The response bytes
+
+        Raises:
+            urllib.error.URLError: If the request still fails after max_tries attempts,
+                or fails with a status that is not worth retrying
+        """
+        params = {"db": self.db, "tool": self.tool, "email": self.email, **params}
+        if self.api_key:
+            params["api_key"] = self.api_key
+        data = urllib.parse.urlencode(params).encode()
+        url = f"{self.base_url}/{utility}.fcgi"
+        for attempt in range(1, self.max_tries + 1):
+            waited = self.bucket.acquire()
+            with self._lock:
+                self._counters["requests"] += 1
+                self._counters["throttled_seconds"] += waited
+            try:
+                with urllib.request.urlopen(url, data=data, timeout=self.timeout) as response:
+                    body = response.read()
+                with self._lock:
+                    self._counters["bytes"] += len(body)
+                return body
+            except urllib.error.HTTPError as e:
+                if e.code not in RETRY_STATUSES or attempt == self.max_tries:
+                    raise
+                retry_after = e.headers.get("Retry-After", "")
+                delay = float(retry_after) if retry_after.isdigit() else self.backoff * 2 ** (attempt - 1)
+                error = f"HTTP {e.code}"
+            except (urllib.error.URLError, HTTPException, OSError) as e:
+                if attempt == self.max_tries:
+                    raise
+                delay = self.backoff * 2 ** (attempt - 1)
+                error = e
+            logging.warning(f"{utility} attempt {attempt} failed ({error}), retrying in {delay:.1f}s")
+            with self._lock:
+                self._counters["retries"] += 1
+            time.sleep(delay)
+
+    def search(self, term):
+        """
+        Run esearch for term and keep the result on the history server
+
+        Returns:
+            result: The SearchResult with the number of matches and the WebEnv/query_key
+
+        Raises:
+            RuntimeError: If NCBI reports an error for the search
+        """
+        logging.info(f"Searching {self.db} for {term}")
+        root = parse_search(self.request("esearch", {"term": term, "usehistory": "y", "retmax": 0}))
+        return SearchResult(int(root.findtext("Count")), root.findtext("WebEnv"), root.findtext("QueryKey"))
+
+    def search_ids(self, term, max_records=None, idtype=None):
+        """
+        The IDs matching term, up to max_records (all of them if None), paged SEARCH_PAGE_SIZE
+        at a time. With idtype="acc" the IDs are accession.version, the IDs of the fetched records
+        """
+        params = {"term": term, "idtype": idtype} if idtype else {"term": term}
+        ids = []
+        while True:
+            page_size = SEARCH_PAGE_SIZE if max_records is None else min(SEARCH_PAGE_SIZE, max_records - len(ids))
+            if page_size <= 0:
+                return ids
+            root = parse_search(self.request("esearch", {**params, "retstart": len(ids), "retmax": page_size}))
+            page = [element.text for element in root.iter("Id")]
+            ids.extend(page)
+            if not page or len(ids) >= int(root.findtext("Count")):
+                return ids
+
+    def batch_params(self, search, max_records=None):
+        """
+        The efetch parameters of every batch of a search on the history server
+
+        Args:
+            search: The SearchResult from search()
+            max_records: Stop after this many records (all of them if None)
+
+        Returns:
+            params: One dict per batch of up to batch_size records, for efetch()
+        """
+        total = min(search.count, max_records) if max_records else search.count
+        return [
+            {"WebEnv": search.webenv, "query_key": search.query_key,
+             "retstart": start, "retmax": min(self.batch_size, total - start)}
+            for start in range(0, total, self.batch_size)
+        ]
+
+    def fetch_batches(self, search, max_records=None):
+        """
+        Page the GenBank text of a search out of the history server
+
+        Args:
+            search: The SearchResult from search()
+            max_records: Stop after this many records (all of them if None)
+
+        Yields:
+            text: The GenBank flat file text of up to batch_size records
+        """
+        for params in self.batch_params(search, max_records):
+            logging.info(f"Fetching records {params['retstart'] + 1} to {params['retstart'] + params['retmax']}")
+            yield self.efetch(params)
+
+    def fetch_id_batches(self, ids):
+        """Like fetch_batches(), for an explicit list of IDs sent batch_size at a time"""
+        for start in range(0, len(ids), self.batch_size):
+            yield self.efetch({"id": ",".join(ids[start:start + self.batch_size])})
+
+    def efetch(self, params):
+        """The GenBank text of one batch, params select the records by history or by ID"""
+        body = self.request("efetch", {"rettype": "gb", "retmode": "text", **params}).decode()
+        # NCBI reports errors such as an expired WebEnv inside a successful response
+        if "<ERROR>" in body[:1000]:
+            raise RuntimeError(f"NCBI efetch error: {body[:1000].strip()}")
+        return body
+
+    def parse_batches(self, batches):
+        """Parse each batch of GenBank text as it arrives. Yields a list of SeqRecords per batch"""
+        for text in batches:
+            records = parse_genbank(text)
+            with self._lock:
+                self._counters["records"] += len(records)
+            yield records
+
+    def records(self, term, max_records=None):
+        """Search for term and yield its GenBank SeqRecords one parsed batch at a time"""
+        search = self.search(term)
+        logging.info(f"{search.count} records match {term}")
+        yield from self.parse_batches(self.fetch_batches(search, max_records))
+
+    def metrics(self):
+        """Requests sent, retries, bytes received, records parsed and seconds spent waiting for the rate limit"""
+        with self._lock:
+            return dict(self._counters)
+
+
+def parse_genbank(text):
+    """Parse GenBank flat file text into a list of SeqRecords"""
+    return list(SeqIO.parse(io.StringIO(text), "gb"))
+
+
+def parse_search(body):
+    """
+    Parse an esearch XML response
+
+    Raises:
+        RuntimeError: If the response has an ERROR element instead of a result
+    """
+    root = ET.fromstring(body)
+    error = root.findtext("ERROR")
+    if error or root.find("Count") is None:
+        raise RuntimeError(f"NCBI esearch error: {error or body[:200]!r}")
+    return root
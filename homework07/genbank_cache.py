@@ -0,0 +1,154 @@
+import json
+import logging
+import math
+import time
+
+import redis
+
+import record_store
+from entrez_fetch import SEARCH_PAGE_SIZE
+
+MAX_AGE = 7 * 24 * 3600  # seconds a stored record is served without refetching it
+SEARCH_TTL = 24 * 3600  # seconds an esearch result is reused
+SEARCH_KEY_PREFIX = "genbank:esearch:"
+
+
+class GenBankCache:
+    """
+    Read-through cache of GenBank records in Redis in front of an EntrezFetcher.
+
+    The accession.version IDs matching a search term are kept in Redis for
+    `search_ttl` seconds, so repeated runs skip esearch. Of those IDs, records
+    stored less than `max_age` seconds ago are served from Redis and only the
+    rest are fetched from NCBI, in batches that are stored as they arrive.
+    """
+
+    def __init__(self, fetcher, rd: redis.Redis, max_age=MAX_AGE, search_ttl=SEARCH_TTL,
+                 record_format="json", batch_size=record_store.BATCH_SIZE):
+        self.fetcher = fetcher
+        self.rd = rd
+        self.max_age = max_age
+        self.search_ttl = search_ttl
+        self.record_format = record_format
+        self.batch_size = batch_size
+        self._counters = {
+            "search_hits": 0, "search_misses": 0, "record_hits": 0, "record_misses": 0,
+            "requests_avoided": 0,
+        }
+
+    def search_key(self, term, max_records):
+        return f"{SEARCH_KEY_PREFIX}{self.fetcher.db}:{max_records or 0}:{term}"
+
+    def search_ids(self, term, max_records=None):
+        """The accession.version IDs matching term, from Redis if the search was run within search_ttl"""
+        key = self.search_key(term, max_records)
+        cached = self.rd.get(key)
+        if cached is not None:
+            ids = json.loads(cached)
+            self._counters["search_hits"] += 1
+            # esearch pages of up to SEARCH_PAGE_SIZE IDs, and at least one request for no matches
+            self._counters["requests_avoided"] += max(1, math.ceil(len(ids) / SEARCH_PAGE_SIZE))
+            logging.info(f"Using the cached search for {term}")
+            return ids
+        self._counters["search_misses"] += 1
+        ids = self.fetcher.search_ids(term, max_records, idtype="acc")
+        if self.search_ttl > 0:
+            self.rd.set(key, json.dumps(ids), ex=self.search_ttl)
+        return ids
+
+    def stale_ids(self, ids):
+        """The IDs that are not stored, or were stored more than max_age seconds ago"""
+        oldest = time.time() - self.max_age
+        return [
+            record_id
+            for record_id, fetched in zip(ids, record_store.fetched_times(self.rd, ids, self.batch_size))
+            if fetched is None or fetched < oldest
+        ]
+
+    def plan(self, term, max_records=None):
+        """The IDs matching term in search order, and the ones among them that have to be fetched"""
+        ids = self.search_ids(term, max_records)
+        stale = self.stale_ids(ids)
+        self._counters["record_hits"] += len(ids) - len(stale)
+        self._counters["record_misses"] += len(stale)
+        batch_size = self.fetcher.batch_size
+        self._counters["requests_avoided"] += math.ceil(len(ids) / batch_size) - math.ceil(len(stale) / batch_size)
+        logging.info(f"{len(ids) - len(stale)} of {len(ids)} records are cached, fetching {len(stale)}")
+        stale_set = set(stale)
+        # Cached records may have been stored for another term, fetched ones are indexed as they are stored
+        record_store.index_term(self.rd, term, [record_id for record_id in ids if record_id not in stale_set],
+                                self.batch_size)
+        return ids, stale
+
+    def fetch(self, stale, term=None):
+        """Fetches the stale IDs from NCBI and yields each batch of SeqRecords once it is stored and indexed under term"""
+        fetched = set()
+        for batch in self.fetcher.parse_batches(self.fetcher.fetch_id_batches(stale)):
+            record_store.write_records(self.rd, batch, self.batch_size, self.record_format, term)
+            fetched.update(record.id for record in batch)
+            yield batch
+        missing = set(stale) - fetched
+        if missing:
+            logging.warning(f"NCBI returned no record for {len(missing)} IDs: {sorted(missing)[:10]}")
+
+    def update(self, term, max_records=None):
+        """
+        Makes sure every record matching term is stored and fresh, fetching only the ones that are not
+
+        Args:
+            term: The search term
+            max_records: The most records to keep (all of them if None)
+
+        Returns:
+            ids: The IDs of the stored records in search order
+        """
+        ids, stale = self.plan(term, max_records)
+        missing = set(stale) - {record.id for batch in self.fetch(stale, term) for record in batch}
+        return [record_id for record_id in ids if record_id not in missing]
+
+    def entries(self, term, max_records=None):
+        """
+        Like update(), yielding the record_entry() dict of every record in search order as it
+        becomes available. Cached records are read from Redis a batch at a time and fetched
+        records are yielded from the batch NCBI returned them in, without being read back. A
+        fetched batch is held in memory until the search reaches its last record
+
+        Args:
+            term: The search term
+            max_records: The most records to keep (all of them if None)
+
+        Yields:
+            entry: The record_entry() dict of each stored record
+        """
+        ids, stale = self.plan(term, max_records)
+        stale_index = {record_id: i for i, record_id in enumerate(stale)}
+        cached = record_store.read_records(
+            self.rd, (record_id for record_id in ids if record_id not in stale_index), self.batch_size
+        )
+        batches = self.fetch(stale, term)
+        fetched = {}
+        n_batches = 0
+        for record_id in ids:
+            if record_id not in stale_index:
+                yield next(cached)
+                continue
+            # fetch() requests the stale IDs in order, fetcher.batch_size at a time
+            while n_batches <= stale_index[record_id] // self.fetcher.batch_size:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                fetched.update((record.id, record) for record in batch)
+                n_batches += 1
+            record = fetched.pop(record_id, None)
+            # None when NCBI returned no record for the ID, which fetch() warns about
+            if record is not None:
+                yield record_store.record_entry(record)
+        for _ in batches:
+            pass
+
+    def metrics(self):
+        """Search and record hits and misses, the record hit ratio and the NCBI requests avoided"""
+        metrics = dict(self._counters)
+        records = metrics["record_hits"] + metrics["record_misses"]
+        metrics["record_hit_ratio"] = metrics["record_hits"] / records if records else 0.0
+        return metrics
@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 
-from Bio import Entrez, SeqIO
 import redis
 import os
 import sys
 import socket
-import json
 import logging
 import argparse
+import time
+from typing import Iterator
+from entrez_fetch import BATCH_SIZE, EUTILS_BASE_URL, NCBI_API_KEY, EntrezFetcher
+from genbank_cache import MAX_AGE, SEARCH_TTL, GenBankCache
+import record_output
+import record_store
 
 # -------------------------
 # global variables
@@ -16,6 +20,7 @@ import argparse
 SEARCH_TERM = "Arabidopsis thaliana AND AT5G10140"
 ENTREZ_EMAIL = "Random@example.com"
 OUTPUT_FILE = "records.txt"
+MAX_RECORDS = 30
 
 # -------------------------
 # Logging setup
@@ -36,14 +41,89 @@ parser.add_argument(
     default=OUTPUT_FILE,
     help=f'The name of the output file (default: {OUTPUT_FILE})'
 )
+parser.add_argument(
+    '--output-format',
+    choices=record_output.OUTPUT_FORMATS,
+    default="txt",
+    help='The format of the output file: ID/Name/Description/Sequence lines, JSON Lines or FASTA (default: txt)'
+)
 parser.add_argument(
     '-s', '-search',
     default=SEARCH_TERM,
     help=f'The search terms the user wishes to request to the NCBI Protein DataBase (default: {SEARCH_TERM})',    
     type=str
 )
+parser.add_argument(
+    '-n', '--max-records',
+    type=int,
+    default=MAX_RECORDS,
+    help=f'The most records to fetch, 0 fetches every match (default: {MAX_RECORDS})'
+)
+parser.add_argument(
+    '-b', '--batch-size',
+    type=int,
+    default=BATCH_SIZE,
+    help=f'The number of records fetched per efetch request (default: {BATCH_SIZE})'
+)
+parser.add_argument(
+    '-e', '--email',
+    type=str,
+    default=ENTREZ_EMAIL,
+    help=f'The email address NCBI asks E-utilities users to send (default: {ENTREZ_EMAIL})'
+)
+parser.add_argument(
+    '--api-key',
+    type=str,
+    default=NCBI_API_KEY,
+    help='An NCBI API key, raises the rate limit from 3 to 10 requests per second (default: $NCBI_API_KEY)'
+)
+parser.add_argument(
+    '--redis-batch-size',
+    type=int,
+    default=record_store.BATCH_SIZE,
+    help=f'The number of records per Redis MSET/MGET round trip (default: {record_store.BATCH_SIZE})'
+)
+parser.add_argument(
+    '--record-format',
+    choices=record_store.FORMATS,
+    default="json",
+    help='How records are stored in Redis, "compact" keeps metadata in hash fields and the sequence zlib '
+         'compressed (default: json)'
+)
+parser.add_argument(
+    '--max-age',
+    type=int,
+    default=MAX_AGE,
+    help=f'Seconds a record stored in Redis is reused instead of refetched (default: {MAX_AGE})'
+)
+parser.add_argument(
+    '--search-ttl',
+    type=int,
+    default=SEARCH_TTL,
+    help=f'Seconds the IDs found for a search are reused instead of searching again (default: {SEARCH_TTL})'
+)
+parser.add_argument(
+    '--no-cache',
+    action='store_true',
+    help='Fetch every record from NCBI, even the ones already in Redis'
+)
+parser.add_argument(
+    '-r', '--report',
+    action='store_true',
+    help='Print the cache hit ratio and the NCBI requests made and avoided to stderr when finished'
+)
+parser.add_argument(
+    '--eutils-url',
+    type=str,
+    default=EUTILS_BASE_URL,
+    help=f'The E-utilities base URL, e.g. a local stub server (default: {EUTILS_BASE_URL})'
+)
 
 args = parser.parse_args()
+if args.max_records < 0 or args.max_age < 0 or args.search_ttl < 0:
+    parser.error("--max-records, --max-age and --search-ttl must not be negative")
+if args.batch_size < 1 or args.redis_batch_size < 1:
+    parser.error("--batch-size and --redis-batch-size must be at least 1")
 
 format_string = (
     f'[%(asctime)s {socket.gethostname()}] '
@@ -54,83 +134,42 @@ logging.basicConfig(level=args.loglevel, format=format_string)
 # -------------------------
 # Functions
 # -------------------------
-def get_gbID_num(search_term: str, entrez_email=ENTREZ_EMAIL, retmax=30)-> list[str]:
-    """
-    Gets all the top results from a API request to the NCIB protein database using a given search term
-
-    Args:
-        search_term: A string that will be used to get a request
-            - default: "Arabidopsis thaliana AND AT5G10140"
-            - can be changed using `-s` flag when running program in console
-        entrez_email: A string in the format of an email that will be used for the API request
-            - Not necessary to change
-            - default: "Random@example.com"
-            - can be changed by altering global variable ENTREZ_EMAIL
-        retmax: An int that is the amount of results which are returned
-            - default: 30
+def make_fetcher()-> EntrezFetcher:
     """
-    logging.info(f"Getting IDs for the search {search_term}")
-    Entrez.email = entrez_email
-    with Entrez.esearch(db="protein", term=search_term, retmax=retmax) as h:
-        results = Entrez.read(h)
-        gbID = results["IdList"]
-        logging.debug("Finished get_ID_num()")
-        return gbID
+    Creates the E-utilities client used for every request, configured from the command line,
+    including the `-e` email address sent with each request
 
-
-def list_to_str(input: list[str])-> str:
-    """
-    Turns a list of strings into a long string of the elements separated by commas
-    ex. ["a", "b", "c"] -> "a, b, c"
-
-    Args:
-        input: A list of strings
-    
     Returns:
-        output: A long string of the input elements separated by commas
-    """
-    logging.debug("Starting list_to_str()")
-    output = ""
-    for index, elem in enumerate(input):
-        if index == len(input) - 1:
-            output += f"{elem}"
-        else:
-            output += f"{elem}, "
-    logging.debug("Finished list_to_str()")
-    return output
-
-
-def get_record(gbID: list[str])-> list['Bio.SeqRecord.SeqRecord']:
+        fetcher: An EntrezFetcher
     """
-    Given a list of NCIB Protein Database IDs, returns a list of matching Bio.Seq records
-
-    Args:
-        gbID: A list of IDs as strings
-    
-    Returns:
-        rec_list: A list of Bio.Seq records
-    """
-    logging.info("Getting records")
-    gbID_str = list_to_str(gbID)
-    with Entrez.efetch(db="protein", id=gbID_str, rettype="gb", retmode="text") as h:
-        record = SeqIO.parse(h, "gb")
-        rec_lst = list(record)
-        logging.debug("Finished get_record()")
-        return rec_lst
+    return EntrezFetcher(
+        args.email, api_key=args.api_key, batch_size=args.batch_size, base_url=args.eutils_url
+    )
 
 
-def store_records(rec_lst: list['Bio.SeqRecord.SeqRecord'], db=0):
+def store_records(rec_lst: Iterator['Bio.SeqRecord.SeqRecord'], db=0, batch_size=record_store.BATCH_SIZE,
+                  record_format="json", term=None)-> Iterator[dict]:
     """
-    Stores a list of Bio.Seq records to a locally hosted Redis databse in the form of
-    {ID: json string of (ID, Name, Description, Sequence)}
+    Stores Bio.Seq records to a locally hosted Redis databse as they arrive in the form of
+    {ID: json string of (ID, Name, Description, Sequence)}, with one MSET per batch of records,
+    and passes each record on once its batch is stored
 
     Args:
-        rec_lst: A list of Bio.Seq records
+        rec_lst: An iterable of Bio.Seq records, e.g. a generator
         db: An optional int type input that will create or specify a Redis database
             - default: 0
+        batch_size: The number of records sent per round trip
+            - default: 1000
+            - can be changed with `--redis-batch-size`
+        record_format: "json" for the json string described below, or "compact" for a hash of
+            the ID, Name, Description and Length fields and the zlib compressed Sequence
+            - can be changed with `--record-format`
+        term: The search term the records were found by. Every record is also added to the
+            indexes by organism, description word, length and term that record_query.py reads
     
-    Returns
-        None: Will create/append entries to a Redis database consisting of 
+    Yields:
+        entry: The dict stored for each record, once it is in Redis. The "json" format creates/appends
+            entries to a Redis database consisting of
             - key: ID
             - value: json string of
                 "ID": ID of record
@@ -139,72 +178,115 @@ def store_records(rec_lst: list['Bio.SeqRecord.SeqRecord'], db=0):
                 "Sequence": Sequence of record
     """
     logging.info("Starting store_records()")
-    try:
-        rd = redis.Redis(host="127.0.0.1", port=6379, db=db)
-        for record in rec_lst:
-            entry = {
-                "ID": record.id, 
-                "Name": record.name,
-                "Description": record.description,
-                "Sequence": str(record.seq)
-            }
-            logging.debug(f"storing entry {record.id}")
-            rd.set(record.id, json.dumps(entry))
-        logging.info(f"Finished storing {len(rec_lst)} records")
-    except redis.exceptions.ConnectionError:
-        logging.error("Redis network error has occured, cannot access database")
-        logging.error("Ending process")
-        sys.exit(1)
-
-
-def mk_output_file(rec_lst: list['Bio.SeqRecord.SeqRecord'], output_file=OUTPUT_FILE, db=0):
+    stored = 0
+    rd = record_store.connect(db)
+    for batch in record_store.batches(rec_lst, batch_size):
+        try:
+            record_store.write_records(rd, batch, batch_size, record_format, term)
+        except redis.exceptions.ConnectionError:
+            logging.error("Redis network error has occured, cannot access database")
+            logging.error("Ending process")
+            sys.exit(1)
+        stored += len(batch)
+        yield from map(record_store.record_entry, batch)
+    logging.info(f"Finished storing {stored} records")
+
+
+def mk_output_file(entries: Iterator[dict], output_file=OUTPUT_FILE, output_format="txt")-> int:
     """
-    Given a list of Bio.Seq records uses their IDs to retrive values from the Redis database and
-    makes an output text file containing json string values
+    Writes records to an output file as they arrive. The entries are produced as records are
+    stored, so nothing is read back from Redis and only one batch of records is held in memory
 
     Args:
-        rec_lst: A list of BioSeq records
+        entries: An iterable of record_entry() dicts, e.g. from store_records() or GenBankCache.entries()
         output_file: An optional input that specifies the name of the output file
-            - Requires file type of `.txt`
             - Default: "records.txt"
             - Can be changed with `-o` flag when running program with command
-        db: An int specifying the Redis database to request information from
+        output_format: "txt" for ID/Name/Description/Sequence lines, "jsonl" or "fasta"
+            - Can be changed with `--output-format`
 
     Returns:
-        None: Creates an output text file using the json string values in the Redis database
+        written: The number of records written to ./output_files/<output_file>
     """
     path = os.path.join("./output_files/", output_file)
     with open(path, "w") as out:
         try:
-            rd = redis.Redis(host="127.0.0.1", port=6379, db=db)
-            for record in rec_lst:
-                entry = json.loads(rd.get(record.id).decode("utf-8"))
-                out.write(
-                    f"ID: {entry["ID"]}" +
-                    f"\nName: {entry["Name"]}" + 
-                    f"\nDescription: {entry["Description"]}" +
-                    f"\nSequence: {entry["Sequence"]}\n\n"
-                    )
+            return record_output.write_entries(out, entries, output_format)
         except redis.exceptions.ConnectionError:
             logging.error("Redis network error has occured, cannot access database")
             logging.error("Ending process")
             sys.exit(1)
-        except TypeError:
-            logging.error("Redis returned None type, ID in input list is not key in Redis database")
+        except KeyError as e:
+            logging.error(f"Redis returned None type, ID {e} in input list is not key in Redis database")
             logging.error("Ending process")
             sys.exit(1)
 
+
+def fetch_records(fetcher: EntrezFetcher)-> Iterator[dict]:
+    """
+    Fetches every record matching the search from NCBI and stores each batch as soon as it
+    has been fetched and parsed
+
+    Args:
+        fetcher: The EntrezFetcher to use
+
+    Yields:
+        entry: The record_entry() dict of each record once it is stored, in search order
+    """
+    for batch in fetcher.records(args.s, args.max_records or None):
+        yield from store_records(
+            batch, batch_size=args.redis_batch_size, record_format=args.record_format, term=args.s
+        )
+
+
+def update_cached_records(fetcher: EntrezFetcher)-> tuple[Iterator[dict], GenBankCache]:
+    """
+    Serves the records matching the search from Redis when they are younger than `--max-age`,
+    and fetches only the others from NCBI
+
+    Args:
+        fetcher: The EntrezFetcher to use
+
+    Returns:
+        entries: A generator of the record_entry() dicts, cached records first, then fetched ones
+        cache: The GenBankCache, its metrics() are complete once entries is exhausted
+    """
+    cache = GenBankCache(
+        fetcher, record_store.connect(), max_age=args.max_age, search_ttl=args.search_ttl,
+        record_format=args.record_format, batch_size=args.redis_batch_size
+    )
+    return cache.entries(args.s, args.max_records or None), cache
+
+
+def report_stats(fetch_metrics: dict, cache_metrics: dict, seconds: float):
+    """Prints the records served from Redis, the NCBI requests made and avoided, and the wall time"""
+    print(f"Finished in {seconds:.2f}s: {fetch_metrics['requests']} NCBI requests "
+          f"({fetch_metrics['retries']} retries), {fetch_metrics['records']} records fetched", file=sys.stderr)
+    if cache_metrics:
+        records = cache_metrics["record_hits"] + cache_metrics["record_misses"]
+        print(f"Cache: {cache_metrics['record_hits']} of {records} records from Redis "
+              f"({cache_metrics['record_hit_ratio']:.1%}), search "
+              f"{'cached' if cache_metrics['search_hits'] else 'sent to NCBI'}, "
+              f"{cache_metrics['requests_avoided']} NCBI requests avoided", file=sys.stderr)
+
+
 # -------------------------
 # Main
 # -------------------------
 def main():
     logging.info("Starting process")
-    gbID_lst = get_gbID_num(SEARCH_TERM)
-    rec_lst = get_record(gbID_lst)
-    store_records(rec_lst)
-    mk_output_file(rec_lst, OUTPUT_FILE)
+    start = time.perf_counter()
+    fetcher = make_fetcher()
+    if args.no_cache:
+        entries, cache = fetch_records(fetcher), None
+    else:
+        entries, cache = update_cached_records(fetcher)
+    written = mk_output_file(entries, args.output, args.output_format)
+    logging.info(f"Wrote {written} records to {args.output}")
+    logging.info(f"Fetch metrics: {fetcher.metrics()}")
+    if args.report:
+        report_stats(fetcher.metrics(), cache.metrics() if cache else {}, time.perf_counter() - start)
     logging.info("Successfully finished process!")
 
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import redis
+
+import record_store
+from entrez_fetch import BATCH_SIZE, EUTILS_BASE_URL, NCBI_API_KEY, EntrezFetcher, parse_genbank
+
+ENTREZ_EMAIL = "Random@example.com"
+OUTPUT_FILE = "harvest.jsonl"
+CONCURRENCY = 8  # search terms in flight at once
+STAGES = ["search", "fetch", "parse", "store", "query"]
+
+# -------------------------
+# Arg Parser
+# -------------------------
+parser = argparse.ArgumentParser(
+    description='Harvests the GenBank records of many NCBI Protein searches concurrently into Redis'
+)
+parser.add_argument(
+    '-l', '--loglevel',
+    required=False,
+    choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+    default='WARNING',
+    help='Set the logging level (default: WARNING)'
+)
+parser.add_argument(
+    '-f', '--terms',
+    type=str,
+    required=True,
+    help='A file of search terms, one per line, blank lines and lines starting with # are skipped'
+)
+parser.add_argument(
+    '-o', '--output',
+    type=str,
+    default=OUTPUT_FILE,
+    help=f'The JSON Lines file of per-term results (default: {OUTPUT_FILE})'
+)
+parser.add_argument(
+    '-n', '--max-records',
+    type=int,
+    default=0,
+    help='The most records to fetch per term, 0 fetches every match (default: 0)'
+)
+parser.add_argument(
+    '-c', '--concurrency',
+    type=int,
+    default=CONCURRENCY,
+    help=f'The number of search terms harvested at once (default: {CONCURRENCY})'
+)
+parser.add_argument(
+    '-w', '--workers',
+    type=int,
+    default=os.cpu_count(),
+    help='The number of processes parsing GenBank text (default: the number of CPUs)'
+)
+parser.add_argument(
+    '-b', '--batch-size',
+    type=int,
+    default=BATCH_SIZE,
+    help=f'The number of records fetched per efetch request (default: {BATCH_SIZE})'
+)
+parser.add_argument(
+    '--redis-batch-size',
+    type=int,
+    default=record_store.BATCH_SIZE,
+    help=f'The number of records per Redis round trip (default: {record_store.BATCH_SIZE})'
+)
+parser.add_argument(
+    '--record-format',
+    choices=record_store.FORMATS,
+    default="json",
+    help='How records are stored in Redis (default: json)'
+)
+parser.add_argument(
+    '-e', '--email',
+    type=str,
+    default=ENTREZ_EMAIL,
+    help=f'The email address NCBI asks E-utilities users to send (default: {ENTREZ_EMAIL})'
+)
+parser.add_argument(
+    '--api-key',
+    type=str,
+    default=NCBI_API_KEY,
+    help='An NCBI API key, raises the rate limit from 3 to 10 requests per second (default: $NCBI_API_KEY)'
+)
+parser.add_argument(
+    '--eutils-url',
+    type=str,
+    default=EUTILS_BASE_URL,
+    help=f'The E-utilities base URL, e.g. a local stub server (default: {EUTILS_BASE_URL})'
+)
+
+format_string = (
+    f'[%(asctime)s {socket.gethostname()}] '
+    '%(module)s.%(funcName)s:%(lineno)s - %(levelname)s - %(message)s'
+)
+
+
+# -------------------------
+# Functions
+# -------------------------
+class StageTimer:
+    """Latencies (seconds) of every harvest stage, for the end of run report"""
+
+    def __init__(self):
+        self.latencies = {stage: [] for stage in STAGES}
+
+    def add(self, stage: str, start: float)-> float:
+        """Records the time since start (a time.perf_counter() value) for stage and returns the current time"""
+        now = time.perf_counter()
+        self.latencies[stage].append(now - start)
+        return now
+
+    def summary(self)-> dict:
+        """Count, total, mean, p50 and p95 of each stage that ran"""
+        summary = {}
+        for stage, latencies in self.latencies.items():
+            if not latencies:
+                continue
+            ordered = sorted(latencies)
+            summary[stage] = {
+                "count": len(ordered),
+                "total": sum(ordered),
+                "mean": statistics.fmean(ordered),
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            }
+        return summary
+
+
+def read_terms(terms_file: str)-> list[str]:
+    """The search terms in a file, one per line, skipping blank lines and # comments"""
+    with open(terms_file, "r") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+async def harvest_term(term: str, fetcher: EntrezFetcher, rd, http_pool: Executor, parse_pool: Executor,
+                       timer: StageTimer, max_records: int = None, redis_batch_size: int = record_store.BATCH_SIZE,
+                       record_format: str = "json")-> dict:
+    """
+    Searches for one term and stores its records in Redis, one batch at a time. Requests run in
+    http_pool threads, all through the same fetcher and so within one rate limit, and parsing
+    runs in parse_pool so the event loop only waits on I/O
+
+    Returns:
+        result: A dict with the term, the number of matches and records stored, and the seconds taken
+    """
+    loop = asyncio.get_running_loop()
+    query_start = start = time.perf_counter()
+    search = await loop.run_in_executor(http_pool, fetcher.search, term)
+    start = timer.add("search", start)
+    stored = 0
+    for params in fetcher.batch_params(search, max_records):
+        text = await loop.run_in_executor(http_pool, fetcher.efetch, params)
+        start = timer.add("fetch", start)
+        records = await loop.run_in_executor(parse_pool, parse_genbank, text)
+        start = timer.add("parse", start)
+        stored += await record_store.write_records_async(rd, records, redis_batch_size, record_format, term)
+        start = timer.add("store", start)
+    timer.add("query", query_start)
+    return {"term": term, "count": search.count, "stored": stored, "seconds": time.perf_counter() - query_start}
+
+
+async def harvest(terms: list[str], fetcher: EntrezFetcher, rd, parse_pool: Executor, output_file: str,
+                  concurrency: int = CONCURRENCY, max_records: int = None,
+                  redis_batch_size: int = record_store.BATCH_SIZE, record_format: str = "json")-> StageTimer:
+    """
+    Harvests every term with at most `concurrency` in flight, writing one JSON line per term to
+    output_file as it finishes. A term that fails is logged and written with its error, the
+    others carry on
+
+    Args:
+        terms: The search terms
+        fetcher: The EntrezFetcher shared by every term
+        rd: A redis.asyncio client
+        parse_pool: The executor parsing GenBank text
+        output_file: The path to the JSON Lines output
+        concurrency: The number of terms harvested at once
+        max_records: The most records to fetch per term (all of them if None)
+        redis_batch_size: The number of records per Redis round trip
+        record_format: "json" or "compact"
+
+    Returns:
+        timer: The StageTimer of the run
+    """
+    timer = StageTimer()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="entrez") as http_pool, \
+            open(output_file, "w") as out:
+        async def run(term):
+            async with semaphore:
+                try:
+                    result = await harvest_term(
+                        term, fetcher, rd, http_pool, parse_pool, timer, max_records, redis_batch_size, record_format
+                    )
+                except redis.exceptions.ConnectionError:
+                    raise
+                except Exception as e:
+                    logging.warning(f"Could not harvest {term}: {type(e).__name__}: {e}")
+                    result = {"term": term, "error": f"{type(e).__name__}: {e}"}
+            out.write(json.dumps(result) + "\n")
+            return result
+
+        await asyncio.gather(*(run(term) for term in terms))
+    return timer
+
+
+def report_stats(results: list[dict], fetcher: EntrezFetcher, timer: StageTimer, seconds: float):
+    """Prints queries/minute, the NCBI requests made and the latency of every stage to stderr"""
+    fetch_metrics = fetcher.metrics()
+    n_failed = sum("error" in result for result in results)
+    stored = sum(result.get("stored", 0) for result in results)
+    print(
+        f"Harvested {len(results)} terms ({n_failed} failed) in {seconds:.2f}s: "
+        f"{len(results) / seconds * 60 if seconds else 0.0:,.1f} queries/minute, {stored} records stored, "
+        f"{fetch_metrics['requests']} NCBI requests ({fetch_metrics['retries']} retries, "
+        f"{fetch_metrics['throttled_seconds']:.1f}s waiting for the rate limit)",
+        file=sys.stderr
+    )
+    for stage, latency in timer.summary().items():
+        print(f"  {stage:<7} n {latency['count']:>6}  mean {latency['mean']:>7.3f}s  "
+              f"p50 {latency['p50']:>7.3f}s  p95 {latency['p95']:>7.3f}s", file=sys.stderr)
+
+
+async def run_harvest(args, terms: list[str])-> tuple[list[dict], EntrezFetcher, StageTimer]:
+    fetcher = EntrezFetcher(args.email, api_key=args.api_key, batch_size=args.batch_size, base_url=args.eutils_url)
+    rd = record_store.connect_async(max_connections=args.concurrency)
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as parse_pool:
+            timer = await harvest(
+                terms, fetcher, rd, parse_pool, args.output, args.concurrency,
+                args.max_records or None, args.redis_batch_size, args.record_format
+            )
+    finally:
+        await rd.aclose()
+    with open(args.output, "r") as f:
+        results = [json.loads(line) for line in f]
+    return results, fetcher, timer
+
+
+# -------------------------
+# Main
+# -------------------------
+def main():
+    args = parser.parse_args()
+    if args.max_records < 0:
+        parser.error("--max-records must not be negative")
+    if args.concurrency < 1 or args.workers < 1 or args.batch_size < 1 or args.redis_batch_size < 1:
+        parser.error("--concurrency, --workers, --batch-size and --redis-batch-size must be at least 1")
+    logging.basicConfig(level=args.loglevel, format=format_string)
+
+    try:
+        terms = read_terms(args.terms)
+    except FileNotFoundError:
+        logging.error(f"Could not read {args.terms}, terminating program.")
+        sys.exit(1)
+    logging.info(f"Harvesting {len(terms)} terms, {args.concurrency} at a time")
+    start = time.perf_counter()
+    try:
+        results, fetcher, timer = asyncio.run(run_harvest(args, terms))
+    except redis.exceptions.ConnectionError:
+        logging.error("Redis network error has occured, cannot access database")
+        logging.error("Ending process")
+        sys.exit(1)
+    report_stats(results, fetcher, timer, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import json
+
+OUTPUT_FORMATS = ["txt", "jsonl", "fasta"]
+FASTA_LINE_WIDTH = 60
+
+
+def format_entry(entry: dict, output_format: str = "txt")-> str:
+    """
+    The text written to the output file for one record_entry() dict
+
+    Args:
+        entry: A dict of the ID, Name, Description and Sequence of a record
+        output_format: "txt" for the ID/Name/Description/Sequence lines of records.txt,
+            "jsonl" for one JSON object per line, or "fasta"
+
+    Returns:
+        text: The formatted record, ending with a newline
+    """
+    if output_format == "jsonl":
+        return json.dumps(entry) + "\n"
+    if output_format == "fasta":
+        sequence = entry["Sequence"]
+        lines = [sequence[i:i + FASTA_LINE_WIDTH] for i in range(0, len(sequence), FASTA_LINE_WIDTH)]
+        return f">{entry['ID']} {entry['Description']}\n" + "".join(line + "\n" for line in lines)
+    return (
+        f"ID: {entry['ID']}" +
+        f"\nName: {entry['Name']}" +
+        f"\nDescription: {entry['Description']}" +
+        f"\nSequence: {entry['Sequence']}\n\n"
+    )
+
+
+def write_entries(out, entries, output_format: str = "txt")-> int:
+    """
+    Writes every entry to an open text file as it arrives, so entries can be a generator
+    and only the record being written is held in memory
+
+    Args:
+        out: The open output file
+        entries: An iterable of record_entry() dicts
+        output_format: One of OUTPUT_FORMATS
+
+    Returns:
+        written: The number of records written
+    """
+    written = 0
+    for entry in entries:
+        out.write(format_entry(entry, output_format))
+        written += 1
+    return written
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import socket
+import sys
+import uuid
+
+import redis
+
+import record_store
+
+# -------------------------
+# Arg Parser
+# -------------------------
+parser = argparse.ArgumentParser(
+    description='Finds stored GenBank records by search term, organism, description words and length '
+                'through the indexes written with them, without scanning the keyspace'
+)
+parser.add_argument(
+    '-l', '--loglevel',
+    required=False,
+    choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+    default='WARNING',
+    help='Set the logging level (default: WARNING)'
+)
+parser.add_argument(
+    '-t', '--term',
+    type=str,
+    help='Only records stored for this search term'
+)
+parser.add_argument(
+    '-O', '--organism',
+    type=str,
+    help='Only records of this organism, e.g. "Arabidopsis thaliana"'
+)
+parser.add_argument(
+    '-w', '--word',
+    action='append',
+    default=[],
+    help='Only records with this word in their description, can be given more than once'
+)
+parser.add_argument(
+    '--min-length',
+    type=int,
+    help='Only records with at least this many residues'
+)
+parser.add_argument(
+    '--max-length',
+    type=int,
+    help='Only records with at most this many residues'
+)
+parser.add_argument(
+    '-m', '--metadata',
+    action='store_true',
+    help='Print the ID, Name, Description and Length of each record as JSON Lines instead of only the IDs'
+)
+parser.add_argument(
+    '--db',
+    type=int,
+    default=0,
+    help='The Redis database the records are stored in (default: 0)'
+)
+
+format_string = (
+    f'[%(asctime)s {socket.gethostname()}] '
+    '%(module)s.%(funcName)s:%(lineno)s - %(levelname)s - %(message)s'
+)
+
+
+# -------------------------
+# Functions
+# -------------------------
+def query_ids(rd: redis.Redis, term: str = None, organism: str = None, words=(), min_length: int = None,
+              max_length: int = None)-> list[str]:
+    """
+    The IDs of the stored records that match every given filter, from the index sets and
+    the length sorted set that write_records() maintains. IDs whose record has been deleted
+    or evicted since it was indexed are left out
+
+    Args:
+        rd: The Redis client
+        term: The search term the records were stored for
+        organism: The organism of the records
+        words: Words that must all appear in the description. record_store.STOP_WORDS and
+            numbers have no index sets, they are checked against the description of every
+            record the other filters leave
+        min_length: The least number of residues
+        max_length: The most number of residues
+
+    Returns:
+        ids: The matching IDs, ordered by length when a length is given and by ID otherwise
+    """
+    tokens = set(record_store.TOKEN_PATTERN.findall(" ".join(words).lower()))
+    indexed = record_store.index_words(" ".join(tokens))
+    keys = [record_store.token_key(word) for word in sorted(indexed)]
+    if organism:
+        keys.append(record_store.organism_key(organism))
+    if term:
+        keys.append(record_store.term_key(term))
+    low = "-inf" if min_length is None else min_length
+    high = "+inf" if max_length is None else max_length
+
+    if not keys:
+        ids = rd.zrangebyscore(record_store.LENGTH_KEY, low, high)
+    elif min_length is None and max_length is None:
+        ids = sorted(rd.sinter(keys))
+    else:
+        # Sets take part in ZINTERSTORE with a score of 1, weighted 0 the scores left are the lengths
+        result_key = f"{record_store.INDEX_PREFIX}query:{uuid.uuid4().hex}"
+        pipe = rd.pipeline(transaction=True)
+        pipe.zinterstore(result_key, {record_store.LENGTH_KEY: 1, **dict.fromkeys(keys, 0)})
+        pipe.zrangebyscore(result_key, low, high)
+        pipe.delete(result_key)
+        ids = pipe.execute()[1]
+    ids = present_ids(rd, [record_id.decode() for record_id in ids])
+    unindexed = tokens - indexed
+    if unindexed:
+        ids = [
+            record_id for record_id, metadata in zip(ids, record_store.read_metadata(rd, ids))
+            if unindexed <= set(record_store.TOKEN_PATTERN.findall(metadata["Description"].lower()))
+        ]
+    return ids
+
+
+def present_ids(rd: redis.Redis, ids: list[str], batch_size: int = record_store.BATCH_SIZE)-> list[str]:
+    """The IDs that are still keys in the database, checked with one pipelined EXISTS per ID and batch"""
+    present = []
+    for batch in record_store.batches(ids, batch_size):
+        pipe = rd.pipeline(transaction=False)
+        for record_id in batch:
+            pipe.exists(record_id)
+        present.extend(record_id for record_id, exists in zip(batch, pipe.execute()) if exists)
+    return present
+
+
+# -------------------------
+# Main
+# -------------------------
+def main():
+    args = parser.parse_args()
+    if not (args.term or args.organism or args.word or args.min_length is not None or args.max_length is not None):
+        parser.error("give at least one of --term, --organism, --word, --min-length and --max-length")
+    logging.basicConfig(level=args.loglevel, format=format_string)
+
+    try:
+        rd = record_store.connect(args.db)
+        ids = query_ids(rd, args.term, args.organism, args.word, args.min_length, args.max_length)
+        logging.info(f"{len(ids)} records match")
+        if args.metadata:
+            for metadata in record_store.read_metadata(rd, ids):
+                print(json.dumps(metadata))
+        else:
+            for record_id in ids:
+                print(record_id)
+    except redis.exceptions.ConnectionError:
+        logging.error("Redis network error has occured, cannot access database")
+        logging.error("Ending process")
+        sys.exit(1)
+    except KeyError as e:
+        logging.error(f"ID {e} is indexed but no longer a key in the Redis database")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
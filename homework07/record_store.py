@@ -0,0 +1,365 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+import redis
+import redis.asyncio
+
+# -------------------------
+# Redis configuration (overridable through the environment)
+# -------------------------
+REDIS_HOST = os.environ.get("REDIS_HOST", "127.0.0.1")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
+
+BATCH_SIZE = 1000  # records per MSET/MGET round trip
+FETCHED_KEY = "genbank:fetched"  # sorted set of record IDs scored by the time they were stored
+FORMATS = ["json", "compact"]
+METADATA_FIELDS = ["ID", "Name", "Description", "Length"]
+INDEX_PREFIX = "genbank:index:"
+LENGTH_KEY = INDEX_PREFIX + "length"  # sorted set of record IDs scored by sequence length
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Words in so many descriptions that their sets would approach the size of the keyspace
+STOP_WORDS = frozenset([
+    "a", "an", "and", "by", "for", "from", "in", "like", "of", "on", "or", "the", "to", "with",
+    "protein", "putative", "predicted", "probable", "hypothetical", "uncharacterized", "partial",
+    "isoform", "fragment", "family", "unnamed", "product",
+])
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def connect(db=0, host=REDIS_HOST, port=REDIS_PORT)-> redis.Redis:
+    """
+    Returns a Redis client for db. Clients for the same server and db share one
+    ConnectionPool, so repeated calls reuse open connections instead of
+    reconnecting
+
+    Args:
+        db: The Redis database number
+        host: The Redis host
+        port: The Redis port
+
+    Returns:
+        rd: A redis.Redis client
+    """
+    with _pools_lock:
+        pool = _pools.get((host, port, db))
+        if pool is None:
+            pool = _pools[(host, port, db)] = redis.ConnectionPool(host=host, port=port, db=db)
+    return redis.Redis(connection_pool=pool)
+
+
+def connect_async(db=0, host=REDIS_HOST, port=REDIS_PORT, max_connections=None)-> redis.asyncio.Redis:
+    """
+    Returns a redis.asyncio client for db with its own ConnectionPool of at most
+    max_connections connections. Asyncio pools belong to one event loop, so unlike
+    connect() they are not shared; close the client with `await rd.aclose()`
+    """
+    pool = redis.asyncio.ConnectionPool(host=host, port=port, db=db, max_connections=max_connections)
+    return redis.asyncio.Redis.from_pool(pool)
+
+
+def record_entry(record)-> dict:
+    """The dict stored for a Bio.Seq record: its ID, Name, Description and Sequence"""
+    return {
+        "ID": record.id,
+        "Name": record.name,
+        "Description": record.description,
+        "Sequence": str(record.seq)
+    }
+
+
+def encode_compact(record)-> dict:
+    """
+    The hash fields stored for a record in the compact format. The metadata is kept in
+    its own fields and the sequence as a zlib compressed blob in ZSequence, so the metadata
+    can be read without transferring or decompressing the sequence. Sequences too short
+    to gain from compression are kept as they are in Sequence
+    """
+    sequence = str(record.seq).encode()
+    compressed = zlib.compress(sequence, 9)
+    fields = {
+        "ID": record.id,
+        "Name": record.name,
+        "Description": record.description,
+        "Length": len(sequence),
+    }
+    if len(compressed) < len(sequence):
+        fields["ZSequence"] = compressed
+    else:
+        fields["Sequence"] = sequence
+    return fields
+
+
+def decode_compact(fields: dict)-> dict:
+    """The record_entry() dict of the hash fields written by encode_compact()"""
+    entry = {name: fields[name.encode()].decode() for name in ["ID", "Name", "Description"]}
+    sequence = fields.get(b"Sequence")
+    entry["Sequence"] = (zlib.decompress(fields[b"ZSequence"]) if sequence is None else sequence).decode()
+    return entry
+
+
+def organism_key(organism: str)-> str:
+    return f"{INDEX_PREFIX}organism:{organism.strip().lower()}"
+
+
+def token_key(token: str)-> str:
+    return f"{INDEX_PREFIX}token:{token.lower()}"
+
+
+def term_key(term: str)-> str:
+    return f"{INDEX_PREFIX}term:{term.strip().lower()}"
+
+
+def index_of_key(record_id: str)-> str:
+    """The set of the index keys a record is in, so they can be updated when it changes or is deleted"""
+    return f"{INDEX_PREFIX}of:{record_id}"
+
+
+def index_words(text: str)-> set[str]:
+    """
+    The words of text that are indexed, lowercased. Words that are only digits would each get
+    a set of their own and STOP_WORDS would get sets of nearly every record, both are left out
+    """
+    return {
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if not token.isdigit() and token not in STOP_WORDS
+    }
+
+
+def index_keys(record, term: str = None)-> list[str]:
+    """
+    The index sets a record is added to: the index_words() of its description (the protein
+    name), its organism when the record has one, and the search term it was found by
+    """
+    keys = [token_key(token) for token in sorted(index_words(record.description))]
+    organism = record.annotations.get("organism")
+    if organism:
+        keys.append(organism_key(organism))
+    if term:
+        keys.append(term_key(term))
+    return keys
+
+
+def batches(items, batch_size: int):
+    """Splits an iterable into lists of at most batch_size items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_records(rd: redis.Redis, rec_lst, batch_size: int = BATCH_SIZE, record_format: str = "json",
+                  term: str = None)-> int:
+    """
+    Stores records with one round trip per batch instead of one per record. The "json"
+    format stores {ID: json string of the record_entry()} with MSET. The "compact" format
+    stores each record as the hash of encode_compact(), replacing any JSON string already
+    stored under the ID. The time every record was stored is kept in FETCHED_KEY, and the
+    record is added to its index_keys() sets and to LENGTH_KEY in the same round trip. A
+    first round trip per batch reads the index keys of records stored before, so records
+    that changed are taken out of the sets they no longer belong to
+
+    Args:
+        rd: The Redis client
+        rec_lst: An iterable of Bio.Seq records
+        batch_size: The number of records per round trip
+        record_format: "json" or "compact"
+        term: The search term the records were found by, indexed when given
+
+    Returns:
+        stored: The number of records stored
+    """
+    stored = 0
+    for batch in batches(rec_lst, batch_size):
+        pipe = rd.pipeline(transaction=False)
+        queue_index_reads(pipe, batch)
+        old_keys = pipe.execute()
+        pipe = rd.pipeline(transaction=False)
+        queue_records(pipe, batch, record_format, term, old_keys)
+        pipe.execute()
+        stored += len(batch)
+    return stored
+
+
+async def write_records_async(rd: redis.asyncio.Redis, rec_lst, batch_size: int = BATCH_SIZE,
+                              record_format: str = "json", term: str = None)-> int:
+    """write_records() for a redis.asyncio client"""
+    stored = 0
+    for batch in batches(rec_lst, batch_size):
+        pipe = rd.pipeline(transaction=False)
+        queue_index_reads(pipe, batch)
+        old_keys = await pipe.execute()
+        pipe = rd.pipeline(transaction=False)
+        queue_records(pipe, batch, record_format, term, old_keys)
+        await pipe.execute()
+        stored += len(batch)
+    return stored
+
+
+def queue_index_reads(pipe, batch: list):
+    """Queues an SMEMBERS of the index_of_key() of each record in a batch"""
+    for record in batch:
+        pipe.smembers(index_of_key(record.id))
+
+
+def queue_records(pipe, batch: list, record_format: str, term: str = None, old_keys: list = None):
+    """
+    Queues the commands that store and index a batch of records on a pipeline (sync or asyncio).
+    old_keys holds the index keys each record was in before, from queue_index_reads(). The
+    record is removed from those it no longer belongs to, except for the sets of search
+    terms, which keep every record a term found
+    """
+    if record_format == "compact":
+        for record in batch:
+            pipe.delete(record.id)
+            pipe.hset(record.id, mapping=encode_compact(record))
+    else:
+        pipe.mset({record.id: json.dumps(record_entry(record)) for record in batch})
+    pipe.zadd(FETCHED_KEY, dict.fromkeys((record.id for record in batch), time.time()))
+    # One SADD and SREM per index set rather than per record and set
+    members, removed = {}, {}
+    term_prefix = term_key("")
+    for record, old in zip(batch, old_keys or [set()] * len(batch)):
+        keys = index_keys(record, term)
+        stale = {key.decode() for key in old} - set(keys)
+        stale = [key for key in stale if not key.startswith(term_prefix)]
+        for key in keys:
+            members.setdefault(key, []).append(record.id)
+        for key in stale:
+            removed.setdefault(key, []).append(record.id)
+        if stale:
+            pipe.srem(index_of_key(record.id), *stale)
+        if keys:
+            pipe.sadd(index_of_key(record.id), *keys)
+    for key, ids in removed.items():
+        pipe.srem(key, *ids)
+    for key, ids in members.items():
+        pipe.sadd(key, *ids)
+    pipe.zadd(LENGTH_KEY, {record.id: len(record.seq) for record in batch})
+
+
+def delete_records(rd: redis.Redis, ids, batch_size: int = BATCH_SIZE)-> int:
+    """
+    Deletes records and takes them out of every index, FETCHED_KEY and LENGTH_KEY
+
+    Returns:
+        deleted: The number of record keys that existed
+    """
+    deleted = 0
+    for batch in batches(ids, batch_size):
+        pipe = rd.pipeline(transaction=False)
+        for record_id in batch:
+            pipe.smembers(index_of_key(record_id))
+        old_keys = pipe.execute()
+        pipe = rd.pipeline(transaction=False)
+        pipe.delete(*batch)
+        pipe.delete(*(index_of_key(record_id) for record_id in batch))
+        pipe.zrem(FETCHED_KEY, *batch)
+        pipe.zrem(LENGTH_KEY, *batch)
+        removed = {}
+        for record_id, keys in zip(batch, old_keys):
+            for key in keys:
+                removed.setdefault(key, []).append(record_id)
+        for key, key_ids in removed.items():
+            pipe.srem(key, *key_ids)
+        deleted += pipe.execute()[0]
+    return deleted
+
+
+def index_term(rd: redis.Redis, term: str, ids: list[str], batch_size: int = BATCH_SIZE):
+    """Adds IDs that are already stored to the index set of a search term"""
+    for batch in batches(ids, batch_size):
+        pipe = rd.pipeline(transaction=False)
+        pipe.sadd(term_key(term), *batch)
+        for record_id in batch:
+            pipe.sadd(index_of_key(record_id), term_key(term))
+        pipe.execute()
+
+
+def fetched_times(rd: redis.Redis, ids: list[str], batch_size: int = BATCH_SIZE)-> list:
+    """The time each ID was stored by write_records(), None for IDs it has not stored or that were deleted since"""
+    times = []
+    for batch in batches(ids, batch_size):
+        pipe = rd.pipeline(transaction=False)
+        pipe.zmscore(FETCHED_KEY, batch)
+        for record_id in batch:
+            pipe.exists(record_id)
+        scores, *present = pipe.execute()
+        times.extend(score if exists else None for score, exists in zip(scores, present))
+    return times
+
+
+def read_records(rd: redis.Redis, ids, batch_size: int = BATCH_SIZE):
+    """
+    Reads stored records back in either format with one pipelined HGETALL per batch of
+    IDs. IDs stored as JSON strings answer HGETALL with a type error and are read with
+    one MGET per batch, so a database that mixes the two formats is read transparently
+
+    Args:
+        rd: The Redis client
+        ids: An iterable of record IDs
+        batch_size: The number of IDs per round trip
+
+    Yields:
+        entry: The record_entry() dict of each ID, in order
+
+    Raises:
+        KeyError: If an ID is not a key in the database
+    """
+    for batch in batches(ids, batch_size):
+        pipe = rd.pipeline(transaction=False)
+        for record_id in batch:
+            pipe.hgetall(record_id)
+        hashes = pipe.execute(raise_on_error=False)
+        strings = [record_id for record_id, value in zip(batch, hashes) if isinstance(value, redis.ResponseError)]
+        strings = dict(zip(strings, rd.mget(strings))) if strings else {}
+        for record_id, value in zip(batch, hashes):
+            if isinstance(value, redis.ResponseError):
+                if strings[record_id] is None:
+                    # Deleted between the two round trips
+                    raise KeyError(record_id)
+                yield json.loads(strings[record_id])
+            elif not value:
+                raise KeyError(record_id)
+            else:
+                yield decode_compact(value)
+
+
+def read_metadata(rd: redis.Redis, ids, batch_size: int = BATCH_SIZE):
+    """
+    Like read_records() without the sequences. Records in the compact format only
+    transfer their METADATA_FIELDS; JSON records have to be read whole, with one MGET
+    for all of them per batch
+
+    Yields:
+        metadata: A dict of the ID, Name, Description and Length of each ID, in order
+    """
+    for batch in batches(ids, batch_size):
+        pipe = rd.pipeline(transaction=False)
+        for record_id in batch:
+            pipe.hmget(record_id, METADATA_FIELDS)
+        results = pipe.execute(raise_on_error=False)
+        strings = [record_id for record_id, values in zip(batch, results) if isinstance(values, redis.ResponseError)]
+        strings = dict(zip(strings, rd.mget(strings))) if strings else {}
+        for record_id, values in zip(batch, results):
+            if isinstance(values, redis.ResponseError):
+                if strings[record_id] is None:
+                    # Deleted between the two round trips
+                    raise KeyError(record_id)
+                entry = json.loads(strings[record_id])
+                yield {**{name: entry[name] for name in METADATA_FIELDS[:3]}, "Length": len(entry["Sequence"])}
+            elif values[0] is None:
+                raise KeyError(record_id)
+            else:
+                metadata = dict(zip(METADATA_FIELDS, (value.decode() for value in values)))
+                metadata["Length"] = int(metadata["Length"])
+                yield metadata
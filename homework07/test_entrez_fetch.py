@@ -0,0 +1,68 @@
+import time
+import urllib.error
+
+import pytest
+
+pytest.importorskip("Bio")
+
+from conftest import ACCESSIONS, FakeEntrezHandler, make_fetcher
+from entrez_fetch import SearchResult, TokenBucket
+
+
+def test_records_are_paged_out_of_the_history_server(entrez_server):
+    fetcher = make_fetcher(entrez_server, batch_size=2)
+    batches = list(fetcher.records('Arabidopsis thaliana'))
+    assert [[record.id for record in batch] for batch in batches] == [ACCESSIONS[0:2], ACCESSIONS[2:4], ACCESSIONS[4:]]
+
+    fetches = [params for path, params in FakeEntrezHandler.requests_seen if path == '/efetch.fcgi']
+    assert [(p['retstart'], p['retmax']) for p in fetches] == [('0', '2'), ('2', '2'), ('4', '1')]
+    assert all(p['WebEnv'] == 'MCID_test' and p['query_key'] == '1' for p in fetches)
+    assert fetcher.metrics()['records'] == 5
+
+
+def test_max_records_limits_the_fetch(entrez_server):
+    fetcher = make_fetcher(entrez_server, batch_size=2)
+    records = [record for batch in fetcher.records('Arabidopsis thaliana', max_records=3) for record in batch]
+    assert [record.id for record in records] == ACCESSIONS[:3]
+
+
+def test_ids_are_searched_in_pages_and_posted_in_batches(entrez_server, monkeypatch):
+    monkeypatch.setattr('entrez_fetch.SEARCH_PAGE_SIZE', 2)
+    fetcher = make_fetcher(entrez_server, batch_size=3)
+    ids = fetcher.search_ids('Arabidopsis thaliana')
+    assert ids == ['1', '2', '3', '4', '5']
+    batches = list(fetcher.parse_batches(fetcher.fetch_id_batches(ids)))
+    assert [len(batch) for batch in batches] == [3, 2]
+    posted = [params['id'] for path, params in FakeEntrezHandler.requests_seen if path == '/efetch.fcgi']
+    assert posted == ['1,2,3', '4,5']
+
+
+def test_failed_requests_are_retried(entrez_server):
+    FakeEntrezHandler.failures = [503, 429]
+    fetcher = make_fetcher(entrez_server)
+    assert fetcher.search('Arabidopsis thaliana') == SearchResult(5, 'MCID_test', '1')
+    assert fetcher.metrics()['retries'] == 2
+    assert len(FakeEntrezHandler.requests_seen) == 3
+
+
+def test_errors_that_are_not_transient_are_raised(entrez_server):
+    fetcher = make_fetcher(entrez_server, max_tries=2)
+    with pytest.raises(RuntimeError):
+        fetcher.search('bad')
+
+    FakeEntrezHandler.failures = [400]
+    with pytest.raises(urllib.error.HTTPError):
+        fetcher.search('Arabidopsis thaliana')
+
+    FakeEntrezHandler.failures = [503, 503]
+    with pytest.raises(urllib.error.HTTPError):
+        fetcher.search('Arabidopsis thaliana')
+
+
+def test_token_bucket_spaces_requests():
+    bucket = TokenBucket(20)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    # The first token is available immediately, the other five are 1/20 s apart
+    assert time.monotonic() - start >= 0.25
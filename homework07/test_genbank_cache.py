@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("Bio")
+fakeredis = pytest.importorskip("fakeredis")
+
+import record_store
+from conftest import ACCESSIONS, FakeEntrezHandler, make_fetcher
+from genbank_cache import GenBankCache
+
+
+@pytest.fixture
+def rd():
+    return fakeredis.FakeRedis()
+
+
+def efetch_ids():
+    return [params['id'] for path, params in FakeEntrezHandler.requests_seen if path == '/efetch.fcgi']
+
+
+def test_second_run_is_served_from_redis(entrez_server, rd):
+    first = GenBankCache(make_fetcher(entrez_server, batch_size=2), rd)
+    assert first.update('Arabidopsis thaliana') == ACCESSIONS
+    assert efetch_ids() == ['XP_000001.1,XP_000002.1', 'XP_000003.1,XP_000004.1', 'XP_000005.1']
+    assert first.metrics()['record_hit_ratio'] == 0.0
+
+    FakeEntrezHandler.requests_seen = []
+    second = GenBankCache(make_fetcher(entrez_server, batch_size=2), rd)
+    assert second.update('Arabidopsis thaliana') == ACCESSIONS
+    assert FakeEntrezHandler.requests_seen == []
+    metrics = second.metrics()
+    assert metrics['search_hits'] == 1 and metrics['record_hit_ratio'] == 1.0
+    # One esearch and three efetch batches
+    assert metrics['requests_avoided'] == 4
+    assert [entry['ID'] for entry in record_store.read_records(rd, ACCESSIONS)] == ACCESSIONS
+
+
+def test_only_missing_and_expired_records_are_fetched(entrez_server, rd):
+    GenBankCache(make_fetcher(entrez_server), rd).update('Arabidopsis thaliana')
+    rd.delete('XP_000002.1')
+    rd.zadd(record_store.FETCHED_KEY, {'XP_000004.1': 0})
+
+    FakeEntrezHandler.requests_seen = []
+    cache = GenBankCache(make_fetcher(entrez_server), rd, record_format='compact')
+    assert cache.update('Arabidopsis thaliana') == ACCESSIONS
+    assert efetch_ids() == ['XP_000002.1,XP_000004.1']
+    assert cache.metrics()['record_hits'] == 3
+    assert rd.type('XP_000004.1') == b'hash'
+
+
+def test_expired_search_is_sent_again(entrez_server, rd):
+    GenBankCache(make_fetcher(entrez_server), rd, search_ttl=0).update('Arabidopsis thaliana', max_records=3)
+    FakeEntrezHandler.requests_seen = []
+    cache = GenBankCache(make_fetcher(entrez_server), rd, search_ttl=0)
+    assert cache.update('Arabidopsis thaliana', max_records=3) == ACCESSIONS[:3]
+    assert [path for path, _ in FakeEntrezHandler.requests_seen] == ['/esearch.fcgi']
+    assert FakeEntrezHandler.requests_seen[0][1]['idtype'] == 'acc'
+    assert cache.metrics()['search_misses'] == 1
+
+
+def test_entries_stream_cached_and_fetched_records_in_search_order(entrez_server, rd):
+    GenBankCache(make_fetcher(entrez_server), rd).update('Arabidopsis thaliana')
+    rd.delete('XP_000002.1')
+
+    cache = GenBankCache(make_fetcher(entrez_server), rd)
+    entries = cache.entries('Arabidopsis thaliana')
+    assert next(entries)['ID'] == 'XP_000001.1'
+    assert [entry['ID'] for entry in entries] == ['XP_000002.1', 'XP_000003.1', 'XP_000004.1', 'XP_000005.1']
+    assert rd.exists('XP_000002.1')
+    assert cache.metrics()['record_misses'] == 1
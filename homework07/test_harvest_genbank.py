@@ -0,0 +1,53 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("Bio")
+fakeredis = pytest.importorskip("fakeredis")
+
+import record_store
+from conftest import ACCESSIONS, FakeEntrezHandler, make_fetcher
+from harvest_genbank import harvest
+
+
+def run_harvest(terms, fetcher, output_file, **kwargs):
+    async def run():
+        rd = fakeredis.FakeAsyncRedis(server=server)
+        # Threads stand in for the parse processes, the stub records are tiny
+        with ThreadPoolExecutor(max_workers=2) as parse_pool:
+            return await harvest(terms, fetcher, rd, parse_pool, str(output_file), **kwargs)
+
+    server = fakeredis.FakeServer()
+    timer = asyncio.run(run())
+    return timer, fakeredis.FakeRedis(server=server)
+
+
+def test_terms_are_harvested_concurrently_into_redis(entrez_server, tmp_path):
+    fetcher = make_fetcher(entrez_server, batch_size=2)
+    terms = [f'term {i}' for i in range(4)]
+    timer, rd = run_harvest(terms, fetcher, tmp_path / 'harvest.jsonl', concurrency=3, record_format='compact')
+
+    results = [json.loads(line) for line in open(tmp_path / 'harvest.jsonl')]
+    assert sorted(result['term'] for result in results) == terms
+    assert all(result['count'] == 5 and result['stored'] == 5 for result in results)
+    # Every term pages through its own history: one esearch and three efetch batches each
+    paths = [path for path, _ in FakeEntrezHandler.requests_seen]
+    assert paths.count('/esearch.fcgi') == 4 and paths.count('/efetch.fcgi') == 12
+    assert fetcher.metrics()['requests'] == 16
+
+    assert [entry['ID'] for entry in record_store.read_records(rd, ACCESSIONS)] == ACCESSIONS
+    summary = timer.summary()
+    assert summary['query']['count'] == 4 and summary['fetch']['count'] == 12
+    assert summary['store']['p50'] <= summary['store']['p95']
+
+
+def test_a_failed_term_does_not_stop_the_others(entrez_server, tmp_path):
+    fetcher = make_fetcher(entrez_server, max_tries=1)
+    timer, rd = run_harvest(['bad', 'Arabidopsis thaliana'], fetcher, tmp_path / 'harvest.jsonl', max_records=3)
+
+    results = {result['term']: result for result in map(json.loads, open(tmp_path / 'harvest.jsonl'))}
+    assert results['bad']['error'].startswith('RuntimeError')
+    assert results['Arabidopsis thaliana']['stored'] == 3
+    assert rd.exists(*ACCESSIONS) == 3
@@ -0,0 +1,32 @@
+import io
+import json
+
+from record_output import format_entry, write_entries
+
+ENTRY = {"ID": "XP_000001.1", "Name": "XP_000001", "Description": "test protein", "Sequence": "MKV" * 30}
+
+
+def test_txt_is_the_records_txt_layout():
+    assert format_entry(ENTRY) == (
+        "ID: XP_000001.1\nName: XP_000001\nDescription: test protein\nSequence: " + "MKV" * 30 + "\n\n"
+    )
+
+
+def test_jsonl_and_fasta():
+    assert json.loads(format_entry(ENTRY, "jsonl")) == ENTRY
+    assert format_entry(ENTRY, "fasta").splitlines() == [
+        ">XP_000001.1 test protein", "MKV" * 20, "MKV" * 10
+    ]
+
+
+def test_entries_are_written_as_they_are_generated():
+    out = io.StringIO()
+
+    def entries():
+        for i in range(3):
+            # Everything yielded before has already been written
+            assert out.getvalue().count("\n") == i
+            yield {**ENTRY, "ID": f"XP_{i}"}
+
+    assert write_entries(out, entries(), "jsonl") == 3
+    assert [json.loads(line)["ID"] for line in out.getvalue().splitlines()] == ["XP_0", "XP_1", "XP_2"]
@@ -0,0 +1,93 @@
+import pytest
+
+pytest.importorskip("Bio")
+fakeredis = pytest.importorskip("fakeredis")
+
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+
+import record_store
+from conftest import ACCESSIONS, make_fetcher
+from genbank_cache import GenBankCache
+from record_query import query_ids
+
+
+def protein(record_id, description, length, organism):
+    return SeqRecord(Seq("M" * length), id=record_id, name=record_id.split(".")[0], description=description,
+                     annotations={"organism": organism})
+
+
+@pytest.fixture
+def rd():
+    rd = fakeredis.FakeRedis()
+    record_store.write_records(rd, [
+        protein("A.1", "serine/threonine kinase [Arabidopsis thaliana]", 300, "Arabidopsis thaliana"),
+        protein("B.1", "Kinase domain protein [Arabidopsis thaliana]", 900, "Arabidopsis thaliana"),
+        protein("C.1", "histone H3", 136, "Homo sapiens"),
+    ], term="AT5G10140")
+    record_store.write_records(rd, [protein("D.1", "receptor kinase", 1200, "Homo sapiens")],
+                               record_format="compact", term="human kinases")
+    return rd
+
+
+def test_indexes_answer_every_filter(rd):
+    assert query_ids(rd, term="AT5G10140") == ["A.1", "B.1", "C.1"]
+    assert query_ids(rd, organism="homo SAPIENS") == ["C.1", "D.1"]
+    assert query_ids(rd, words=["kinase"]) == ["A.1", "B.1", "D.1"]
+    assert query_ids(rd, words=["kinase", "threonine"]) == ["A.1"]
+    assert query_ids(rd, min_length=500) == ["B.1", "D.1"]
+
+
+def test_term_and_length_are_combined_without_leaving_keys_behind(rd):
+    keys = set(rd.keys())
+    assert query_ids(rd, term="AT5G10140", min_length=200) == ["A.1", "B.1"]
+    assert query_ids(rd, words=["kinase"], min_length=200, max_length=1000) == ["A.1", "B.1"]
+    assert query_ids(rd, term="AT5G10140", words=["histone"], min_length=200) == []
+    assert set(rd.keys()) == keys
+
+
+def test_cached_records_are_indexed_under_every_term_that_finds_them(entrez_server, rd):
+    GenBankCache(make_fetcher(entrez_server), rd).update('Arabidopsis thaliana')
+    GenBankCache(make_fetcher(entrez_server), rd).update('another term', max_records=2)
+    assert query_ids(rd, term='arabidopsis thaliana') == ACCESSIONS
+    assert query_ids(rd, term='another term', min_length=10) == ACCESSIONS[:2]
+
+
+def test_metadata_of_json_records_is_read_with_one_mget_per_batch(rd, monkeypatch):
+    mgets = []
+    mget = rd.mget
+    monkeypatch.setattr(rd, "mget", lambda keys: mgets.append(keys) or mget(keys))
+    metadata = list(record_store.read_metadata(rd, ["A.1", "B.1", "C.1", "D.1"]))
+    assert [(entry["ID"], entry["Length"]) for entry in metadata] == [("A.1", 300), ("B.1", 900), ("C.1", 136), ("D.1", 1200)]
+    assert mgets == [["A.1", "B.1", "C.1"]]
+
+
+def test_restored_records_leave_the_sets_they_no_longer_belong_to(rd):
+    record_store.write_records(rd, [protein("A.1", "histone H4", 900, "Mus musculus")], term="mouse histones")
+    assert query_ids(rd, organism="Arabidopsis thaliana") == ["B.1"]
+    assert query_ids(rd, words=["kinase"]) == ["B.1", "D.1"]
+    assert query_ids(rd, organism="mus musculus", words=["histone"], min_length=500) == ["A.1"]
+    # Every term that found the record still finds it
+    assert query_ids(rd, term="AT5G10140") == ["A.1", "B.1", "C.1"]
+    assert query_ids(rd, term="mouse histones") == ["A.1"]
+
+
+def test_deleted_records_are_not_returned(rd):
+    rd.delete("B.1")
+    assert query_ids(rd, words=["kinase"]) == ["A.1", "D.1"]
+    assert record_store.delete_records(rd, ["A.1", "C.1"]) == 2
+    assert query_ids(rd, term="AT5G10140") == []
+    assert not rd.exists(record_store.token_key("threonine"), record_store.index_of_key("A.1"))
+    assert rd.zscore(record_store.LENGTH_KEY, "A.1") is None
+
+
+def test_common_words_are_not_indexed(rd):
+    assert not rd.exists(record_store.token_key("protein"))
+    assert query_ids(rd, words=["kinase", "protein"]) == ["B.1"]
+
+
+def test_words_without_an_index_set_still_filter(rd):
+    assert query_ids(rd, words=["protein"]) == ["B.1"]
+    assert query_ids(rd, words=["3"]) == []
+    assert query_ids(rd, words=["of"], min_length=100) == []
+    assert query_ids(rd, organism="Homo sapiens", words=["domain", "protein"]) == []
@@ -1,19 +1,34 @@
-import os
-from collections import Counter
-
 import dash_bio as dashbio
 import dash_bootstrap_components as dbc
 import plotly.express as px
-from Bio.PDB import PDBList, PDBParser, parse_pdb_header # type: ignore
-from dash import Dash, Input, Output, State, callback, ctx, dcc, html
-from dash_bio.utils import PdbParser as DashPdbParser
-from dash_bio.utils import create_mol3d_style
+from dash import Dash, Input, Output, State, callback, ctx, dcc, html, no_update
+
+from pdb_downloader import PDBDownloadManager
+from structure_loader import (
+    COLOR_ELEMENT, LOD_MODE, VISUALIZATION_TYPE, build_viewer_payload, select_chain
+)
+from viewer_cache import ViewerCache, cache_key
+
+# Prepared viewer payloads are shared between workers through Redis
+viewer_cache = ViewerCache()
+# Concurrent requests for the same PDB ID share a single download into the local mirror
+downloader = PDBDownloadManager()
 
 # Initialize the Dash app
 external_stylesheets = [dbc.themes.CERULEAN]
 app = Dash(__name__, external_stylesheets=external_stylesheets)
 server = app.server  # Expose the server instance for Gunicorn
 
+@server.route('/cache-stats')
+def cache_stats():
+    """Viewer cache hit/miss counters as JSON"""
+    return viewer_cache.stats()
+
+@server.route('/download-metrics')
+def download_metrics():
+    """PDB download queue depth and latency as JSON"""
+    return downloader.metrics()
+
 # App layout
 app.layout = dbc.Container([
     dbc.Row([
@@ -34,6 +49,21 @@ app.layout = dbc.Container([
                 dbc.Col(dbc.Button("Load Structure", id='load-button', color="primary"), width="auto"),
                 dbc.Col(dbc.Button("Reset", id='reset-button', color="danger"), width="auto"),
             ], className="g-2"),
+            dbc.Label("Level of Detail:", className="fw-bold mt-3"),
+            dbc.RadioItems(
+                id='lod-mode',
+                options=[
+                    {'label': 'Backbone trace', 'value': 'backbone'},
+                    {'label': 'Per-residue', 'value': 'residue'},
+                    {'label': 'Full atom', 'value': 'full'},
+                ],
+                value=LOD_MODE
+            ),
+            html.Div(id='chain-select-container', children=[
+                dbc.Label("Full-Atom Chain:", className="fw-bold mt-3"),
+                dcc.Dropdown(id='chain-select', options=[], placeholder='Select a chain')
+            ], style={'display': 'none'}),
+            dcc.Store(id='loaded-pdb-id'),
             html.Div(id='status-message', className="mt-3")
         ], width=2),
 
@@ -65,13 +95,18 @@ app.layout = dbc.Container([
     Output('header-info', 'children'),
     Output('amino-acid-histogram', 'figure'),
     Output('amino-acid-histogram', 'style'),
-    Output('status-message', 'children')],
+    Output('status-message', 'children'),
+    Output('chain-select', 'options'),
+    Output('chain-select', 'value'),
+    Output('chain-select-container', 'style'),
+    Output('loaded-pdb-id', 'data')],
     Input('load-button', 'n_clicks'),
     Input('reset-button', 'n_clicks'),
     State('pdb-input', 'value'),
+    State('lod-mode', 'value'),
     prevent_initial_call=True
 )
-def load_molecule(load_clicks, reset_clicks, pdb_id):
+def load_molecule(load_clicks, reset_clicks, pdb_id, lod_mode):
 
     if not pdb_id:
         return (
@@ -79,7 +114,8 @@ def load_molecule(load_clicks, reset_clicks, pdb_id):
             html.Div("Header information will appear here.", className="text-center text-muted mt-5"),
             {},
             {'display': 'none'},
-            dbc.Alert("Please enter a PDB ID.", color="warning")
+            dbc.Alert("Please enter a PDB ID.", color="warning"),
+            [], None, {'display': 'none'}, None
         )
 
     if ctx.triggered_id == 'reset-button':
@@ -88,39 +124,21 @@ def load_molecule(load_clicks, reset_clicks, pdb_id):
             html.Div("Header information will appear here.", className="text-center text-muted mt-5"),
             {},
             {'display': 'none'},
-            None
+            None,
+            [], None, {'display': 'none'}, None
         )
 
     try:
         # Clean up PDB ID (remove whitespace, convert to lowercase)
         pdb_id = pdb_id.strip().lower()
 
-        # Create PDB directory if it doesn't exist
-        pdb_dir = './pdb_files'
-        os.makedirs(pdb_dir, exist_ok=True)
-
-        # Download PDB file using BioPython
-        pdbl = PDBList()
-        pdb_file = pdbl.retrieve_pdb_file(pdb_id, pdir=pdb_dir, file_format='pdb')
-
-        # Read PDB file content for visualization
-        dash_parser = DashPdbParser(pdb_file) # type: ignore
-        pdb_data = dash_parser.mol3d_data()  # Get data in format suitable for Molecule3dViewer
-        # create styles for visualization needed by Molecule3dViewer
-        # atoms is a list of dictionaries obtained from parsing the PDB file with DashPdbParser
-        # visualization_type can be 'cartoon', 'stick', 'sphere'
-        # color_element can be 'residue', 'chain', 'element', 'partialCharge'
-        styles = create_mol3d_style(
-            pdb_data['atoms'], visualization_type='cartoon', color_element='residue'
-        )
-
-        # Parse PDB structure for amino acid analysis
-        bio_parser = PDBParser(QUIET=True)
-        structure = bio_parser.get_structure(pdb_id, pdb_file)
-        amino_acid_counts = count_amino_acids(structure)
-
-        # Parse PDB header information
-        header_info = parse_pdb_header(pdb_file)
+        # Serve the prepared payload from the cache, downloading and parsing only on a miss
+        payload = get_viewer_payload(pdb_id, lod_mode)
+        viewer_cache.record_request(pdb_id)
+        pdb_data = payload['pdb_data']  # Get data in format suitable for Molecule3dViewer
+        styles = payload['styles']
+        amino_acid_counts = payload['amino_acid_counts']
+        header_info = payload['header_info']
 
         # Create Molecule3dViewer component
         viewer = create_molecule_viewer(pdb_data, styles)
@@ -136,10 +154,24 @@ def load_molecule(load_clicks, reset_clicks, pdb_id):
             color="success"
         )
 
-        if not histogram:
-            return viewer, header_display, histogram, {'display': 'none'}, status
-        else:
-            return viewer, header_display, histogram, {'display': 'block'}, status
+        # Large structures are sent at reduced detail, with full-atom chains on demand
+        chain_options = []
+        chain_style = {'display': 'none'}
+        if payload['lod'] != 'full':
+            status = dbc.Alert(
+                f"Loaded PDB ID: {pdb_id.upper()} as a {payload['lod']} model "
+                f"({len(pdb_data['atoms'])} of {payload['n_atoms']} atoms). "
+                "Select a chain to view it at full-atom detail.",
+                color="info"
+            )
+            chain_options = [{'label': chain, 'value': chain} for chain in payload['chains']]
+            chain_style = {'display': 'block'}
+
+        histogram_style = {'display': 'block'} if histogram else {'display': 'none'}
+        return (
+            viewer, header_display, histogram, histogram_style, status,
+            chain_options, None, chain_style, pdb_id
+        )
 
     except Exception as e:
         error_msg = dbc.Alert(
@@ -154,7 +186,56 @@ def load_molecule(load_clicks, reset_clicks, pdb_id):
             "Header information will appear here.",
             className="text-center text-muted mt-5"
         )
-        return empty_viewer, empty_header, {}, {'display': 'none'}, error_msg
+        return (
+            empty_viewer, empty_header, {}, {'display': 'none'}, error_msg,
+            [], None, {'display': 'none'}, None
+        )
+
+# Callback to swap in a single chain at full-atom detail
+@callback(
+    [Output('molecule-viewer', 'children', allow_duplicate=True),
+    Output('status-message', 'children', allow_duplicate=True)],
+    Input('chain-select', 'value'),
+    State('loaded-pdb-id', 'data'),
+    prevent_initial_call=True
+)
+def load_chain(chain, pdb_id):
+    if not chain or not pdb_id:
+        return no_update, no_update
+
+    try:
+        payload = get_viewer_payload(pdb_id, 'full')
+        pdb_data, styles = select_chain(payload['pdb_data'], payload['styles'], chain)
+        status = dbc.Alert(
+            f"Showing chain {chain} of PDB ID: {pdb_id.upper()} at full-atom detail "
+            f"({len(pdb_data['atoms'])} atoms)",
+            color="success"
+        )
+        return create_molecule_viewer(pdb_data, styles), status
+    except Exception as e:
+        error_msg = dbc.Alert(
+            f"Error loading chain {chain} of PDB {pdb_id.upper()}: {str(e)}",
+            color="danger"
+        )
+        return no_update, error_msg
+
+def get_viewer_payload(pdb_id, lod_mode):
+    """Return the viewer payload for a PDB ID and level of detail, building it on a cache miss"""
+    key = cache_key(
+        pdb_id, visualization_type=VISUALIZATION_TYPE, color_element=COLOR_ELEMENT, lod=lod_mode
+    )
+    return viewer_cache.get_or_compute(key, lambda: prepare_viewer_payload(pdb_id, lod_mode))
+
+def prepare_viewer_payload(pdb_id, lod_mode):
+    """Download a PDB entry and build the cacheable viewer payload for it"""
+    # Download (or reuse) the compressed PDB file in the local mirror
+    pdb_file = downloader.fetch(pdb_id)
+
+    # Parse the PDB file once for the viewer payload, amino acid counts and header
+    return build_viewer_payload(
+        pdb_file, visualization_type=VISUALIZATION_TYPE, color_element=COLOR_ELEMENT,
+        lod_mode=lod_mode
+    )
 
 def create_molecule_viewer(pdb_data, styles):
     """Create a Molecule3dViewer from PDB data"""
@@ -247,28 +328,6 @@ def create_header_display(header_info, pdb_id):
     else:
         return html.Div("No header information available.", className="text-center text-muted mt-5")
 
-def count_amino_acids(structure):
-    """Count amino acid frequencies in a PDB structure"""
-    # Standard amino acids (3-letter codes)
-    standard_aa = {
-        'ALA', 'CYS', 'ASP', 'GLU', 'PHE', 'GLY', 'HIS', 'ILE', 'LYS', 'LEU',
-        'MET', 'ASN', 'PRO', 'GLN', 'ARG', 'SER', 'THR', 'VAL', 'TRP', 'TYR'
-    }
-
-    amino_acids = []
-
-    # Iterate through all residues in all chains
-    for model in structure:
-        for chain in model:
-            for residue in chain:
-                # Get residue name and check if it's a standard amino acid
-                res_name = residue.get_resname().strip()
-                if res_name in standard_aa:
-                    amino_acids.append(res_name)
-
-    # Count frequencies
-    return Counter(amino_acids)
-
 def create_amino_acid_histogram(amino_acid_counts, pdb_id):
     """Create a Plotly histogram of amino acid frequencies"""
     if not amino_acid_counts:
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+import argparse
+import statistics
+import time
+from collections import Counter
+
+from Bio.PDB import PDBParser, parse_pdb_header # type: ignore
+from dash_bio.utils import PdbParser as DashPdbParser
+from dash_bio.utils import create_mol3d_style
+from plotly.io.json import to_json_plotly
+
+from residue_table import STANDARD_AA, ResidueTable
+from structure_loader import (
+    build_viewer_payload, load_structure, read_pdb_text, reduce_level_of_detail
+)
+from viewer_cache import LocalLRUCache, ViewerCache, cache_key
+
+# -------------------------
+# Arg Parser
+# -------------------------
+parser = argparse.ArgumentParser(description='Benchmarks for the Molecular Structure Viewer')
+subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+parse_parser = subparsers.add_parser(
+    'parse',
+    help='Per-request latency of the single-pass loader vs. the three-parse path'
+)
+parse_parser.add_argument('pdb_files', nargs='+', help='Paths to PDB files to load')
+parse_parser.add_argument(
+    '-r', '--repeats',
+    type=int,
+    default=5,
+    help='Number of timed loads per file and path (default: 5)'
+)
+
+cache_parser = subparsers.add_parser(
+    'cache',
+    help='Latency of a cold viewer payload build vs. Redis and in-process cache hits'
+)
+cache_parser.add_argument('pdb_files', nargs='+', help='Paths to PDB files to load')
+cache_parser.add_argument(
+    '-r', '--repeats',
+    type=int,
+    default=5,
+    help='Number of timed cache reads per file and tier (default: 5)'
+)
+
+lod_parser = subparsers.add_parser(
+    'lod',
+    help='Callback response size and serialization time per level of detail'
+)
+lod_parser.add_argument('pdb_files', nargs='+', help='Paths to PDB files to load')
+lod_parser.add_argument(
+    '-r', '--repeats',
+    type=int,
+    default=5,
+    help='Number of timed serializations per file and level of detail (default: 5)'
+)
+
+composition_parser = subparsers.add_parser(
+    'composition',
+    help='Amino acid composition via Bio.PDB object walks vs. the columnar ResidueTable'
+)
+composition_parser.add_argument('pdb_files', nargs='+', help='Paths to (multi-model) PDB files')
+composition_parser.add_argument(
+    '-r', '--repeats',
+    type=int,
+    default=5,
+    help='Number of timed runs per file and engine (default: 5)'
+)
+
+
+# -------------------------
+# Functions
+# -------------------------
+def three_parse_load(pdb_file):
+    """The original load_molecule path: DashPdbParser, PDBParser and parse_pdb_header"""
+    pdb_data = DashPdbParser(pdb_file).mol3d_data()
+
+    structure = PDBParser(QUIET=True).get_structure('bench', pdb_file)
+    amino_acid_counts = walk_amino_acids(structure)
+
+    header_info = parse_pdb_header(pdb_file)
+    return {
+        'pdb_data': pdb_data,
+        'amino_acid_counts': amino_acid_counts,
+        'header_info': header_info,
+    }
+
+def walk_amino_acids(structure):
+    """The original count_amino_acids: walk every model/chain/residue object"""
+    amino_acids = []
+    for model in structure:
+        for chain in model:
+            for residue in chain:
+                res_name = residue.get_resname().strip()
+                if res_name in STANDARD_AA:
+                    amino_acids.append(res_name)
+    return Counter(amino_acids)
+
+def time_call(func, arg, repeats):
+    """Return the per-call wall times (ms) of func(arg) over a number of repeats"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(arg)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def run_parse_benchmark(pdb_files, repeats):
+    """Print median/mean latency per file for both loading paths"""
+    print(f"{'file':<30} {'atoms':>8} {'3-parse ms':>12} {'1-parse ms':>12} {'speedup':>8}")
+    for pdb_file in pdb_files:
+        single = load_structure(pdb_file)
+        legacy = three_parse_load(pdb_file)
+        if single['amino_acid_counts'] != legacy['amino_acid_counts']:
+            print(f"warning: residue composition differs for {pdb_file}")
+
+        legacy_ms = statistics.median(time_call(three_parse_load, pdb_file, repeats))
+        single_ms = statistics.median(time_call(load_structure, pdb_file, repeats))
+        n_atoms = len(single['pdb_data']['atoms'])
+        print(
+            f"{pdb_file:<30} {n_atoms:>8} {legacy_ms:>12.1f} {single_ms:>12.1f} "
+            f"{legacy_ms / single_ms:>7.2f}x"
+        )
+
+def run_cache_benchmark(pdb_files, repeats):
+    """Print the cold build time and cache hit latency of each tier per file"""
+    cache = ViewerCache()
+    print(f"{'file':<30} {'cold ms':>10} {'redis hit ms':>13} {'local hit ms':>13}")
+    for pdb_file in pdb_files:
+        key = cache_key(pdb_file, benchmark=True)
+
+        start = time.perf_counter()
+        payload = build_viewer_payload(pdb_file)
+        cold_ms = (time.perf_counter() - start) * 1000
+        cache.set(key, payload)
+
+        def redis_hit(key):
+            # Empty the in-process tier so every read goes to Redis
+            cache.local = LocalLRUCache(max_entries=cache.local.max_entries, ttl=cache.ttl)
+            return cache.get(key)
+
+        redis_ms = statistics.median(time_call(redis_hit, key, repeats))
+        cache.set(key, payload)
+        local_ms = statistics.median(time_call(cache.get, key, repeats))
+        print(f"{pdb_file:<30} {cold_ms:>10.1f} {redis_ms:>13.2f} {local_ms:>13.3f}")
+    print(cache.stats())
+
+def run_lod_benchmark(pdb_files, repeats):
+    """Print the Molecule3dViewer response size and JSON serialization time per level of detail"""
+    print(f"{'file':<30} {'lod':<9} {'atoms':>8} {'response KB':>12} {'serialize ms':>13}")
+    for pdb_file in pdb_files:
+        full = load_structure(pdb_file)['pdb_data']
+        for mode in ('full', 'backbone', 'residue'):
+            pdb_data = full if mode == 'full' else reduce_level_of_detail(full, mode)
+            styles = create_mol3d_style(
+                pdb_data['atoms'], visualization_type='cartoon', color_element='residue'
+            )
+            # Dash serializes callback outputs with plotly's JSON encoder
+            response = {'modelData': pdb_data, 'styles': styles}
+            size_kb = len(to_json_plotly(response)) / 1024
+            serialize_ms = statistics.median(time_call(to_json_plotly, response, repeats))
+            print(
+                f"{pdb_file:<30} {mode:<9} {len(pdb_data['atoms']):>8} "
+                f"{size_kb:>12.1f} {serialize_ms:>13.1f}"
+            )
+
+def run_composition_benchmark(pdb_files, repeats):
+    """Print parse + count time of the Bio.PDB walk vs. the ResidueTable per file"""
+    print(
+        f"{'file':<30} {'models':>7} {'residues':>9} {'Bio parse+walk ms':>18} "
+        f"{'walk ms':>9} {'table build+count ms':>21} {'count ms':>9}"
+    )
+    for pdb_file in pdb_files:
+        text = read_pdb_text(pdb_file)
+        structure = PDBParser(QUIET=True).get_structure('bench', pdb_file)
+        table = ResidueTable.from_pdb_text(text)
+        if walk_amino_acids(structure) != table.residue_counts():
+            print(f"warning: residue composition differs for {pdb_file}")
+
+        def bio_path(pdb_file):
+            return walk_amino_acids(PDBParser(QUIET=True).get_structure('bench', pdb_file))
+
+        def table_path(text):
+            return ResidueTable.from_pdb_text(text).residue_counts()
+
+        bio_ms = statistics.median(time_call(bio_path, pdb_file, repeats))
+        walk_ms = statistics.median(time_call(walk_amino_acids, structure, repeats))
+        table_ms = statistics.median(time_call(table_path, text, repeats))
+        count_ms = statistics.median(time_call(ResidueTable.residue_counts, table, repeats))
+        print(
+            f"{pdb_file:<30} {len(structure):>7} {len(table):>9} {bio_ms:>18.1f} "
+            f"{walk_ms:>9.1f} {table_ms:>21.1f} {count_ms:>9.2f}"
+        )
+
+
+def main():
+    args = parser.parse_args()
+    if args.benchmark == 'parse':
+        run_parse_benchmark(args.pdb_files, args.repeats)
+    elif args.benchmark == 'cache':
+        run_cache_benchmark(args.pdb_files, args.repeats)
+    elif args.benchmark == 'lod':
+        run_lod_benchmark(args.pdb_files, args.repeats)
+    elif args.benchmark == 'composition':
+        run_composition_benchmark(args.pdb_files, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
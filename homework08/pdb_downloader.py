@@ -0,0 +1,157 @@
+import gzip
+import logging
+import os
+import re
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+RCSB_URL = 'https://files.rcsb.org/download'
+
+# -------------------------
+# Mirror configuration (overridable through the container environment)
+# -------------------------
+PDB_DIR = os.environ.get('PDB_DIR', './pdb_files')
+PDB_BASE_URL = os.environ.get('PDB_BASE_URL', RCSB_URL)
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', 4))
+
+PDB_ID_PATTERN = re.compile(r'^[0-9][a-z0-9]{3}$')
+GZIP_MAGIC = b'\x1f\x8b'
+CHUNK_SIZE = 64 * 1024
+LATENCY_WINDOW = 1000  # number of recent downloads kept for latency percentiles
+
+
+class PDBDownloadManager:
+    """
+    Deduplicating, bounded-concurrency PDB downloader backed by a local mirror.
+
+    Files are stored gzip compressed in a wwPDB style sharded layout
+    (`<mirror_dir>/hh/pdb1hho.ent.gz`, sharded on the middle two characters of
+    the ID). Each download is written to a temporary file in the shard directory
+    and atomically renamed into place, so readers never see a partial file even
+    when several processes share the mirror. Requests for an ID that is already
+    being downloaded are coalesced onto the same Future.
+    """
+
+    def __init__(self, mirror_dir=PDB_DIR, base_url=PDB_BASE_URL,
+                 max_workers=DOWNLOAD_WORKERS, timeout=30):
+        self.mirror_dir = mirror_dir
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pdb-download')
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._queued = 0
+        self._active = 0
+        self._counters = {'downloads': 0, 'failures': 0, 'coalesced': 0, 'mirror_hits': 0}
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def mirror_path(self, pdb_id):
+        """Path of an entry inside the sharded local mirror"""
+        pdb_id = normalize_pdb_id(pdb_id)
+        return os.path.join(self.mirror_dir, pdb_id[1:3], f'pdb{pdb_id}.ent.gz')
+
+    def submit(self, pdb_id):
+        """Return a Future resolving to the local mirror path of pdb_id"""
+        pdb_id = normalize_pdb_id(pdb_id)
+        path = self.mirror_path(pdb_id)
+
+        with self._lock:
+            if os.path.exists(path):
+                self._counters['mirror_hits'] += 1
+                future = Future()
+                future.set_result(path)
+                return future
+
+            future = self._in_flight.get(pdb_id)
+            if future is not None:
+                self._counters['coalesced'] += 1
+                return future
+
+            self._queued += 1
+            future = self._executor.submit(self._download, pdb_id, path)
+            self._in_flight[pdb_id] = future
+
+        future.add_done_callback(lambda _: self._finished(pdb_id))
+        return future
+
+    def fetch(self, pdb_id):
+        """Block until pdb_id is in the local mirror and return its path"""
+        return self.submit(pdb_id).result(timeout=self.timeout * 2)
+
+    def _finished(self, pdb_id):
+        with self._lock:
+            self._in_flight.pop(pdb_id, None)
+
+    def _download(self, pdb_id, path):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+
+        start = time.perf_counter()
+        url = f'{self.base_url}/{pdb_id.upper()}.pdb.gz'
+        logging.info(f"Downloading {url}")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+            try:
+                with urllib.request.urlopen(url, timeout=self.timeout) as response, \
+                        os.fdopen(fd, 'wb') as out:
+                    first_chunk = response.read(CHUNK_SIZE)
+                    if first_chunk.startswith(GZIP_MAGIC):
+                        out.write(first_chunk)
+                        shutil.copyfileobj(response, out, CHUNK_SIZE)
+                    else:
+                        # Server sent plain text, compress it for the mirror
+                        with gzip.GzipFile(fileobj=out, mode='wb') as gz:
+                            gz.write(first_chunk)
+                            shutil.copyfileobj(response, gz, CHUNK_SIZE)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        except Exception:
+            with self._lock:
+                self._counters['failures'] += 1
+            logging.error(f"Failed to download PDB {pdb_id} from {url}")
+            raise
+        else:
+            with self._lock:
+                self._counters['downloads'] += 1
+                self._latencies.append(time.perf_counter() - start)
+            return path
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def metrics(self):
+        """Queue depth, in-flight downloads, counters and download latency (seconds)"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            metrics = {
+                'queue_depth': self._queued,
+                'active_downloads': self._active,
+                **self._counters,
+            }
+        if latencies:
+            metrics['latency_mean'] = statistics.fmean(latencies)
+            metrics['latency_p50'] = latencies[len(latencies) // 2]
+            metrics['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return metrics
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def normalize_pdb_id(pdb_id):
+    """Lowercase and validate a 4 character PDB ID"""
+    pdb_id = pdb_id.strip().lower()
+    if not PDB_ID_PATTERN.match(pdb_id):
+        raise ValueError(f"Invalid PDB ID: {pdb_id!r}")
+    return pdb_id
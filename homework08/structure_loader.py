@@ -0,0 +1,231 @@
+import gzip
+import io
+import os
+
+import numpy as np
+from Bio.PDB import parse_pdb_header # type: ignore
+from dash_bio.utils import create_mol3d_style
+from parmed.formats import PDBFile
+
+# residue_table.py is kept once, in homework06, which is on the PYTHONPATH (see the Dockerfile)
+from residue_table import STANDARD_AA, ResidueTable
+
+# Default Molecule3dViewer styling used by the app (and by warmup when pre-building payloads)
+# visualization_type can be 'cartoon', 'stick', 'sphere'
+# color_element can be 'residue', 'chain', 'element', 'partialCharge'
+VISUALIZATION_TYPE = 'cartoon'
+COLOR_ELEMENT = 'residue'
+
+# Level of detail: above LOD_ATOM_THRESHOLD atoms cartoon views are sent as a
+# backbone trace ('backbone') or one pseudo-atom per residue ('residue');
+# 'full' always sends every atom
+LOD_ATOM_THRESHOLD = int(os.environ.get('LOD_ATOM_THRESHOLD', 50000))
+LOD_MODES = ('backbone', 'residue', 'full')
+LOD_MODE = 'backbone'
+BACKBONE_ATOMS = {'CA', 'P'}  # protein alpha carbons and nucleic acid phosphates
+# Residues whose CA/P atoms are traced, so calcium ions (atom CA of residue CA) and
+# ligand phosphorus atoms are left out of the backbone
+NUCLEOTIDES = {'A', 'C', 'G', 'U', 'I', 'DA', 'DC', 'DG', 'DT', 'DU', 'DI'}
+POLYMER_RESIDUES = STANDARD_AA | NUCLEOTIDES
+SOLVENT_RESIDUES = {'HOH', 'WAT', 'DOD'}
+
+# Header fields shown on the viewer's header card
+HEADER_CARD_FIELDS = (
+    'name', 'structure_method', 'release_date', 'deposition_date',
+    'resolution', 'journal_reference', 'keywords'
+)
+
+
+def read_pdb_text(pdb_file):
+    """Read a (optionally gzip compressed) PDB file into memory in one go"""
+    opener = gzip.open if str(pdb_file).endswith('.gz') else open
+    with opener(pdb_file, 'rt') as f:
+        return f.read()
+
+def load_structure(pdb_file):
+    """
+    Load everything the viewer needs from a single read of a PDB file.
+
+    The file is read from disk once and the in-memory text is handed to the
+    header parser (which stops at the first coordinate record) and to the
+    ParmEd structure parser. The mol3d payload and the columnar ResidueTable
+    for the residue composition of every model are both built from that one
+    ParmEd structure, so the coordinate section is only parsed once.
+
+    Returns a dict with 'pdb_data' (Molecule3dViewer modelData), 'amino_acid_counts'
+    (Counter of standard residue names) and 'header_info' (Bio.PDB header dict).
+    """
+    text = read_pdb_text(pdb_file)
+
+    header_info = parse_pdb_header(io.StringIO(text))
+    structure = PDBFile.parse(io.StringIO(text))
+
+    return {
+        'pdb_data': mol3d_data(structure),
+        'amino_acid_counts': residue_table(structure).residue_counts(),
+        'header_info': header_info,
+    }
+
+def residue_table(structure):
+    """
+    ResidueTable of a ParmEd structure, with one copy of its residues per model.
+
+    ParmEd keeps the atoms of the first model and only the coordinates of the
+    others, which have to list the same atoms. Residues are taken as ParmEd
+    grouped them, and it does not keep the ATOM/HETATM record type, so no
+    residue is marked hetero.
+    """
+    residues = structure.residues
+    n_atoms = [len(residue.atoms) for residue in residues]
+    n_models = len(structure.get_coordinates()) if structure.atoms else 1
+
+    def atom_column(values):
+        return np.tile(np.repeat(np.array(values), n_atoms), n_models)
+
+    return ResidueTable.from_atom_columns(
+        model=np.repeat(np.arange(1, n_models + 1), sum(n_atoms)),
+        chain=atom_column([residue.chain for residue in residues]),
+        resseq=atom_column([residue.idx for residue in residues]),
+        icode=atom_column([residue.insertion_code for residue in residues]),
+        resname=atom_column([residue.name for residue in residues]),
+        hetero=np.zeros(n_models * sum(n_atoms), dtype=bool),
+    )
+
+def build_viewer_payload(pdb_file, visualization_type=VISUALIZATION_TYPE,
+                         color_element=COLOR_ELEMENT, lod_mode=LOD_MODE):
+    """
+    Prepare everything load_molecule renders for a structure as a JSON-serializable dict:
+    'pdb_data', 'styles', 'header_info' (header card fields only), 'amino_acid_counts',
+    'lod' (the level of detail actually applied), 'n_atoms' (full atom count) and 'chains'.
+    """
+    structure_data = load_structure(pdb_file)
+    pdb_data = structure_data['pdb_data']
+    n_atoms = len(pdb_data['atoms'])
+    chains = sorted({atom['chain'] for atom in pdb_data['atoms']})
+
+    lod = 'full'
+    if visualization_type == 'cartoon' and lod_mode != 'full' and n_atoms > LOD_ATOM_THRESHOLD:
+        pdb_data = reduce_level_of_detail(pdb_data, lod_mode)
+        lod = lod_mode
+
+    # create styles for visualization needed by Molecule3dViewer
+    styles = create_mol3d_style(
+        pdb_data['atoms'], visualization_type=visualization_type, color_element=color_element
+    )
+    header_info = {
+        field: structure_data['header_info'][field]
+        for field in HEADER_CARD_FIELDS if field in structure_data['header_info']
+    }
+    return {
+        'pdb_data': pdb_data,
+        'styles': styles,
+        'header_info': header_info,
+        'amino_acid_counts': dict(structure_data['amino_acid_counts']),
+        'lod': lod,
+        'n_atoms': n_atoms,
+        'chains': chains,
+    }
+
+def mol3d_data(structure):
+    """Build Molecule3dViewer modelData from a ParmEd structure (same layout as DashPdbParser)"""
+    data = {'atoms': [], 'bonds': []}
+
+    for a in structure.atoms:
+        data['atoms'].append({
+            'serial': a.idx,
+            'name': a.name,
+            'elem': a.element_name,
+            'positions': [a.xx, a.xy, a.xz],
+            'mass_magnitude': a.mass,
+            'residue_index': a.residue.idx,
+            'residue_name': a.residue.name,
+            'chain': a.residue.chain,
+        })
+
+    for b in structure.bonds:
+        data['bonds'].append({
+            'atom1_index': b.atom1.idx,
+            'atom2_index': b.atom2.idx,
+            'bond_order': b.order
+        })
+
+    return data
+
+def reduce_level_of_detail(pdb_data, mode):
+    """
+    Shrink mol3d modelData for cartoon rendering of very large structures.
+
+    'backbone' keeps only the CA/P atoms of standard amino acids and nucleotides; 'residue' replaces each (non-solvent) residue
+    with one pseudo-atom at its centroid. Either way consecutive residues of a chain
+    are joined by trace bonds and atom serials are renumbered from 0.
+    """
+    if mode == 'backbone':
+        atoms = [
+            atom for atom in pdb_data['atoms']
+            if atom['name'] in BACKBONE_ATOMS and atom['residue_name'] in POLYMER_RESIDUES
+        ]
+    elif mode == 'residue':
+        atoms = coarse_grain_residues(pdb_data['atoms'])
+    else:
+        raise ValueError(f"Invalid level of detail: {mode}. Should be one of {LOD_MODES}")
+
+    atoms = [dict(atom, serial=index) for index, atom in enumerate(atoms)]
+    return {'atoms': atoms, 'bonds': trace_bonds(atoms)}
+
+def coarse_grain_residues(atoms):
+    """One pseudo-atom per residue at the residue centroid, named after its CA/P atom if present"""
+    residues = {}
+    for atom in atoms:
+        if atom['residue_name'] in SOLVENT_RESIDUES:
+            continue
+        residues.setdefault((atom['chain'], atom['residue_index']), []).append(atom)
+
+    coarse = []
+    for members in residues.values():
+        first = members[0]
+        names = {atom['name'] for atom in members}
+        coarse.append({
+            'serial': first['serial'],
+            'name': next((name for name in ('CA', 'P') if name in names), first['name']),
+            'elem': first['elem'],
+            'positions': [
+                sum(atom['positions'][axis] for atom in members) / len(members)
+                for axis in range(3)
+            ],
+            'mass_magnitude': sum(atom['mass_magnitude'] for atom in members),
+            'residue_index': first['residue_index'],
+            'residue_name': first['residue_name'],
+            'chain': first['chain'],
+        })
+    return coarse
+
+def trace_bonds(atoms):
+    """Bonds between consecutive atoms that belong to sequence-adjacent residues of one chain"""
+    bonds = []
+    for previous, current in zip(atoms, atoms[1:]):
+        if (previous['chain'] == current['chain']
+                and current['residue_index'] - previous['residue_index'] == 1):
+            bonds.append({
+                'atom1_index': previous['serial'],
+                'atom2_index': current['serial'],
+                'bond_order': 1
+            })
+    return bonds
+
+def select_chain(pdb_data, styles, chain):
+    """Full-atom modelData and styles for a single chain, with serials and bonds renumbered"""
+    new_index = {}
+    atoms = []
+    chain_styles = []
+    for atom, style in zip(pdb_data['atoms'], styles):
+        if atom['chain'] == chain:
+            new_index[atom['serial']] = len(atoms)
+            atoms.append(dict(atom, serial=len(atoms)))
+            chain_styles.append(style)
+
+    bonds = [
+        dict(bond, atom1_index=new_index[bond['atom1_index']], atom2_index=new_index[bond['atom2_index']])
+        for bond in pdb_data['bonds']
+        if bond['atom1_index'] in new_index and bond['atom2_index'] in new_index
+    ]
+    return {'atoms': atoms, 'bonds': bonds}, chain_styles
@@ -0,0 +1,80 @@
+import gzip
+import http.server
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+
+import pytest
+
+from pdb_downloader import PDBDownloadManager
+
+PDB_TEXT = b"HEADER    TEST ENTRY\nATOM      1  CA  GLY A   1       0.000   0.000   0.000  1.00  0.00           C\nEND\n"
+
+
+class FakeRCSBHandler(http.server.BaseHTTPRequestHandler):
+    """Serves /<ID>.pdb.gz for known IDs after a short delay and counts the requests"""
+    requests_seen = []
+
+    def do_GET(self):
+        FakeRCSBHandler.requests_seen.append(self.path)
+        time.sleep(0.2)
+        if self.path != '/1ABC.pdb.gz':
+            self.send_error(404)
+            return
+        body = gzip.compress(PDB_TEXT)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def rcsb_server():
+    FakeRCSBHandler.requests_seen = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeRCSBHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def test_fetch_stores_compressed_file_in_shard(rcsb_server, tmp_path):
+    manager = PDBDownloadManager(str(tmp_path), base_url=rcsb_server)
+    path = manager.fetch('1ABC')
+    assert path == os.path.join(str(tmp_path), 'ab', 'pdb1abc.ent.gz')
+    with gzip.open(path, 'rb') as f:
+        assert f.read() == PDB_TEXT
+    assert not [name for name in os.listdir(tmp_path / 'ab') if name.endswith('.part')]
+
+
+def test_concurrent_requests_are_coalesced(rcsb_server, tmp_path):
+    manager = PDBDownloadManager(str(tmp_path), base_url=rcsb_server)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        paths = list(pool.map(manager.fetch, ['1abc'] * 8))
+    assert len(set(paths)) == 1
+    assert FakeRCSBHandler.requests_seen == ['/1ABC.pdb.gz']
+
+    metrics = manager.metrics()
+    assert metrics['downloads'] == 1
+    assert metrics['coalesced'] + metrics['mirror_hits'] == 7
+    assert metrics['queue_depth'] == 0
+    assert metrics['latency_p50'] > 0
+
+
+def test_missing_entry_raises_and_leaves_no_partial_file(rcsb_server, tmp_path):
+    manager = PDBDownloadManager(str(tmp_path), base_url=rcsb_server)
+    with pytest.raises(HTTPError):
+        manager.fetch('9zzz')
+    assert os.listdir(tmp_path / 'zz') == []
+    assert manager.metrics()['failures'] == 1
+
+
+def test_invalid_pdb_id_is_rejected(tmp_path):
+    manager = PDBDownloadManager(str(tmp_path))
+    with pytest.raises(ValueError):
+        manager.fetch('../etc/passwd')
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import redis
+
+# -------------------------
+# Cache configuration (overridable through the container environment)
+# -------------------------
+REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+REDIS_DB = int(os.environ.get('REDIS_DB', 0))
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 7 * 24 * 3600))  # seconds
+LOCAL_CACHE_SIZE = int(os.environ.get('LOCAL_CACHE_SIZE', 32))  # entries per worker
+REDIS_RETRY_INTERVAL = 30  # seconds to wait before retrying an unreachable Redis
+
+# Bump when the layout of the cached payload changes so stale entries are ignored
+CACHE_VERSION = 2
+KEY_PREFIX = 'viewer:payload:'
+STATS_KEY = 'viewer:stats'
+HISTORY_KEY = 'viewer:history'
+
+
+def cache_key(pdb_id, **options):
+    """Content-addressed key for a prepared viewer payload (PDB ID + visualization options)"""
+    key_data = json.dumps(
+        {'pdb_id': pdb_id.strip().lower(), 'version': CACHE_VERSION, **options},
+        sort_keys=True
+    )
+    return KEY_PREFIX + hashlib.sha256(key_data.encode('utf-8')).hexdigest()
+
+def encode_payload(payload):
+    """Serialize a payload dict to compressed JSON bytes"""
+    return zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+
+def decode_payload(blob):
+    """Inverse of encode_payload"""
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class LocalLRUCache:
+    """Small in-process LRU cache with per-entry expiry, used in front of and instead of Redis"""
+
+    def __init__(self, max_entries=LOCAL_CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ViewerCache:
+    """
+    Two-tier cache for prepared Molecule3dViewer payloads.
+
+    Redis is the shared tier, so every worker process sees entries computed by
+    the others; entries expire after `ttl` seconds and Redis evicts the least
+    recently used keys once it reaches its maxmemory limit. A LocalLRUCache sits
+    in front of Redis for the hottest entries and keeps serving when Redis is
+    unreachable.
+    """
+
+    def __init__(self, host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB,
+                 ttl=CACHE_TTL, local_size=LOCAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.local = LocalLRUCache(max_entries=local_size, ttl=ttl)
+        self.rd = redis.Redis(
+            host=host, port=port, db=db,
+            socket_connect_timeout=1, socket_timeout=2
+        )
+        self.hits = 0
+        self.misses = 0
+        self._redis_down_until = 0.0
+
+    def _redis_available(self):
+        return time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, e):
+        logging.warning(f"Redis cache unavailable, using in-process cache only: {e}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_INTERVAL
+
+    def _count(self, field):
+        if field == 'hits':
+            self.hits += 1
+        else:
+            self.misses += 1
+        if self._redis_available():
+            try:
+                self.rd.hincrby(STATS_KEY, field, 1)
+            except redis.exceptions.RedisError as e:
+                self._redis_failed(e)
+
+    def get(self, key):
+        """Return the cached payload for key, or None on a miss"""
+        payload = self.local.get(key)
+        if payload is None and self._redis_available():
+            try:
+                blob = self.rd.get(key)
+            except redis.exceptions.RedisError as e:
+                self._redis_failed(e)
+                blob = None
+            if blob is not None:
+                payload = decode_payload(blob)
+                self.local.set(key, payload)
+
+        self._count('hits' if payload is not None else 'misses')
+        return payload
+
+    def set(self, key, payload):
+        """Store a payload in both tiers"""
+        self.local.set(key, payload)
+        if self._redis_available():
+            try:
+                self.rd.set(key, encode_payload(payload), ex=self.ttl)
+            except redis.exceptions.RedisError as e:
+                self._redis_failed(e)
+
+    def contains(self, key):
+        """True if key is cached in either tier (does not count as a hit or miss)"""
+        if self.local.get(key) is not None:
+            return True
+        if self._redis_available():
+            try:
+                return bool(self.rd.exists(key))
+            except redis.exceptions.RedisError as e:
+                self._redis_failed(e)
+        return False
+
+    def get_or_compute(self, key, compute):
+        """Return the cached payload for key, computing and storing it on a miss"""
+        payload = self.get(key)
+        if payload is None:
+            payload = compute()
+            self.set(key, payload)
+        return payload
+
+    def record_request(self, pdb_id):
+        """Count a successful load of pdb_id in the shared request history used by warmup"""
+        if self._redis_available():
+            try:
+                self.rd.zincrby(HISTORY_KEY, 1, pdb_id.strip().lower())
+            except redis.exceptions.RedisError as e:
+                self._redis_failed(e)
+
+    def popular_ids(self, n):
+        """The n most requested PDB IDs from the shared request history"""
+        if not self._redis_available():
+            return []
+        try:
+            return [pdb_id.decode('utf-8') for pdb_id in self.rd.zrevrange(HISTORY_KEY, 0, n - 1)]
+        except redis.exceptions.RedisError as e:
+            self._redis_failed(e)
+            return []
+
+    def stats(self):
+        """Hit/miss counters for this process and, when reachable, across all workers"""
+        stats = {
+            'local_hits': self.hits,
+            'local_misses': self.misses,
+            'local_entries': len(self.local),
+        }
+        if self._redis_available():
+            try:
+                shared = self.rd.hgetall(STATS_KEY)
+                stats['shared_hits'] = int(shared.get(b'hits', 0))
+                stats['shared_misses'] = int(shared.get(b'misses', 0))
+            except redis.exceptions.RedisError as e:
+                self._redis_failed(e)
+        return stats
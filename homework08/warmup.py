@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import socket
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pdb_downloader import PDBDownloadManager
+from structure_loader import COLOR_ELEMENT, LOD_MODE, VISUALIZATION_TYPE, build_viewer_payload
+from viewer_cache import ViewerCache, cache_key
+
+# -------------------------
+# Arg Parser
+# -------------------------
+parser = argparse.ArgumentParser(
+    description='Pre-downloads and pre-processes PDB entries into the viewer cache'
+)
+parser.add_argument(
+    '-l', '--loglevel',
+    required=False,
+    choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+    default='WARNING',
+    help='Set the logging level (default: WARNING)'
+)
+parser.add_argument(
+    '-f', '--idfile',
+    type=str,
+    help='A file of PDB IDs to warm, one per line (# starts a comment)'
+)
+parser.add_argument(
+    '--history',
+    type=int,
+    default=0,
+    help='Also warm the N most requested PDB IDs from the recorded request history (default: 0)'
+)
+parser.add_argument(
+    '-w', '--workers',
+    type=int,
+    default=4,
+    help='Number of worker processes (default: 4)'
+)
+parser.add_argument(
+    '-i', '--interval',
+    type=int,
+    default=0,
+    help='Repeat the warmup every INTERVAL seconds; 0 runs it once (default: 0)'
+)
+parser.add_argument(
+    '--force',
+    action='store_true',
+    help='Rebuild entries that are already cached'
+)
+
+format_string = (
+    f'[%(asctime)s {socket.gethostname()}] '
+    '%(module)s.%(funcName)s:%(lineno)s - %(levelname)s - %(message)s'
+)
+
+# Per-process downloader and cache, created by init_worker in each pool process
+worker_downloader = None
+worker_cache = None
+
+
+# -------------------------
+# Functions
+# -------------------------
+def read_id_file(id_file: str) -> list[str]:
+    """
+    Reads PDB IDs from a text file with one ID per line
+
+    Args:
+        id_file: The path to the ID file, blank lines and text after `#` are ignored
+
+    Returns:
+        pdb_ids: The PDB IDs in file order
+    """
+    pdb_ids = []
+    try:
+        with open(id_file, "r") as f:
+            for line in f:
+                pdb_id = line.split("#", 1)[0].strip()
+                if pdb_id:
+                    pdb_ids.append(pdb_id.lower())
+    except FileNotFoundError:
+        logging.error(f"Could not read {id_file}, terminating program.")
+        sys.exit(1)
+    logging.info(f"Read {len(pdb_ids)} PDB IDs from {id_file}")
+    return pdb_ids
+
+
+def collect_ids(id_file: str, history: int, cache: ViewerCache) -> list[str]:
+    """
+    Combines the IDs from the ID file and the request history, dropping duplicates
+
+    Args:
+        id_file: The path to an ID file, or None
+        history: The number of most requested IDs to take from the request history
+        cache: The viewer cache holding the request history
+
+    Returns:
+        pdb_ids: The unique PDB IDs to warm, file IDs first
+    """
+    pdb_ids = read_id_file(id_file) if id_file else []
+    if history > 0:
+        popular = cache.popular_ids(history)
+        logging.info(f"Found {len(popular)} IDs in the request history")
+        pdb_ids.extend(popular)
+    return list(dict.fromkeys(pdb_ids))
+
+
+def init_worker():
+    """Creates the downloader and cache connection used by one pool process"""
+    global worker_downloader, worker_cache
+    worker_downloader = PDBDownloadManager(max_workers=1)
+    worker_cache = ViewerCache()
+
+
+def warm_entry(pdb_id: str, force: bool) -> tuple[str, str, float]:
+    """
+    Downloads and builds the viewer payload for one PDB ID and stores it in the cache
+
+    Args:
+        pdb_id: The PDB ID to warm
+        force: Rebuild the payload even if it is already cached
+
+    Returns:
+        result: (pdb_id, status, seconds) where status is "warmed", "cached" or an error message
+    """
+    start = time.perf_counter()
+    key = cache_key(
+        pdb_id, visualization_type=VISUALIZATION_TYPE, color_element=COLOR_ELEMENT, lod=LOD_MODE
+    )
+    if not force and worker_cache.contains(key):
+        return pdb_id, "cached", time.perf_counter() - start
+    try:
+        pdb_file = worker_downloader.fetch(pdb_id)
+        payload = build_viewer_payload(pdb_file)
+        worker_cache.set(key, payload)
+        return pdb_id, "warmed", time.perf_counter() - start
+    except Exception as e:
+        return pdb_id, f"error: {e}", time.perf_counter() - start
+
+
+def run_warmup(pdb_ids: list[str], workers: int, force: bool) -> dict:
+    """
+    Warms every PDB ID in a process pool and reports throughput
+
+    Args:
+        pdb_ids: The PDB IDs to warm
+        workers: The number of worker processes
+        force: Rebuild payloads that are already cached
+
+    Returns:
+        report: Counts of warmed, already cached and failed IDs, elapsed seconds
+                and throughput in structures/sec
+    """
+    report = {"warmed": 0, "cached": 0, "failed": 0}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [pool.submit(warm_entry, pdb_id, force) for pdb_id in pdb_ids]
+        for future in as_completed(futures):
+            pdb_id, status, seconds = future.result()
+            if status in ("warmed", "cached"):
+                report[status] += 1
+                logging.info(f"{pdb_id}: {status} in {seconds:.2f}s")
+            else:
+                report["failed"] += 1
+                logging.warning(f"{pdb_id}: {status}")
+    report["seconds"] = time.perf_counter() - start
+    report["structures_per_sec"] = len(pdb_ids) / report["seconds"] if report["seconds"] else 0.0
+    return report
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=args.loglevel, format=format_string)
+    if not args.idfile and args.history <= 0:
+        parser.error("give an --idfile and/or --history N")
+
+    cache = ViewerCache()
+    while True:
+        pdb_ids = collect_ids(args.idfile, args.history, cache)
+        logging.info(f"Warming {len(pdb_ids)} PDB entries with {args.workers} workers")
+        report = run_warmup(pdb_ids, args.workers, args.force)
+        print(
+            f"Warmed {report['warmed']}, already cached {report['cached']}, "
+            f"failed {report['failed']} of {len(pdb_ids)} entries in {report['seconds']:.1f}s "
+            f"({report['structures_per_sec']:.2f} structures/sec)",
+            flush=True
+        )
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
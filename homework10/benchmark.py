@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.datasets import load_breast_cancer
+
+from inference import CHUNK_SIZE, import_models, make_batch_predictions, make_preditions, predict_batch
+
+# -------------------------
+# Arg Parser
+# -------------------------
+parser = argparse.ArgumentParser(description="Rows/sec of batch inference vs. the per-row prediction loop")
+parser.add_argument(
+    "-m", "--models",
+    required=True,
+    nargs="+",
+    help="The paths to the model .pkl files"
+)
+parser.add_argument(
+    "-n", "--rows",
+    type=int,
+    default=1000000,
+    help="The number of synthetic rows batch inference predicts (default: 1000000)"
+)
+parser.add_argument(
+    "--loop-rows",
+    type=int,
+    default=2000,
+    help="The number of rows the per-row loop predicts, its rows/sec does not depend on the total (default: 2000)"
+)
+parser.add_argument(
+    "-c", "--chunk-size",
+    type=int,
+    default=CHUNK_SIZE,
+    help=f"The rows per chunk of batch inference (default: {CHUNK_SIZE})"
+)
+
+
+# -------------------------
+# Functions
+# -------------------------
+def synthetic_rows(num_rows: int)-> pd.DataFrame:
+    """Breast cancer dataset rows drawn at random with 1% noise, under the dataset's column names"""
+    data = load_breast_cancer()
+    rng = np.random.default_rng(0)
+    X = data.data[rng.integers(0, len(data.data), num_rows)]
+    X *= rng.normal(1.0, 0.01, X.shape)
+    return pd.DataFrame(X, columns=data.feature_names)
+
+
+def timed(function, *args)-> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def per_row(pipelines: list[tuple], sample_data: pd.DataFrame):
+    """The loop of inference.py without -o, its printing sent to /dev/null"""
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        make_preditions(pipelines, sample_data)
+
+
+def in_chunks(pipelines: list[tuple], sample_data: pd.DataFrame, chunk_size: int):
+    for start in range(0, len(sample_data), chunk_size):
+        predict_batch(pipelines, sample_data.iloc[start:start + chunk_size])
+
+
+def main():
+    args = parser.parse_args()
+    pipelines = import_models(args.models)
+    sample_data = synthetic_rows(args.rows)
+    loop_rows = min(args.loop_rows, args.rows)
+
+    rows = [
+        ("per-row loop", loop_rows, timed(per_row, pipelines, sample_data.iloc[:loop_rows])),
+        (f"batch, chunks of {args.chunk_size}", args.rows, timed(in_chunks, pipelines, sample_data, args.chunk_size)),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        input_csv = os.path.join(tmp, "rows.csv")
+        sample_data.to_csv(input_csv, index=False)
+        rows.append((
+            "batch, CSV in and out", args.rows,
+            timed(make_batch_predictions, pipelines, input_csv, os.path.join(tmp, "predictions.csv"), args.chunk_size)
+        ))
+
+    print(f"{len(pipelines)} models")
+    print("| path | rows | seconds | rows/sec |")
+    print("| ---: | ---: | ---: | ---: |")
+    for name, num_rows, seconds in rows:
+        print(f"| {name} | {num_rows} | {seconds:.2f} | {num_rows / seconds:,.0f} |")
+
+
+if __name__ == "__main__":
+    main()
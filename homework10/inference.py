@@ -6,6 +6,8 @@ import pandas as pd
 import sys
 import pathlib as Path
 
+CHUNK_SIZE = 100000  # rows per pipeline call in batch mode
+
 # -------------------------
 # Arg Parser
 # -------------------------
@@ -22,7 +24,18 @@ arg_parser.add_argument(
     type=str,
     help="The path to the input CSV file of Sample Data rows" 
 )
-args = arg_parser.parse_args()
+arg_parser.add_argument(
+    "-o", "--output",
+    type=str,
+    help="Run batch inference and write each model's predictions and confidences as columns of this .csv or "
+         ".parquet file instead of printing every row"
+)
+arg_parser.add_argument(
+    "-c", "--chunk-size",
+    type=int,
+    default=CHUNK_SIZE,
+    help=f"The number of rows read and predicted at once in batch inference (default: {CHUNK_SIZE})"
+)
 
 
 # -------------------------
@@ -77,8 +90,125 @@ def predict_row(pipelines: list[tuple], row, index: int):
     print()
     
 
+def model_columns(pickle_names: list[str])-> list[str]:
+    """
+    The column name prefix of each model: its file name without the extension, or its path
+    without the extension when another model has the same file name
+    """
+    stems = [Path.Path(pickle_name).stem for pickle_name in pickle_names]
+    return [
+        stem if stems.count(stem) == 1 else str(Path.Path(pickle_name).with_suffix(""))
+        for pickle_name, stem in zip(pickle_names, stems)
+    ]
+
+
+def predict_batch(pipelines: list[tuple], sample_data: pd.DataFrame)-> pd.DataFrame:
+    """
+    Runs every pipeline once over all rows of sample_data instead of once per row. A single
+    predict_proba call gives both the confidence and, through its argmax over classes_, the
+    prediction, which is the class predict would return
+
+    Args:
+        pipelines: A list of (name, pipeline) tuples from import_models()
+        sample_data: A DataFrame of sample rows
+
+    Returns:
+        results: A DataFrame with the index of sample_data and a <model>_prediction and
+            <model>_confidence column per model, "error" and NaN for a model that failed
+    """
+    # The models were trained on arrays without feature names
+    X = sample_data.to_numpy()
+    results = pd.DataFrame(index=sample_data.index)
+    for (name, pipeline), column in zip(pipelines, model_columns([name for name, _ in pipelines])):
+        try:
+            probs = pipeline.predict_proba(X)
+            results[f"{column}_prediction"] = pipeline.classes_[probs.argmax(axis=1)]
+            results[f"{column}_confidence"] = probs.max(axis=1)
+        except Exception as e:
+            print(f"{name} could not make predictions: {e}")
+            results[f"{column}_prediction"] = "error"
+            results[f"{column}_confidence"] = float("nan")
+    return results
+
+
+def read_chunks(sample_data_path, chunk_size: int):
+    """Yields the rows of the sample data CSV file chunk_size at a time, exiting if it cannot be read"""
+    try:
+        yield from pd.read_csv(sample_data_path, chunksize=chunk_size)
+    except Exception as e:
+        print(f"Could not load sample data: {e}")
+        sys.exit(1)
+
+
+def make_batch_predictions(pipelines: list[tuple], sample_data: str, output: str, chunk_size=CHUNK_SIZE)-> int:
+    """
+    Reads the sample data chunk_size rows at a time, predicts every chunk with predict_batch()
+    and appends the results to a CSV file, or to a Parquet file when output ends in .parquet,
+    so only one chunk of rows and predictions is held in memory
+
+    Args:
+        pipelines: A list of (name, pipeline) tuples from import_models()
+        sample_data: The path to the input CSV file of sample rows
+        output: The path to the output .csv or .parquet file
+        chunk_size: The number of rows predicted at once
+
+    Returns:
+        num_rows: The number of rows predicted
+    """
+    sample_data_path = Path.Path(sample_data)
+    if not sample_data_path.is_file():
+        print(f"Could not find file at {sample_data_path}")
+        sys.exit(1)
+    parquet = Path.Path(output).suffix == ".parquet"
+    if parquet:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            print(f"Could not write {output}, Parquet output needs pyarrow: {e}")
+            sys.exit(1)
+
+    num_rows = 0
+    written = False
+    writer = None
+    try:
+        for chunk in read_chunks(sample_data_path, chunk_size):
+            results = predict_batch(pipelines, chunk)
+            results.insert(0, "row", results.index + 1)
+            if parquet:
+                table = pyarrow.Table.from_pandas(results, preserve_index=False)
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(output, table.schema)
+                writer.write_table(table)
+            else:
+                results.to_csv(output, mode="a" if written else "w", header=not written, index=False)
+            num_rows += len(results)
+            written = True
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if not written:
+        # An empty input still gets an output file
+        results = pd.DataFrame(columns=["row"])
+        if parquet:
+            results.to_parquet(output, index=False)
+        else:
+            results.to_csv(output, index=False)
+    return num_rows
+
+
 def main():
+    args = arg_parser.parse_args()
+    if args.chunk_size < 1:
+        arg_parser.error("--chunk-size must be at least 1")
+    if len(set(args.models)) < len(args.models):
+        arg_parser.error("--models lists the same model more than once")
     pipelines = import_models(args.models)
+    if args.output:
+        num_rows = make_batch_predictions(pipelines, args.inputdata, args.output, args.chunk_size)
+        print(f"Wrote predictions for {num_rows} rows from {len(pipelines)} models to {args.output}")
+        return
     sample_data = load_sample_data(args.inputdata)
     make_preditions(pipelines, sample_data)
 